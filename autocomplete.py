@@ -1,44 +1,75 @@
-import csv
-import os
+import logging
+import time
 from typing import List
 
 import discord
 from discord import app_commands
 
+from blueprint_store import blueprint_cache, blueprint_namespace
+from io_executor import run_io
+from logging_setup import log_failure
+from metrics import instrument
 
+logger = logging.getLogger("litematica.autocomplete")
+
+
+@instrument("autocomplete")
 async def autocomplete_litematica_list(
     interaction: discord.Interaction,
     current: str
 ) -> List[app_commands.Choice[str]]:
-    # blueprintディレクトリのパスを取得
-    blueprint_dir = os.path.join(os.path.dirname(__file__), "blueprint")
-    
-    # ディレクトリが存在しない場合は作成
-    if not os.path.exists(blueprint_dir):
-        os.makedirs(blueprint_dir, exist_ok=True)
-        return [app_commands.Choice(name="フォルダが空です", value="empty")]
-    
     # ファイル一覧を取得
     try:
-        # すべてのCSVファイル名を拡張子なしで取得
-        files = [os.path.splitext(f)[0] for f in os.listdir(blueprint_dir) 
-                if f.endswith('.csv')]
+        # このサーバーの設計図名を取得（キャッシュ経由）
+        namespace = blueprint_namespace(interaction)
+        files = await run_io(blueprint_cache.titles, namespace)
         
         if not files:
             return [app_commands.Choice(name="CSVファイルが見つかりません", value="no_files")]
         
-        # 検索文字列でフィルタリング
-        choices = []
-        for file in files:
-            if current.lower() in file.lower():
-                choices.append(app_commands.Choice(name=file, value=file))
+        # 索引で検索（最大25個まで、Discord APIの制限）
+        return [app_commands.Choice(name=file, value=file)
+                for file in await run_io(blueprint_cache.search_titles, namespace, current, files)]
+        
+    except Exception as e:
+        log_failure(logger, "autocomplete_litematica_list", e)
+        return [app_commands.Choice(name=f"エラー: {str(e)}", value="error")]
+
+@instrument("autocomplete")
+async def autocomplete_litematica_lists(
+    interaction: discord.Interaction,
+    current: str
+) -> List[app_commands.Choice[str]]:
+    """
+    カンマ区切りで複数の設計図名を入力する場合に、最後の設計図名を自動補完する
+    """
+    try:
+        namespace = blueprint_namespace(interaction)
+        files = await run_io(blueprint_cache.titles, namespace)
         
-        # 最大25個まで（Discord APIの制限）
-        return choices[:25]
+        if not files:
+            return [app_commands.Choice(name="CSVファイルが見つかりません", value="no_files")]
+        
+        # 入力済みの設計図名はそのまま残し、最後の1つだけを検索する
+        *entered, last = current.split(",")
+        entered = [title.strip() for title in entered if title.strip()]
+        prefix = ",".join(entered + [""]) if entered else ""
+        
+        choices = []
+        for file in await run_io(blueprint_cache.search_titles, namespace, last.strip(), files):
+            if file in entered:
+                continue
+            value = prefix + file
+            # Discord APIの制限（100文字）を超える候補は出さない
+            if len(value) <= 100:
+                choices.append(app_commands.Choice(name=value, value=value))
+        return choices
         
     except Exception as e:
+        log_failure(logger, "autocomplete_litematica_lists", e)
         return [app_commands.Choice(name=f"エラー: {str(e)}", value="error")]
 
+@instrument("autocomplete")
 async def autocomplete_list_check(
     interaction: discord.Interaction,
     current: str
@@ -52,6 +83,28 @@ async def autocomplete_list_check(
     
     return choices
 
+@instrument("autocomplete")
+async def autocomplete_export_format(
+    interaction: discord.Interaction,
+    current: str
+) -> List[app_commands.Choice[str]]:
+    """
+    書き出す形式の選択肢を提供する
+    """
+    choices = []
+    options = [
+        {"name": "CSV", "value": "csv"},
+        {"name": "JSON", "value": "json"},
+        {"name": "材料リスト（litematicaの表形式）", "value": "txt"}
+    ]
+    
+    for option in options:
+        if current.lower() in option["name"].lower() or current.lower() in option["value"].lower():
+            choices.append(app_commands.Choice(name=option["name"], value=option["value"]))
+    
+    return choices
+
+@instrument("autocomplete")
 async def autocomplete_item_name(
     interaction: discord.Interaction,
     current: str
@@ -66,35 +119,20 @@ async def autocomplete_item_name(
         
         list_title = interaction.namespace.list_title
         
-        # CSVファイルのパス
-        blueprint_dir = os.path.join(os.path.dirname(__file__), "blueprint")
-        csv_file_path = os.path.join(blueprint_dir, f"{list_title}.csv")
-        
-        if not os.path.exists(csv_file_path):
+        # キャッシュの設計図を索引で検索（接頭辞一致・未完了を優先、最大25個まで）
+        # 索引の構築はI/Oスレッドで行い、イベントループを止めない
+        try:
+            rows = await run_io(blueprint_cache.search_items, blueprint_namespace(interaction), list_title, current)
+        except FileNotFoundError:
             return [app_commands.Choice(name=f"{list_title}.csvが見つかりません", value="not_found")]
         
-        # CSVファイルからアイテム名を検索
-        items = []
-        try:
-            with open(csv_file_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                next(reader)  # ヘッダー行をスキップ
-                
-                for row in reader:
-                    if len(row) >= 1:
-                        item_name = row[0]
-                        # 検索文字列でフィルタリング
-                        if current.lower() in item_name.lower():
-                            items.append(app_commands.Choice(name=item_name, value=item_name))
-                
-            # 最大25個まで（Discord APIの制限）
-            return items[:25]
-        except Exception as e:
-            return [app_commands.Choice(name=f"エラー: {str(e)}", value="error")]
+        return [app_commands.Choice(name=row[0], value=row[0]) for row in rows]
             
     except Exception as e:
+        log_failure(logger, "autocomplete_item_name", e)
         return [app_commands.Choice(name=f"エラー: {str(e)}", value="error")]
 
+@instrument("autocomplete")
 async def autocomplete_check_status(
     interaction: discord.Interaction,
     current: str
@@ -112,4 +150,34 @@ async def autocomplete_check_status(
         if current.lower() in option["name"].lower() or current.lower() in option["value"].lower():
             choices.append(app_commands.Choice(name=option["name"], value=option["value"]))
     
-    return choices
\ No newline at end of file
+    return choices
+
+@instrument("autocomplete")
+async def autocomplete_snapshot_version(
+    interaction: discord.Interaction,
+    current: int
+) -> List[app_commands.Choice[int]]:
+    """
+    指定された設計図の記録済みの版を新しい順に自動補完する
+    """
+    try:
+        if blueprint_cache.snapshots is None:
+            return []
+        if not interaction.namespace or not hasattr(interaction.namespace, 'list_title'):
+            return []
+        
+        list_title = interaction.namespace.list_title
+        history = await run_io(blueprint_cache.snapshots.history, blueprint_namespace(interaction), list_title, 25)
+        
+        choices = []
+        for snapshot in history:
+            if snapshot.deleted or (current and not str(snapshot.id).startswith(str(current))):
+                continue
+            created = time.strftime("%m/%d %H:%M", time.localtime(snapshot.created))
+            name = f"版 {snapshot.id}（{created} {snapshot.reason}・{snapshot.kinds_done}/{snapshot.rows}種類完了）"
+            choices.append(app_commands.Choice(name=name, value=snapshot.id))
+        return choices
+            
+    except Exception as e:
+        log_failure(logger, "autocomplete_snapshot_version", e)
+        return []
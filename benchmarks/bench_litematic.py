@@ -0,0 +1,30 @@
+"""
+.litematic の解析速度を計測する
+
+    python benchmarks/bench_litematic.py [一辺のブロック数 ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import litematic  # noqa: E402
+from synthetic import make_litematic  # noqa: E402
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [64, 128, 200]
+    print(f"numpy: {'あり' if litematic.np is not None else 'なし'}")
+    for edge in sizes:
+        data = make_litematic(edge, edge, edge)
+        started = time.perf_counter()
+        rows = litematic.parse_litematic(data)
+        elapsed = time.perf_counter() - started
+        blocks = edge ** 3
+        print(f"{blocks:>10,} ブロック  {len(data) / 1024 / 1024:6.1f} MiB  "
+              f"{elapsed:6.2f} 秒  {blocks / elapsed / 1e6:6.1f} Mブロック/秒  {len(rows)} 種類")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+ネットワークに接続せずにコマンドを実行するための discord.Interaction などの代用品
+"""
+import itertools
+import types
+
+_ids = itertools.count(1)
+
+
+class FakeAvatar:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+
+class FakeUser:
+    def __init__(self, user_id: int = 1, name: str = "benchmark"):
+        self.id = user_id
+        self.name = name
+        self.display_avatar = FakeAvatar()
+        self.guild_permissions = types.SimpleNamespace(administrator=True, manage_guild=True)
+
+
+class FakeMessage:
+    def __init__(self, interaction: "FakeInteraction", **kwargs):
+        self.interaction = interaction
+        self.id = next(_ids)
+        self.kwargs = kwargs
+
+    async def edit(self, **kwargs):
+        self.interaction.calls.append(("message.edit", kwargs))
+        self.kwargs.update(kwargs)
+        return self
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+
+    async def send(self, *args, **kwargs):
+        self.interaction.calls.append(("followup.send", kwargs))
+        return FakeMessage(self.interaction, **kwargs)
+
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def defer(self, **kwargs):
+        self._done = True
+        self.interaction.calls.append(("response.defer", kwargs))
+
+    async def send_message(self, *args, **kwargs):
+        self._done = True
+        self.interaction.calls.append(("response.send_message", kwargs))
+
+    async def edit_message(self, **kwargs):
+        self._done = True
+        self.interaction.calls.append(("response.edit_message", kwargs))
+
+
+class FakeInteraction:
+    """
+    コマンドのコールバックが使う属性だけを持つ discord.Interaction の代用品
+    """
+
+    def __init__(self, user: FakeUser = None, guild_id: int = 1, channel_id: int = 1, **namespace):
+        self.id = next(_ids)
+        self.user = user or FakeUser()
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.guild = None
+        self.client = None
+        self.command = None
+        self.namespace = types.SimpleNamespace(**namespace)
+        self.calls = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def original_response(self):
+        return FakeMessage(self)
+
+    async def edit_original_response(self, **kwargs):
+        self.calls.append(("edit_original_response", kwargs))
+        return FakeMessage(self, **kwargs)
+
+    def last_embed(self):
+        for _, kwargs in reversed(self.calls):
+            if "embed" in kwargs:
+                return kwargs["embed"]
+        return None
+
+
+class FakeAttachment:
+    def __init__(self, filename: str, data: bytes):
+        self.filename = filename
+        self.data = data
+        self.size = len(data)
+        self.url = f"https://cdn.discordapp.com/attachments/0/0/{filename}"
+
+    async def read(self, **kwargs) -> bytes:
+        return self.data
+
+    async def save(self, fp, **kwargs) -> int:
+        with open(fp, "wb") as f:
+            f.write(self.data)
+        return len(self.data)
@@ -0,0 +1,280 @@
+"""
+コマンドと自動補完のオフラインベンチマーク
+
+合成した材料リスト・設計図に対して litematica-add / list / check / delete と
+自動補完を偽の Interaction で実行し、p50/p99 レイテンシ・スループット・最大RSSをJSONで出力する。
+ネットワークには接続しない。
+
+    python benchmarks/run.py --rows 100,5000,50000 --blueprints 1,500,5000 --output result.json
+    python benchmarks/run.py --quick --baseline baseline.json   # 基準より遅ければ終了コード1
+
+エラー（❌のEmbed）になった操作が1件でもあれば、--baseline の有無にかかわらず終了コード1で終わる。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fakes import FakeAttachment, FakeInteraction  # noqa: E402
+from synthetic import item_names, make_material_list  # noqa: E402
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    # Linuxでは KiB、macOSでは バイト単位
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+def summarize(scenario, samples, errors, **params):
+    total = sum(samples)
+    return {
+        "scenario": scenario,
+        **params,
+        "iterations": len(samples),
+        "errors": errors,
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "mean_ms": total / len(samples) * 1000,
+        "throughput_ops": len(samples) / total if total > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def failed(interaction) -> bool:
+    embed = interaction.last_embed()
+    return embed is not None and (embed.title or "").startswith("❌")
+
+
+async def timed(samples, coro_factory):
+    started = time.perf_counter()
+    result = await coro_factory()
+    samples.append(time.perf_counter() - started)
+    return result
+
+
+class Benchmark:
+    def __init__(self, iterations: int, seed: int):
+        import discord
+        from discord.ext import commands
+
+        import autocomplete
+        import command
+        from blueprint_store import blueprint_cache, blueprint_namespace
+
+        self.iterations = iterations
+        self.rng = random.Random(seed)
+        self.autocomplete = autocomplete
+        self.cache = blueprint_cache
+        # 偽の Interaction と同じ名前空間に設計図を用意する
+        self.namespace = blueprint_namespace(FakeInteraction())
+
+        bot = commands.Bot(command_prefix="!", intents=discord.Intents.default())
+        command.setup(bot)
+        self.commands = {cmd.name: cmd.callback for cmd in bot.tree.get_commands()}
+
+    async def run_rows(self, rows: int):
+        results = []
+        title = f"bench-{rows}"
+        data = make_material_list(rows, seed=rows)
+        names = item_names(rows)
+
+        # litematica-add
+        samples, errors = [], 0
+        for _ in range(self.iterations):
+            interaction = FakeInteraction()
+            await timed(samples, lambda: self.commands["litematica-add"](
+                interaction, title, FakeAttachment("material_list.txt", data)))
+            errors += failed(interaction)
+        results.append(summarize("litematica-add", samples, errors, rows=rows, blueprints=1))
+
+        # litematica-list
+        samples, errors = [], 0
+        for i in range(self.iterations):
+            interaction = FakeInteraction()
+            check = ("all", "finished", "unfinished")[i % 3]
+            await timed(samples, lambda: self.commands["litematica-list"](interaction, title, check))
+            errors += failed(interaction)
+        results.append(summarize("litematica-list", samples, errors, rows=rows, blueprints=1))
+
+        # litematica-check
+        samples, errors = [], 0
+        for i in range(self.iterations):
+            interaction = FakeInteraction()
+            item_name = self.rng.choice(names)
+            status = "done" if i % 2 == 0 else "undone"
+            await timed(samples, lambda: self.commands["litematica-check"](interaction, title, item_name, status))
+            errors += failed(interaction)
+        results.append(summarize("litematica-check", samples, errors, rows=rows, blueprints=1))
+
+        # 自動補完（アイテム名）: 1文字ずつ入力する様子を再現する
+        samples, errors = [], 0
+        for _ in range(self.iterations):
+            name = self.rng.choice(names)
+            for length in range(1, min(len(name), 6) + 1):
+                interaction = FakeInteraction(list_title=title)
+                choices = await timed(samples, lambda: self.autocomplete.autocomplete_item_name(
+                    interaction, name[:length]))
+                errors += any(choice.value in ("error", "not_found") for choice in choices)
+        results.append(summarize("autocomplete_item_name", samples, errors, rows=rows, blueprints=1))
+
+        # litematica-delete（確認ボタンまで）
+        samples, errors = [], 0
+        for i in range(self.iterations):
+            delete_title = f"{title}-delete-{i}"
+            self.cache.save(self.namespace, delete_title, [[name, "1", "0"] for name in names])
+            interaction = FakeInteraction()
+
+            async def delete():
+                await self.commands["litematica-delete"](interaction, delete_title)
+                view = next((kwargs["view"] for _, kwargs in reversed(interaction.calls) if "view" in kwargs), None)
+                if view is not None:
+                    await view.confirm_button.callback(FakeInteraction(user=interaction.user))
+
+            await timed(samples, delete)
+            errors += failed(interaction)
+        results.append(summarize("litematica-delete", samples, errors, rows=rows, blueprints=1))
+
+        return results
+
+    async def run_blueprints(self, count: int):
+        titles = [f"bp-{count}-{i:05d}" for i in range(count)]
+        for list_title in titles:
+            self.cache.save(self.namespace, list_title, [["Stone", "64", "0"]])
+
+        samples, errors = [], 0
+        for _ in range(self.iterations):
+            query = self.rng.choice(titles)[:self.rng.randint(0, 8)]
+            interaction = FakeInteraction()
+            choices = await timed(samples, lambda: self.autocomplete.autocomplete_litematica_list(
+                interaction, query))
+            errors += any(choice.value == "error" for choice in choices)
+        result = summarize("autocomplete_litematica_list", samples, errors, rows=1, blueprints=count)
+
+        for list_title in titles:
+            self.cache.delete(self.namespace, list_title)
+        return [result]
+
+
+def failures(results):
+    # エラーになった操作のある結果を返す（エラーですぐ返ると速く見えるので、速さとは別に確かめる）
+    return [
+        f"{result['scenario']} rows={result['rows']} blueprints={result['blueprints']} "
+        f"errors: {result['errors']}/{result['iterations']}"
+        for result in results if result["errors"] > 0
+    ]
+
+
+def compare(results, baseline, max_regression):
+    # 基準と同じ条件の結果を比べ、遅くなりすぎたものを返す
+    previous = {(r["scenario"], r["rows"], r["blueprints"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get((result["scenario"], result["rows"], result["blueprints"]))
+        if before is None:
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            if before[key] > 0 and result[key] > before[key] * max_regression:
+                regressions.append(
+                    f"{result['scenario']} rows={result['rows']} blueprints={result['blueprints']} "
+                    f"{key}: {before[key]:.2f} -> {result[key]:.2f}"
+                )
+    return regressions
+
+
+def parse_sizes(text):
+    return [int(value) for value in text.split(",") if value]
+
+
+async def main(args):
+    benchmark = Benchmark(args.iterations, args.seed)
+    results = []
+    for rows in args.rows:
+        results.extend(await benchmark.run_rows(rows))
+    for count in args.blueprints:
+        results.extend(await benchmark.run_blueprints(count))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=parse_sizes, default=[100, 2000, 50000])
+    parser.add_argument("--blueprints", type=parse_sizes, default=[1, 500, 5000])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--storage", choices=("csv", "sqlite"), default="csv")
+    parser.add_argument("--write-behind", action="store_true", help="チェック状態の変更をまとめて書き込む")
+    parser.add_argument("--quick", action="store_true", help="小さいデータで短時間だけ実行する")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル（省略時は標準出力）")
+    parser.add_argument("--baseline", help="比較する基準のJSONファイル")
+    parser.add_argument("--max-regression", type=float, default=1.5,
+                        help="基準に対して許容する倍率（超えたら終了コード1）")
+    args = parser.parse_args()
+    if args.quick:
+        args.rows, args.blueprints, args.iterations = [100, 2000], [1, 200], 20
+
+    # 保存先は一時ディレクトリにする（コマンドを読み込む前に設定する）
+    workdir = tempfile.mkdtemp(prefix="litematica-bench-")
+    os.environ["BLUEPRINT_STORAGE"] = args.storage
+    os.environ["BLUEPRINT_DIR"] = os.path.join(workdir, "blueprint")
+    os.environ["BLUEPRINT_DB"] = os.path.join(workdir, "blueprints.db")
+    os.environ["WRITE_BEHIND"] = "1" if args.write_behind else "0"
+    os.environ["WRITE_BEHIND_JOURNAL"] = os.path.join(workdir, "blueprint.journal")
+    os.environ["SNAPSHOT_DIR"] = os.path.join(workdir, "snapshots")
+
+    try:
+        results = asyncio.run(main(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": args.storage,
+            "write_behind": args.write_behind,
+            "iterations": args.iterations,
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    for result in results:
+        print(f"{result['scenario']:<30} rows={result['rows']:<6} blueprints={result['blueprints']:<5} "
+              f"p50={result['p50_ms']:8.2f}ms p99={result['p99_ms']:8.2f}ms "
+              f"{result['throughput_ops']:8.1f} ops/s errors={result['errors']}", file=sys.stderr)
+
+    errors = failures(results)
+    for line in errors:
+        print(f"ERROR: {line}", file=sys.stderr)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION: {line}", file=sys.stderr)
+    sys.exit(1 if errors or regressions else 0)
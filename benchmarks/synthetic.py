@@ -0,0 +1,111 @@
+"""
+ベンチマーク用の合成データを生成する
+"""
+import gzip
+import random
+import struct
+from typing import Dict, List, Optional
+
+# 合成 .litematic で使うブロック
+BLOCK_NAMES = [
+    "minecraft:air", "minecraft:stone", "minecraft:cobblestone", "minecraft:oak_planks",
+    "minecraft:glass", "minecraft:white_wool", "minecraft:redstone_wire", "minecraft:oak_slab",
+    "minecraft:smooth_stone", "minecraft:quartz_block", "minecraft:sea_lantern",
+    "minecraft:spruce_log", "minecraft:deepslate_bricks", "minecraft:iron_block",
+]
+
+
+def _string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return struct.pack(">H", len(data)) + data
+
+
+def _named(tag_type: int, name: str, payload: bytes) -> bytes:
+    return bytes([tag_type]) + _string(name) + payload
+
+
+def _int(value: int) -> bytes:
+    return struct.pack(">i", value)
+
+
+def _compound(children: List[bytes]) -> bytes:
+    return b"".join(children) + b"\x00"
+
+
+def pack_block_states(values: List[int], bits: int) -> bytes:
+    """
+    Litematica形式（longの境界をまたいで詰める）でブロック状態をパックする
+    """
+    total_bits = len(values) * bits
+    words = [0] * ((total_bits + 63) // 64)
+    for i, value in enumerate(values):
+        bit_index = i * bits
+        word, offset = divmod(bit_index, 64)
+        words[word] |= (value << offset) & 0xFFFFFFFFFFFFFFFF
+        if offset + bits > 64:
+            words[word + 1] |= value >> (64 - offset)
+    return b"".join(struct.pack(">Q", word) for word in words)
+
+
+def make_litematic(size_x: int, size_y: int, size_z: int, palette: Optional[List[Dict]] = None,
+                   seed: int = 0, values: Optional[List[int]] = None) -> bytes:
+    """
+    1リージョンの .litematic ファイル（gzip圧縮済みNBT）を生成する
+    """
+    palette = palette or [{"Name": name} for name in BLOCK_NAMES]
+    volume = size_x * size_y * size_z
+    bits = max(2, (len(palette) - 1).bit_length())
+
+    if values is None:
+        rng = random.Random(seed)
+        values = [rng.randrange(len(palette)) for _ in range(volume)]
+    block_states = pack_block_states(values, bits)
+
+    palette_entries = []
+    for entry in palette:
+        children = [_named(8, "Name", _string(entry["Name"]))]
+        if entry.get("Properties"):
+            children.append(_named(10, "Properties", _compound(
+                [_named(8, key, _string(value)) for key, value in entry["Properties"].items()]
+            )))
+        palette_entries.append(_compound(children))
+
+    size = _compound([_named(3, "x", _int(size_x)), _named(3, "y", _int(size_y)), _named(3, "z", _int(size_z))])
+    region = _compound([
+        _named(10, "Position", _compound([_named(3, "x", _int(0)), _named(3, "y", _int(0)), _named(3, "z", _int(0))])),
+        _named(10, "Size", size),
+        _named(9, "BlockStatePalette", bytes([10]) + _int(len(palette_entries)) + b"".join(palette_entries)),
+        _named(9, "TileEntities", bytes([10]) + _int(0)),
+        _named(12, "BlockStates", _int(len(block_states) // 8) + block_states),
+    ])
+    root = _compound([
+        _named(3, "Version", _int(6)),
+        _named(10, "Metadata", _compound([_named(8, "Name", _string("synthetic"))])),
+        _named(10, "Regions", _compound([_named(10, "main", region)])),
+    ])
+    return gzip.compress(_named(10, "", root), compresslevel=1)
+
+
+def item_names(count: int) -> List[str]:
+    """
+    重複しないアイテム名を count 個生成する
+    """
+    materials = ["Stone", "Oak Planks", "Glass", "White Wool", "Redstone", "Quartz Block",
+                 "Smooth Stone", "Sea Lantern", "Spruce Log", "Deepslate Bricks", "ガラス", "石レンガ"]
+    return [f"{materials[i % len(materials)]} {i // len(materials)}" for i in range(count)]
+
+
+def make_material_list(rows: int, seed: int = 0) -> bytes:
+    """
+    Litematicaの材料リスト（テキスト表形式）を rows 行分生成する
+    """
+    rng = random.Random(seed)
+    names = item_names(rows)
+    width = max(len(name) for name in names) if names else 4
+    border = f"+{'-' * (width + 2)}+-------+---------+-----------+\n"
+    lines = [border, f"| {'Item':<{width}} | Total | Missing | Available |\n", border]
+    for name in names:
+        total = rng.randint(1, 50000)
+        lines.append(f"| {name:<{width}} | {total:>5} | {total:>7} | {0:>9} |\n")
+    lines.append(border)
+    return "".join(lines).encode("utf-8")
@@ -0,0 +1,900 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import sys
+import threading
+import weakref
+from array import array
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from io_executor import run_io
+from journal import CheckJournal
+from metrics import register_collector
+from search_index import SearchIndex
+from snapshots import Snapshot, SnapshotStore
+from storage import LEGACY_NAMESPACE, BlueprintStorage, create_storage, normalize_row
+
+logger = logging.getLogger("litematica.blueprint_store")
+
+# 設計図を分ける単位（guild: サーバーごと, channel: チャンネルごと, global: 全体で共通）
+BLUEPRINT_SCOPE = os.getenv("BLUEPRINT_SCOPE", "guild")
+
+
+def _row_count(row: List[str]) -> int:
+    return int(row[1]) if row[1].isdigit() else 0
+
+
+def _parse_count(text: str) -> Optional[int]:
+    # 数字だけの個数を数値にする（元の文字列に戻せない場合は None）
+    if text.isascii() and text.isdigit():
+        value = int(text)
+        if str(value) == text:
+            return value
+    return None
+
+
+class Progress:
+    """
+    設計図の進み具合（アイテムの種類数と個数、それぞれ完了分と全体）
+    """
+    __slots__ = ("kinds_done", "kinds_total", "count_done", "count_total")
+
+    def __init__(self, kinds_done: int = 0, kinds_total: int = 0, count_done: int = 0, count_total: int = 0):
+        self.kinds_done = kinds_done
+        self.kinds_total = kinds_total
+        self.count_done = count_done
+        self.count_total = count_total
+
+    @classmethod
+    def from_columns(cls, counts: "array[int]", checked: bytearray) -> "Progress":
+        # 列ごとの集計なのでPythonのループを回さない
+        return cls(
+            kinds_done=checked.count(1),
+            kinds_total=len(counts),
+            count_done=sum(itertools.compress(counts, checked)),
+            count_total=sum(counts)
+        )
+
+    def astuple(self) -> Tuple[int, int, int, int]:
+        # コンストラクタの引数と同じ順（保存先に残す形）
+        return self.kinds_done, self.kinds_total, self.count_done, self.count_total
+
+    def add(self, other: "Progress") -> None:
+        self.kinds_done += other.kinds_done
+        self.kinds_total += other.kinds_total
+        self.count_done += other.count_done
+        self.count_total += other.count_total
+
+    @property
+    def ratio(self) -> float:
+        """
+        個数で見た完了率（0.0〜1.0）
+        """
+        return self.count_done / self.count_total if self.count_total else 0.0
+
+
+class BlueprintDiff:
+    """
+    再アップロードした材料リストと保存済みの設計図の差分
+    """
+    __slots__ = ("added", "removed", "changed", "unchanged", "unchecked")
+
+    def __init__(self):
+        self.added: List[str] = []
+        self.removed: List[str] = []
+        # (アイテム名, 変更前の個数, 変更後の個数)
+        self.changed: List[Tuple[str, str, str]] = []
+        self.unchanged = 0
+        # 個数が増えたためにチェックを外したアイテムの数
+        self.unchecked = 0
+
+
+class ItemRow:
+    """
+    設計図の1行のビュー（[Item, Total, check] の行と同じように row[0]〜row[2] で読める）
+    """
+    __slots__ = ("_blueprint", "index")
+
+    def __init__(self, blueprint: "Blueprint", index: int):
+        self._blueprint = blueprint
+        self.index = index
+
+    @property
+    def name(self) -> str:
+        return self._blueprint.names[self.index]
+
+    @property
+    def count(self) -> int:
+        return self._blueprint.counts[self.index]
+
+    @property
+    def checked(self) -> bool:
+        return bool(self._blueprint.checked[self.index])
+
+    def __getitem__(self, column: int) -> str:
+        if column == 0 or column == -3:
+            return self.name
+        if column == 1 or column == -2:
+            return self._blueprint.count_text(self.index)
+        if column == 2 or column == -1:
+            return "1" if self._blueprint.checked[self.index] else "0"
+        raise IndexError(column)
+
+    def __len__(self) -> int:
+        return 3
+
+    def __iter__(self) -> Iterator[str]:
+        return iter((self[0], self[1], self[2]))
+
+    def __eq__(self, other: object) -> bool:
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class RowsView:
+    """
+    設計図の行を [Item, Total, check] のリストのように扱うためのビュー（保存先にそのまま渡せる）
+    """
+    __slots__ = ("_blueprint",)
+
+    def __init__(self, blueprint: "Blueprint"):
+        self._blueprint = blueprint
+
+    def __len__(self) -> int:
+        return len(self._blueprint.names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ItemRow(self._blueprint, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return ItemRow(self._blueprint, index)
+
+    def __iter__(self) -> Iterator[ItemRow]:
+        blueprint = self._blueprint
+        return (ItemRow(blueprint, i) for i in range(len(blueprint.names)))
+
+    def __repr__(self) -> str:
+        return repr([list(row) for row in self])
+
+
+class Blueprint:
+    """
+    メモリ上に読み込まれた設計図
+
+    行のリストではなく列ごとに保持する（アイテム名はインターンした文字列のリスト、個数は array('q')、
+    チェック状態は1行1バイトの bytearray）。数値でない個数だけは元の文字列を別に持つ。
+    rows は従来の [Item, Total, check] の行と同じように読めるビュー。
+    """
+    __slots__ = ("namespace", "title", "names", "counts", "checked", "version", "nbytes", "progress",
+                 "_raw_counts", "_positions", "_search_index", "_sorted_indices", "_count_order",
+                 "_filtered_orders")
+
+    def __init__(self, namespace: str, title: str, rows: Iterable[List[str]], version: Hashable):
+        self.namespace = namespace
+        self.title = title
+        names = []
+        counts = array("q")
+        checked = bytearray()
+        raw_counts = {}
+        for i, row in enumerate(rows):
+            names.append(sys.intern(row[0]))
+            value = _parse_count(row[1])
+            if value is None:
+                raw_counts[i] = row[1]
+                value = _row_count(row)
+            counts.append(value)
+            checked.append(row[2] == "1")
+        self.names = names
+        self.counts = counts
+        self.checked = checked
+        self._raw_counts: Dict[int, str] = raw_counts
+        # 保存先が返すバージョン。設計図が変わったかどうかの判定に使う
+        self.version = version
+        self.nbytes = _estimate_size(self)
+        # 読み込み時に1回だけ集計し、以降はチェック状態の変更ごとに差分で更新する
+        self.progress = Progress.from_columns(counts, checked)
+        self._positions: Optional[Dict[str, int]] = None
+        self._search_index: Optional[SearchIndex] = None
+        self._sorted_indices: Optional[List[int]] = None
+        self._count_order: Optional[List[int]] = None
+        # チェック状態（True: 完了）→ count_order のうちその状態の行番号
+        self._filtered_orders: Dict[bool, List[int]] = {}
+
+    @property
+    def rows(self) -> RowsView:
+        return RowsView(self)
+
+    def count_text(self, index: int) -> str:
+        """
+        保存されている個数の文字列
+        """
+        raw = self._raw_counts.get(index)
+        return str(self.counts[index]) if raw is None else raw
+
+    @property
+    def sorted_indices(self) -> List[int]:
+        """
+        アイテム名の順に並べた行番号（アイテム名は変わらないので初回だけ並べ替える）
+        """
+        if self._sorted_indices is None:
+            self._sorted_indices = sorted(range(len(self.names)), key=self.names.__getitem__)
+        return self._sorted_indices
+
+    @property
+    def count_order(self) -> List[int]:
+        """
+        個数の多い順に並べた行番号（同じ個数は元の順。個数は変わらないので初回だけ並べ替える）
+        """
+        if self._count_order is None:
+            counts = self.counts
+            self._count_order = sorted(range(len(counts)), key=lambda i: -counts[i])
+        return self._count_order
+
+    def filtered_order(self, checked: bool) -> List[int]:
+        """
+        count_order のうち、チェック状態が checked の行番号（チェック状態が変わるまで使い回す）
+        """
+        order = self._filtered_orders.get(checked)
+        if order is None:
+            flags = self.checked
+            order = self._filtered_orders[checked] = [i for i in self.count_order if bool(flags[i]) == checked]
+        return order
+
+    @property
+    def search_index(self) -> SearchIndex:
+        """
+        アイテム名の自動補完用の索引（初回アクセス時に構築）
+        """
+        if self._search_index is None:
+            self._search_index = SearchIndex(self.names)
+        return self._search_index
+
+    def search(self, query: str) -> List[ItemRow]:
+        """
+        アイテム名を検索し、順位順に並んだ行を返す
+        """
+        ids = self.search_index.search(query, self.checked.__getitem__)
+        return [ItemRow(self, i) for i in ids]
+
+    def set_check(self, index: int, value: str) -> None:
+        """
+        行のcheck値を変更し、進み具合を更新する
+        """
+        flag = value == "1"
+        if self.checked[index] == flag:
+            return
+        self.checked[index] = flag
+        self._filtered_orders.clear()
+        sign = 1 if flag else -1
+        self.progress.kinds_done += sign
+        self.progress.count_done += sign * self.counts[index]
+
+    def has_numeric_count(self, index: int) -> bool:
+        """
+        個数が数字だけで書かれているかどうか
+        """
+        raw = self._raw_counts.get(index)
+        return raw is None or raw.isdigit()
+
+    def index_of(self, item_name: str) -> int:
+        """
+        アイテム名から行番号を返す（見つからない場合は -1）
+        """
+        if self._positions is None:
+            positions = {}
+            for i, name in enumerate(self.names):
+                # 同名のアイテムがある場合は最初の行を優先する
+                positions.setdefault(name, i)
+            self._positions = positions
+        return self._positions.get(item_name, -1)
+
+
+def merge_blueprints(blueprints: Iterable[Blueprint]) -> Iterator[Tuple[str, int, int, bool]]:
+    """
+    複数の設計図を合算し、アイテム名の順に (アイテム名, 必要数, 残り数, すべて完了) を返す
+
+    各設計図をアイテム名の順に並べた行番号を k-way マージするので、全体を並べ替え直さない。
+    """
+    streams = []
+    for blueprint in blueprints:
+        indices = blueprint.sorted_indices
+        streams.append(zip(map(blueprint.names.__getitem__, indices),
+                           map(blueprint.counts.__getitem__, indices),
+                           map(blueprint.checked.__getitem__, indices)))
+
+    merged = heapq.merge(*streams)
+    for item_name, group in itertools.groupby(merged, key=lambda entry: entry[0]):
+        required = remaining = 0
+        finished = True
+        for _, count, checked in group:
+            required += count
+            if not checked:
+                remaining += count
+                finished = False
+        yield item_name, required, remaining, finished
+
+
+def _estimate_size(blueprint: Blueprint) -> int:
+    # 列と文字列のおおよそのメモリ使用量（インターンした名前は共有されるが、多めに見積もる）
+    size = sys.getsizeof(blueprint.names) + sum(map(sys.getsizeof, blueprint.names))
+    size += sys.getsizeof(blueprint.counts) + sys.getsizeof(blueprint.checked)
+    size += sys.getsizeof(blueprint._raw_counts) + sum(map(sys.getsizeof, blueprint._raw_counts.values()))
+    return size
+
+
+class BlueprintCache:
+    """
+    保存先から読み込んだ設計図をメモリ上に保持するキャッシュ
+
+    設計図は (名前空間, 設計図名) で識別する。
+    保存先のバージョン（CSVでは mtime とサイズ）で古いエントリを無効化し、
+    メモリ使用量が上限を超えた場合は最も使われていない設計図から破棄する。
+
+    journal を渡すと write-behind モードになり、チェック状態の変更はメモリ上の行と
+    ジャーナルにだけ反映される。保存先への書き込みは flush() でまとめて行い、
+    未書き込みの変更が max_dirty 件を超えた場合はその場で flush() する。
+    """
+
+    def __init__(self, storage: BlueprintStorage, max_bytes: int = 64 * 1024 * 1024,
+                 journal: Optional[CheckJournal] = None, max_dirty: int = 100,
+                 snapshots: Optional[SnapshotStore] = None):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.journal = journal
+        self.max_dirty = max_dirty
+        # 保存するたびに版を記録するスナップショット置き場（None なら記録しない）
+        self.snapshots = snapshots
+        # 保存先に書き込んでいない変更（(名前空間, 設計図名) → 行番号）
+        self._dirty: Dict[Tuple[str, str], Set[int]] = {}
+        # キャッシュから破棄した設計図の進み具合（(名前空間, 設計図名) → (バージョン, 進み具合)）
+        self._progress: Dict[Tuple[str, str], Tuple[Hashable, Progress]] = {}
+        self.dirty_count = 0
+        self.flushes = 0
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Blueprint]" = OrderedDict()
+        # 名前空間 → (設計図名の一覧, 保存先の一覧のバージョン)
+        self._titles: Dict[str, Tuple[List[str], Optional[Hashable]]] = {}
+        self._titles_indexes: Dict[str, SearchIndex] = {}
+        self._lock = threading.RLock()
+
+    def get(self, namespace: str, list_title: str) -> Blueprint:
+        """
+        設計図を取得する（保存先が更新されていなければキャッシュから返す）
+        """
+        key = (namespace, list_title)
+        with self._lock:
+            # 未書き込みの変更がある設計図はメモリ上の内容が最新
+            if key in self._dirty:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        version = self.storage.version(namespace, list_title)
+        if version is None:
+            self._discard(namespace, list_title)
+            raise FileNotFoundError(f"ファイル {list_title}.csv が見つかりません。")
+
+        with self._lock:
+            blueprint = self._entries.get(key)
+            if blueprint is not None and blueprint.version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return blueprint
+            self.misses += 1
+
+        rows, version = self.storage.load(namespace, list_title)
+        blueprint = Blueprint(namespace, list_title, rows, version)
+        self._store(blueprint)
+        return blueprint
+
+    def save(self, namespace: str, list_title: str, rows: List[List[str]], reason: str = "upload",
+             base: Optional[int] = None) -> Blueprint:
+        """
+        設計図を保存し、保存した内容でキャッシュを更新する
+        """
+        rows = [normalize_row(row) for row in rows]
+        # 書き込みと未書き込みのチェック状態の破棄の間に flush() が入ると古い行で上書きされるので、
+        # flush() と同じロックを保持したまま行う
+        with self._lock:
+            version = self.storage.save(namespace, list_title, rows)
+            # 保存した内容で置き換わるので、未書き込みのチェック状態は破棄する
+            self._clear_dirty(namespace, list_title)
+            blueprint = Blueprint(namespace, list_title, rows, version)
+            self._store(blueprint)
+        self._record_snapshot(blueprint, reason, base=base)
+        self._save_progress(namespace, [blueprint])
+        return blueprint
+
+    def update(self, namespace: str, list_title: str, rows: Iterable[List[str]]) -> Tuple[Blueprint, BlueprintDiff]:
+        """
+        材料リストを再アップロードした内容で設計図を更新し、(更新後の設計図, 差分) を返す
+
+        アイテム名の索引で1回だけ走査して差分を求め、変更のないアイテムのチェック状態は引き継ぐ。
+        個数が増えたアイテムはチェックを外す。保存先には変更した行だけを書き込む。
+        """
+        rows = [normalize_row(row) for row in rows]
+        diff = BlueprintDiff()
+        try:
+            old = self.get(namespace, list_title)
+        except FileNotFoundError:
+            diff.added = [row[0] for row in rows]
+            return self.save(namespace, list_title, rows), diff
+
+        if (namespace, list_title) in self._dirty:
+            # 未書き込みのチェック状態を先に保存しておく
+            self.flush()
+
+        matched = [False] * len(old.names)
+        merged = [list(row) for row in old.rows]
+        updated = []
+        added = []
+        for row in rows:
+            index = old.index_of(row[0])
+            if index < 0 or matched[index]:
+                added.append(row)
+                diff.added.append(row[0])
+                continue
+
+            matched[index] = True
+            current = merged[index]
+            if current[1] == row[1]:
+                diff.unchanged += 1
+                continue
+
+            diff.changed.append((row[0], current[1], row[1]))
+            if current[2] == "1" and _row_count(row) > _row_count(current):
+                current[2] = "0"
+                diff.unchecked += 1
+            current[1] = row[1]
+            updated.append((index, current))
+
+        removed = [i for i, found in enumerate(matched) if not found]
+        diff.removed = [old.names[i] for i in removed]
+        merged = [row for row, found in zip(merged, matched) if found] + added
+
+        if not (updated or removed or added):
+            return old, diff
+
+        version = self.storage.apply_diff(namespace, list_title, merged, updated, removed, added)
+        blueprint = Blueprint(namespace, list_title, merged, version)
+        self._store(blueprint)
+        self._record_snapshot(blueprint, "update")
+        self._save_progress(namespace, [blueprint])
+        return blueprint, diff
+
+    def update_check(self, namespace: str, list_title: str, item_name: str, checked: bool) -> Tuple[List[str], str]:
+        """
+        アイテムのチェック状態を更新し、(更新後の行, 変更前のcheck値) を返す
+        """
+        blueprint = self.get(namespace, list_title)
+        index = blueprint.index_of(item_name)
+        if index < 0:
+            raise ValueError(f"アイテム '{item_name}' が {list_title}.csv 内に見つかりませんでした。")
+
+        (original_check_value,) = self.update_checks(namespace, list_title, [index], checked)
+        return blueprint.rows[index], original_check_value
+
+    def update_checks(self, namespace: str, list_title: str, indices: List[int], checked: bool) -> List[str]:
+        """
+        複数の行のチェック状態を1回の書き込みで更新し、各行の変更前のcheck値を返す
+        """
+        blueprint = self.get(namespace, list_title)
+        value = "1" if checked else "0"
+        original_values = ["1" if blueprint.checked[i] else "0" for i in indices]
+
+        # 値が変わる行だけを書き込む
+        changed = [i for i, original in zip(indices, original_values) if original != value]
+        if not changed:
+            return original_values
+
+        if self.journal is not None:
+            self._update_checks_write_behind(blueprint, changed, value)
+            return original_values
+
+        previous_version = blueprint.version
+        for i in changed:
+            blueprint.set_check(i, value)
+        try:
+            version = self.storage.update_checks(namespace, list_title, blueprint.rows, changed)
+        except BaseException:
+            # 保存に失敗した場合はメモリ上の値も元に戻す
+            for i, original in zip(indices, original_values):
+                blueprint.set_check(i, original)
+            raise
+
+        # アイテム名は変わらないので行・索引はそのまま使い、バージョンだけ進める
+        with self._lock:
+            blueprint.version = version
+        self._record_snapshot(blueprint, "check", changed, previous_version=previous_version)
+        self._save_progress(namespace, [blueprint])
+        return original_values
+
+    def _update_checks_write_behind(self, blueprint: Blueprint, indices: List[int], value: str) -> None:
+        key = (blueprint.namespace, blueprint.title)
+        with self._lock:
+            dirty = self._dirty.setdefault(key, set())
+            before = len(dirty)
+            try:
+                # ジャーナルに書けた変更だけをメモリ上に反映する
+                for i in indices:
+                    self.journal.append(blueprint.namespace, blueprint.title, i, blueprint.names[i], value,
+                                        blueprint.version)
+                    blueprint.set_check(i, value)
+                    dirty.add(i)
+            finally:
+                self.dirty_count += len(dirty) - before
+                if not dirty:
+                    del self._dirty[key]
+            over_limit = self.dirty_count >= self.max_dirty
+        if over_limit:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        未書き込みのチェック状態を保存先に書き込み、書き込んだ設計図の数を返す
+        """
+        with self._lock:
+            if not self._dirty:
+                return 0
+
+            # 書き込み中の変更がジャーナルから消えないよう、終わるまでロックを保持する
+            flushed = 0
+            error = None
+            # 書き込んだ設計図（名前空間 → 設計図）。集計は名前空間ごとにまとめて保存する
+            written: Dict[str, List[Blueprint]] = {}
+            for key, indices in list(self._dirty.items()):
+                blueprint = self._entries[key]
+                previous_version = blueprint.version
+                try:
+                    blueprint.version = self.storage.update_checks(
+                        blueprint.namespace, blueprint.title, blueprint.rows, sorted(indices)
+                    )
+                except Exception as e:
+                    # 書き込めなかった設計図は次回にもう一度書き込む
+                    error = e
+                    continue
+                del self._dirty[key]
+                self.dirty_count -= len(indices)
+                flushed += 1
+                self._record_snapshot(blueprint, "check", indices, previous_version=previous_version)
+                written.setdefault(blueprint.namespace, []).append(blueprint)
+
+            for namespace, blueprints in written.items():
+                self._save_progress(namespace, blueprints)
+            self.flushes += 1
+            if not self._dirty:
+                self.journal.truncate()
+            if error is not None:
+                raise error
+            return flushed
+
+    def recover(self) -> List[Tuple[str, str]]:
+        """
+        前回の終了時に書き込めなかったジャーナルの変更を保存先に反映する
+        """
+        if self.journal is None:
+            return []
+        return self.journal.replay(self.storage)
+
+    def progress(self, namespace: str, list_title: str) -> Progress:
+        """
+        設計図の進み具合を返す（キャッシュにない設計図も、変更がなければ保存先に残した集計を使い、読み直さない）
+        """
+        with self._lock:
+            saved = self._progress.get((namespace, list_title))
+        progress = self._valid_progress(namespace, list_title, saved)
+        if progress is None:
+            persisted = self.storage.load_progress(namespace).get(list_title)
+            if persisted is not None:
+                progress = self._valid_progress(namespace, list_title, (persisted[0], Progress(*persisted[1])))
+        if progress is not None:
+            return progress
+        return self.get(namespace, list_title).progress
+
+    def namespace_progress(self, namespace: str) -> List[Tuple[str, Progress]]:
+        """
+        名前空間内のすべての設計図の (設計図名, 進み具合) を返す
+
+        キャッシュにない設計図は保存先に残した集計を使い、集計がないか古い設計図だけを読み込んで集計を残し直す。
+        """
+        persisted = {list_title: (version, Progress(*values))
+                     for list_title, (version, values) in self.storage.load_progress(namespace).items()}
+        results = []
+        stale = []
+        for list_title in self.titles(namespace):
+            with self._lock:
+                saved = self._progress.get((namespace, list_title))
+            progress = (self._valid_progress(namespace, list_title, saved)
+                        or self._valid_progress(namespace, list_title, persisted.get(list_title)))
+            if progress is None:
+                try:
+                    blueprint = self.get(namespace, list_title)
+                except FileNotFoundError:
+                    # 一覧を取得した後に削除された場合
+                    continue
+                progress = blueprint.progress
+                if (namespace, list_title) not in self._dirty:
+                    stale.append(blueprint)
+            results.append((list_title, progress))
+        if stale:
+            self._save_progress(namespace, stale)
+        return results
+
+    def delete(self, namespace: str, list_title: str) -> None:
+        if self.snapshots is not None:
+            # 版の記録がない設計図（スナップショット導入前の設計図や、記録に失敗した設計図）でも
+            # /litematica-undo で戻せるよう、消す前に今の内容を記録する。記録できなければ削除しない
+            self.snapshots.backup(self.get(namespace, list_title))
+        # save() と同じく、削除した設計図を flush() が書き戻さないようロックを保持する
+        with self._lock:
+            self.storage.delete(namespace, list_title)
+            self._clear_dirty(namespace, list_title)
+            self._discard(namespace, list_title)
+        if self.snapshots is not None:
+            try:
+                self.snapshots.record_delete(namespace, list_title)
+            except Exception:
+                logger.exception("Snapshot of deleting %s/%s failed", namespace, list_title)
+
+    def restore(self, namespace: str, list_title: str, version: Optional[int] = None) -> Tuple[Blueprint, Snapshot]:
+        """
+        設計図を記録した版に戻し、(復元した設計図, 復元元の版) を返す
+
+        version を省略した場合は /litematica-undo と同じく1つ前の版（削除した設計図は削除前の版）に戻す。
+        """
+        if self.snapshots is None:
+            raise ValueError("スナップショットが無効になっています。")
+        if version is None:
+            version = self.snapshots.undo_target(namespace, list_title).id
+        snapshot, rows = self.snapshots.load(namespace, list_title, version)
+        if snapshot.deleted:
+            raise ValueError(f"版 {version} は削除を記録した版です。")
+        blueprint = self.save(namespace, list_title, rows, reason=f"restore:{snapshot.id}", base=snapshot.base)
+        return blueprint, snapshot
+
+    def _record_snapshot(self, blueprint: Blueprint, reason: str, changed: Optional[Iterable[int]] = None,
+                         base: Optional[int] = None, previous_version: Optional[Hashable] = None) -> None:
+        if self.snapshots is None:
+            return
+        try:
+            self.snapshots.record(blueprint, reason, changed, base=base, previous_version=previous_version)
+        except Exception:
+            # 保存自体は終わっているので、版の記録に失敗してもコマンドは失敗させない
+            logger.exception("Snapshot of %s/%s failed", blueprint.namespace, blueprint.title)
+
+    def _valid_progress(self, namespace: str, list_title: str,
+                        saved: Optional[Tuple[Hashable, Progress]]) -> Optional[Progress]:
+        # 記録した進み具合が保存先の今のバージョンのものなら返す（未書き込みの変更がある設計図はメモリ上が最新）
+        if saved is None or (namespace, list_title) in self._dirty:
+            return None
+        if self.storage.version(namespace, list_title) != saved[0]:
+            return None
+        return saved[1]
+
+    def _save_progress(self, namespace: str, blueprints: List[Blueprint]) -> None:
+        # 保存先にも集計を残し、キャッシュが空の状態から /litematica-progress を実行しても設計図を読み込まずに済ませる
+        try:
+            self.storage.save_progress(namespace, {
+                blueprint.title: (blueprint.version, blueprint.progress.astuple()) for blueprint in blueprints
+            })
+        except Exception:
+            # 集計は読み込めば作り直せるので、残せなくてもコマンドは失敗させない
+            logger.exception("Saving progress of %s failed", namespace)
+
+    def info(self, namespace: str, list_title: str) -> Dict[str, object]:
+        return self.storage.info(namespace, list_title)
+
+    def titles(self, namespace: str) -> List[str]:
+        """
+        名前空間内の設計図名の一覧を返す（保存先の一覧が更新されていなければキャッシュから返す）
+        """
+        titles_version = self.storage.titles_version(namespace)
+        with self._lock:
+            cached, cached_version = self._titles.get(namespace, (None, None))
+            if cached is not None and cached_version == titles_version:
+                return cached
+
+        titles = self.storage.titles(namespace)
+        with self._lock:
+            cached, _ = self._titles.get(namespace, (None, None))
+            # 一覧が変わっていなければ同じリストを使い続ける（索引を再利用するため）
+            if titles == cached:
+                titles = cached
+            self._titles[namespace] = (titles, titles_version)
+            return titles
+
+    def search_titles(self, namespace: str, query: str, titles: Optional[List[str]] = None) -> List[str]:
+        """
+        設計図名を検索し、順位順に返す（titles には titles() の戻り値を渡せる）
+        """
+        if titles is None:
+            titles = self.titles(namespace)
+        with self._lock:
+            index = self._titles_indexes.get(namespace)
+            if index is None or index.names is not titles:
+                index = self._titles_indexes[namespace] = SearchIndex(titles)
+        return [titles[i] for i in index.search(query)]
+
+    def search_items(self, namespace: str, list_title: str, query: str) -> List[ItemRow]:
+        """
+        設計図のアイテム名を検索し、順位順に並んだ行を返す
+
+        索引の構築は大きな設計図では数秒かかるので、イベントループではなく run_io から呼ぶ。
+        """
+        return self.get(namespace, list_title).search(query)
+
+    def _store(self, blueprint: Blueprint) -> None:
+        key = (blueprint.namespace, blueprint.title)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+            else:
+                self._invalidate_titles(blueprint.namespace)
+            self._entries[key] = blueprint
+            self.current_bytes += blueprint.nbytes
+            self._progress.pop(key, None)
+
+            # 上限を超えたら古いものから破棄（最新の1件と未書き込みの設計図は残す）
+            if self.current_bytes > self.max_bytes:
+                for old_key in list(self._entries)[:-1]:
+                    if self.current_bytes <= self.max_bytes:
+                        break
+                    if old_key in self._dirty:
+                        continue
+                    evicted = self._entries.pop(old_key)
+                    self.current_bytes -= evicted.nbytes
+                    self._progress[old_key] = (evicted.version, evicted.progress)
+
+    def _clear_dirty(self, namespace: str, list_title: str) -> None:
+        with self._lock:
+            dirty = self._dirty.pop((namespace, list_title), None)
+            if dirty is not None:
+                self.dirty_count -= len(dirty)
+
+    def _discard(self, namespace: str, list_title: str) -> None:
+        with self._lock:
+            old = self._entries.pop((namespace, list_title), None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+            self._progress.pop((namespace, list_title), None)
+            self._invalidate_titles(namespace)
+
+    def _invalidate_titles(self, namespace: str) -> None:
+        # 一覧のリストは残し、次回は保存先から読み直させる（変わっていなければ索引を再利用できる）
+        cached = self._titles.get(namespace)
+        if cached is not None:
+            self._titles[namespace] = (cached[0], None)
+
+
+def blueprint_namespace(interaction) -> str:
+    """
+    Interaction から設計図の名前空間を決める
+
+    BLUEPRINT_SCOPE が guild ならサーバーID、channel なら "サーバーID/チャンネルID"、
+    global なら全体で共通の名前空間を返す。DMではユーザーごとの名前空間になる。
+    """
+    if BLUEPRINT_SCOPE == "global":
+        return LEGACY_NAMESPACE
+    if interaction.guild_id is None:
+        return f"user-{interaction.user.id}"
+    if BLUEPRINT_SCOPE == "channel":
+        return f"{interaction.guild_id}/{interaction.channel_id}"
+    return str(interaction.guild_id)
+
+
+async def warm_up(cache: "BlueprintCache", max_fraction: float = 0.5) -> Tuple[int, int]:
+    """
+    設計図名の索引を作り、キャッシュの上限の max_fraction までアイテム名の索引も作っておく
+
+    起動直後の自動補完が遅くならないよう、バックグラウンドで少しずつ実行する。
+    戻り値は (名前空間の数, 読み込んだ設計図の数)。
+    """
+    namespaces = await run_io(cache.storage.namespaces)
+    loaded = 0
+    for namespace in namespaces:
+        titles = await run_io(cache.titles, namespace)
+        await run_io(cache.search_titles, namespace, "", titles)
+
+    for namespace in namespaces:
+        for list_title in await run_io(cache.titles, namespace):
+            if cache.current_bytes >= cache.max_bytes * max_fraction:
+                return len(namespaces), loaded
+            try:
+                blueprint = await run_io(cache.get, namespace, list_title)
+            except FileNotFoundError:
+                continue
+            await run_io(getattr, blueprint, "search_index")
+            loaded += 1
+    return len(namespaces), loaded
+
+
+# 設計図ごとの書き込み用ロック（使われなくなったロックは自動的に破棄される）
+_blueprint_locks: "weakref.WeakValueDictionary[Tuple[str, str], asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def blueprint_lock(namespace: str, list_title: str) -> asyncio.Lock:
+    """
+    設計図を変更する処理を直列化するためのロックを返す
+    """
+    key = (namespace, list_title)
+    lock = _blueprint_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _blueprint_locks[key] = lock
+    return lock
+
+
+def journal_path(path: str, shard_ids: Optional[str]) -> str:
+    """
+    ジャーナルのパスを返す（SHARD_IDS を指定した場合はシャードごとに別のファイルにする）
+
+    flush() の後の truncate() でほかのプロセスの未書き込みの変更を消さないよう、プロセスごとに分ける。
+    再起動しても同じシャードを担当するプロセスが同じファイルを読み直せるよう、pid ではなくシャードIDを使う。
+    """
+    if not shard_ids:
+        return path
+    root, ext = os.path.splitext(path)
+    suffix = "".join(char if char.isdigit() or char == "-" else "_" for char in shard_ids.replace(" ", ""))
+    return f"{root}.shard-{suffix}{ext}"
+
+
+# WRITE_BEHIND=1 のとき、チェック状態の変更をまとめて書き込む
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "5"))
+WRITE_BEHIND_JOURNAL = journal_path(os.getenv("WRITE_BEHIND_JOURNAL", "./blueprint.journal"), os.getenv("SHARD_IDS"))
+
+# すべてのコマンドと自動補完で共有するキャッシュ
+blueprint_cache = BlueprintCache(
+    create_storage(),
+    max_bytes=int(os.getenv("BLUEPRINT_CACHE_MB", "64")) * 1024 * 1024,
+    journal=CheckJournal(WRITE_BEHIND_JOURNAL) if WRITE_BEHIND else None,
+    max_dirty=int(os.getenv("WRITE_BEHIND_MAX_DIRTY", "100")),
+    # SNAPSHOTS=0 で版の記録を止める
+    snapshots=SnapshotStore(os.getenv("SNAPSHOT_DIR", "./snapshots")) if os.getenv("SNAPSHOTS", "1") == "1" else None
+)
+
+
+async def flush_periodically(interval: float = WRITE_BEHIND_INTERVAL) -> None:
+    """
+    一定間隔で未書き込みのチェック状態を保存先に書き込む
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if blueprint_cache.dirty_count:
+            try:
+                await run_io(blueprint_cache.flush)
+            except Exception:
+                logger.exception("Write-behind flush failed")
+
+
+def _collect_cache_metrics():
+    cache = blueprint_cache
+    lookups = cache.hits + cache.misses
+    yield ("litematica_blueprint_cache_hits_total", "counter", "Blueprint cache hits.", [({}, cache.hits)])
+    yield ("litematica_blueprint_cache_misses_total", "counter", "Blueprint cache misses.", [({}, cache.misses)])
+    yield ("litematica_blueprint_cache_hit_ratio", "gauge", "Blueprint cache hit ratio.",
+           [({}, cache.hits / lookups if lookups else 0.0)])
+    yield ("litematica_blueprint_cache_bytes", "gauge", "Estimated memory held by cached blueprints.",
+           [({}, cache.current_bytes)])
+    yield ("litematica_blueprint_cache_entries", "gauge", "Blueprints held in the cache.",
+           [({}, len(cache._entries))])
+    yield ("litematica_blueprint_dirty_rows", "gauge", "Check changes not yet written to storage.",
+           [({}, cache.dirty_count)])
+    yield ("litematica_blueprint_flushes_total", "counter", "Write-behind flushes.", [({}, cache.flushes)])
+
+
+register_collector(_collect_cache_metrics)
@@ -1,39 +1,328 @@
-import csv
+import asyncio
 import datetime
-import os
-import re
+import fnmatch
+import hashlib
+import logging
 import shutil
+from typing import Optional
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 from discord.ui import Button, View  # ボタン機能のインポート
 
-from autocomplete import (autocomplete_check_status, autocomplete_item_name,
+from autocomplete import (autocomplete_check_status,
+                          autocomplete_export_format, autocomplete_item_name,
                           autocomplete_list_check,
-                          autocomplete_litematica_list)
+                          autocomplete_litematica_list,
+                          autocomplete_litematica_lists,
+                          autocomplete_snapshot_version)
+from blueprint_store import (Blueprint, Progress, blueprint_cache, blueprint_lock,
+                             blueprint_namespace, merge_blueprints)
+from export import export_blueprint
+from io_executor import io_executor, run_io
+from logging_setup import log_failure
+from loop_watchdog import watchdog
+from metrics import (AUTOCOMPLETE_DURATION, BLUEPRINT_BYTES, COMMAND_DURATION,
+                     EVENT_LOOP_LAG, instrument)
+from parse_pool import PARSE_PROGRESS_INTERVAL, ParseProgress, parse_pool
+from reply import RESPONSES, Reply
 
+logger = logging.getLogger("litematica.command")
 
-# ページネーション用のViewクラス
-class ItemPaginationView(discord.ui.View):
-    def __init__(self, items, check_status, list_title, interaction_user):
-        super().__init__(timeout=180)  # 3分間のタイムアウト
-        self.items = items
-        self.current_page = 0
-        self.items_per_page = 20
-        self.check_status = check_status
+
+def _store_material_list(namespace, list_title, rows, update=False):
+    # 解析した行を保存する（キャッシュも更新）
+    # update の場合は保存済みの設計図との差分だけを書き込み、差分も返す
+    if update:
+        return blueprint_cache.update(namespace, list_title, rows)
+    return blueprint_cache.save(namespace, list_title, rows), None
+
+
+def _parse_progress_embed(filename, progress):
+    # プロセスプールで解析している間に表示する「処理中」のEmbed
+    stage = "エンコーディングを判定しています" if progress.stage == "encoding" else "行を解析しています"
+    embed = discord.Embed(
+        title="⏳ litematicaファイル解析中",
+        description=f"`{filename}`を解析しています\n{stage}...",
+        color=0x3498DB
+    )
+    embed.add_field(
+        name="進捗",
+        value=f"{_progress_bar(progress.ratio)} {progress.ratio * 100:.1f}%\n"
+              f"{progress.bytes_done / 1024 / 1024:,.1f} / {progress.bytes_total / 1024 / 1024:,.1f} MB・"
+              f"{progress.rows:,} 行",
+        inline=False
+    )
+    embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+    return embed
+
+
+async def _update_parse_progress(reply, filename, progress):
+    # 解析が終わるまで PARSE_PROGRESS_INTERVAL 秒ごとに「処理中」のEmbedを書き換える
+    while True:
+        await asyncio.sleep(PARSE_PROGRESS_INTERVAL)
+        try:
+            await reply.edit(embed=_parse_progress_embed(filename, progress))
+        except discord.HTTPException:
+            pass
+
+
+def _diff_text(diff, limit=10):
+    # 差分の内訳（アイテムごとの変更は最大 limit 件まで）
+    lines = [f"➕ {name}" for name in diff.added[:limit]]
+    lines += [f"➖ {name}" for name in diff.removed[:limit - len(lines)]]
+    lines += [f"✏️ {name}: {before} → {after}" for name, before, after in diff.changed[:limit - len(lines)]]
+    hidden = len(diff.added) + len(diff.removed) + len(diff.changed) - len(lines)
+    if hidden > 0:
+        lines.append(f"...他 {hidden} 件")
+    return "\n".join(lines) or "変更はありません"
+
+
+def _bulk_check(namespace, list_title, names_to_check, pattern, max_count, checked):
+    # 条件に一致する行を選び、まとめてチェック状態を更新する
+    # 戻り値は (対象の行, 実際に変更した行, 見つからなかったアイテム名)
+    blueprint = blueprint_cache.get(namespace, list_title)
+    rows = blueprint.rows
+    names = blueprint.names
+    
+    selected = set()
+    not_found = []
+    for name in names_to_check:
+        index = blueprint.index_of(name)
+        if index < 0:
+            not_found.append(name)
+        else:
+            selected.add(index)
+    
+    if pattern:
+        # 利用者の正規表現はバックトラックでBOT全体を止められるので使わない
+        # * ? [] を含む場合はワイルドカード（名前全体と照合）、それ以外は部分文字列として大文字小文字を区別せずに探す
+        folded = pattern.casefold()
+        if any(char in folded for char in "*?["):
+            selected.update(i for i, name in enumerate(names) if fnmatch.fnmatchcase(name.casefold(), folded))
+        else:
+            selected.update(i for i, name in enumerate(names) if folded in name.casefold())
+    
+    if max_count is not None:
+        # checked（変更後の状態）を上書きしないよう、列は別の名前で受ける
+        counts, flags = blueprint.counts, blueprint.checked
+        selected.update(
+            i for i in range(len(names))
+            if not flags[i] and counts[i] <= max_count and blueprint.has_numeric_count(i)
+        )
+    
+    indices = sorted(selected)
+    original_values = blueprint_cache.update_checks(namespace, list_title, indices, checked)
+    value = "1" if checked else "0"
+    matched = [rows[i] for i in indices]
+    changed = [rows[i] for i, original in zip(indices, original_values) if original != value]
+    return matched, changed, not_found
+
+
+def _merge_lists(namespace, list_titles, check, save_as):
+    # 設計図を合算し、表示用の設計図（列形式）を返す
+    # unfinished では残り数、それ以外では必要数を表示する（save_as を指定した場合は同じ内容で保存する）
+    blueprints = [blueprint_cache.get(namespace, list_title) for list_title in list_titles]
+    
+    rows = []
+    for item_name, required, remaining, finished in merge_blueprints(blueprints):
+        if check == "all" or (check == "finished" and finished) or (check == "unfinished" and not finished):
+            count = remaining if check == "unfinished" else required
+            rows.append([item_name, str(count), "1" if finished else "0"])
+    
+    if save_as:
+        return blueprint_cache.save(namespace, save_as, rows)
+    return Blueprint(namespace, " + ".join(list_titles), rows, None)
+
+
+def _progress_bar(ratio, width=10):
+    filled = min(width, int(ratio * width + 0.5))
+    return "█" * filled + "░" * (width - filled)
+
+
+def _progress_text(progress):
+    kinds_ratio = progress.kinds_done / progress.kinds_total if progress.kinds_total else 0.0
+    return (f"種類 {_progress_bar(kinds_ratio)} {kinds_ratio * 100:.1f}% "
+            f"({progress.kinds_done:,}/{progress.kinds_total:,})\n"
+            f"個数 {_progress_bar(progress.ratio)} {progress.ratio * 100:.1f}% "
+            f"({progress.count_done:,}/{progress.count_total:,})")
+
+
+# ページネーション
+# ボタンの custom_id に設計図名・絞り込み・ページ・バージョン・表示したユーザーを埋め込み、
+# 押されたときに共有の設計図キャッシュからそのページだけを作る。Viewはアイテムを保持しないので、
+# 開いているメッセージの数に関係なくメモリは増えず、BOTを再起動してもボタンは動く。
+ITEMS_PER_PAGE = 20
+_CHECK_CODES = {"all": "a", "finished": "f", "unfinished": "u"}
+_CHECK_NAMES = {code: check for check, code in _CHECK_CODES.items()}
+# Discordの custom_id は100文字まで。収まらない設計図名はハッシュで埋め込む
+_CUSTOM_ID_LIMIT = 100
+
+
+def _version_token(version):
+    return hashlib.sha1(repr(version).encode("utf-8")).hexdigest()[:8]
+
+
+def _title_token(list_title):
+    return "#" + hashlib.sha1(list_title.encode("utf-8")).hexdigest()[:16]
+
+
+def _list_page(blueprint, check, page):
+    # 個数の多い順に並べた行（絞り込みがあれば一致する行だけ）からページの範囲を切り出す
+    progress = blueprint.progress
+    if check == "all":
+        total, count_total = progress.kinds_total, progress.count_total
+        order = blueprint.count_order
+    else:
+        wanted = check == "finished"
+        if wanted:
+            total, count_total = progress.kinds_done, progress.count_done
+        else:
+            total = progress.kinds_total - progress.kinds_done
+            count_total = progress.count_total - progress.count_done
+        order = blueprint.filtered_order(wanted)
+    total_pages = max((total - 1) // ITEMS_PER_PAGE + 1, 1)
+    page = min(max(page, 0), total_pages - 1)
+    start = page * ITEMS_PER_PAGE
+    indices = order[start:start + ITEMS_PER_PAGE]
+    return page, total_pages, total, count_total, indices
+
+
+def _render_list_page(blueprint, check, page, user, title, stale=False):
+    # 一覧の1ページ分のEmbedを作り、(Embed, ページ, ページ数) を返す
+    page, total_pages, total, count_total, indices = _list_page(blueprint, check, page)
+    
+    # "all"の場合は適切なステータステキストを設定
+    if check == "all":
+        status_text = "全て"
+    else:
+        status_text = "完了済み" if check == "finished" else "未完了"
+    
+    description = f"**{total}個**のアイテムが表示されています。(ページ {page + 1}/{total_pages})"
+    if stale:
+        description += "\n※ 設計図が更新されたため、最新の内容を表示しています"
+    embed = discord.Embed(
+        title=f"{title} - {status_text}アイテム一覧",
+        description=description,
+        color=0x00FF00 if check == "finished" else (0x0000FF if check == "unfinished" else 0x9932CC)  # allは紫色
+    )
+    
+    start_idx = page * ITEMS_PER_PAGE
+    for position, i in enumerate(indices, start_idx + 1):
+        formatted_count = f"{blueprint.counts[i]:,}" if blueprint.has_numeric_count(i) else blueprint.count_text(i)
+        check_mark = "✅" if blueprint.checked[i] else "❌"
+        embed.add_field(
+            name=f"{position}. {blueprint.names[i]}",
+            value=f"{check_mark} {formatted_count}個",
+            inline=True
+        )
+    
+    # このページの合計
+    page_total = sum(blueprint.counts[i] for i in indices)
+    embed.add_field(
+        name=f"このページの合計",
+        value=f"**{page_total:,}個**のアイテム",
+        inline=False
+    )
+    
+    # 全体の合計
+    embed.add_field(
+        name="総合計",
+        value=f"**{count_total:,}個**のアイテム",
+        inline=False
+    )
+    
+    embed.set_author(name=user.name, icon_url=user.display_avatar.url)
+    embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+    return embed, page, total_pages
+
+
+def build_list_page(blueprint, check, page, user, stale=False):
+    """
+    保存済みの設計図の一覧の1ページ分のEmbedと、前後のページに移動するボタンのViewを作る
+    """
+    embed, page, total_pages = _render_list_page(blueprint, check, page, user, blueprint.title, stale)
+    
+    # ボタンは状態を持たないので、タイムアウトさせない
+    view = discord.ui.View(timeout=None)
+    version = _version_token(blueprint.version)
+    view.add_item(ListPageButton("prev", blueprint.title, check, page - 1, version, user.id,
+                                 disabled=page == 0))
+    view.add_item(ListPageButton("next", blueprint.title, check, page + 1, version, user.id,
+                                 disabled=page >= total_pages - 1))
+    return embed, view
+
+
+class ListPageButton(discord.ui.DynamicItem[discord.ui.Button],
+                     template=r"lml:(?P<direction>prev|next):(?P<check>[afu]):(?P<page>-?\d+):"
+                              r"(?P<version>[0-9a-f]{8}):(?P<user>\d+):(?P<title>.+)"):
+    def __init__(self, direction, list_title, check, page, version, user_id, disabled=False):
+        self.direction = direction
         self.list_title = list_title
-        self.user = interaction_user
-        self.total_pages = (len(items) - 1) // self.items_per_page + 1
+        self.check = check
+        self.page = page
+        self.version = version
+        self.user_id = user_id
         
-        # 最初のページでは前へボタンを無効化
-        self.update_button_states()
+        prefix = f"lml:{direction}:{_CHECK_CODES[check]}:{page}:{version}:{user_id}:"
+        title = list_title if len(prefix) + len(list_title) <= _CUSTOM_ID_LIMIT else _title_token(list_title)
+        super().__init__(discord.ui.Button(
+            label="前へ" if direction == "prev" else "次へ",
+            style=discord.ButtonStyle.primary,
+            emoji="⬅️" if direction == "prev" else "➡️",
+            custom_id=prefix + title,
+            disabled=disabled
+        ))
+    
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        list_title = match["title"]
+        if list_title.startswith("#"):
+            # ハッシュで埋め込んだ設計図名は、この名前空間の設計図名から探す
+            titles = await run_io(blueprint_cache.titles, blueprint_namespace(interaction))
+            list_title = next((title for title in titles if _title_token(title) == list_title), list_title)
+        return cls(match["direction"], list_title, _CHECK_NAMES[match["check"]], int(match["page"]),
+                   match["version"], int(match["user"]))
+    
+    async def callback(self, interaction: discord.Interaction):
+        # 権限チェック
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("このボタンは使用できません。", ephemeral=True)
+            return
+        
+        try:
+            blueprint = await run_io(blueprint_cache.get, blueprint_namespace(interaction), self.list_title)
+        except FileNotFoundError:
+            await interaction.response.send_message(f"設計図 `{self.list_title}` が見つかりません。", ephemeral=True)
+            return
+        
+        # 表示した後に設計図が変わっていても、最新の内容でページを作り直す
+        stale = _version_token(blueprint.version) != self.version
+        embed, view = build_list_page(blueprint, self.check, self.page, interaction.user, stale=stale)
+        await interaction.response.edit_message(embed=embed, view=view)
+
+
+# 保存しない合算結果のページネーション用のViewクラス
+# 合算結果は保存先にないので、列形式の設計図としてこのViewだけが保持する
+class MergePaginationView(discord.ui.View):
+    def __init__(self, blueprint, check, label, user):
+        super().__init__(timeout=180)  # 3分間のタイムアウト
+        self.blueprint = blueprint
+        self.check = check
+        self.label = label
+        self.user = user
+        self.current_page = 0
+        self.total_pages = 1
     
-    def update_button_states(self):
-        # 前へボタン（最初のページでは無効）
+    def create_embed(self):
+        embed, self.current_page, self.total_pages = _render_list_page(
+            self.blueprint, self.check, self.current_page, self.user, self.label
+        )
+        # 前へボタン（最初のページでは無効）・次へボタン（最後のページでは無効）
         self.children[0].disabled = (self.current_page == 0)
-        # 次へボタン（最後のページでは無効）
         self.children[1].disabled = (self.current_page >= self.total_pages - 1)
+        return embed
     
     @discord.ui.button(label="前へ", style=discord.ButtonStyle.primary, emoji="⬅️")
     async def previous_button(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -43,11 +332,7 @@ class ItemPaginationView(discord.ui.View):
             return
         
         self.current_page -= 1
-        self.update_button_states()
-        
-        # 新しいページのEmbedを作成
-        embed = self.create_embed()
-        await interaction.response.edit_message(embed=embed, view=self)
+        await interaction.response.edit_message(embed=self.create_embed(), view=self)
     
     @discord.ui.button(label="次へ", style=discord.ButtonStyle.primary, emoji="➡️")
     async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -57,73 +342,15 @@ class ItemPaginationView(discord.ui.View):
             return
         
         self.current_page += 1
-        self.update_button_states()
-        
-        # 新しいページのEmbedを作成
-        embed = self.create_embed()
-        await interaction.response.edit_message(embed=embed, view=self)
-    
-    def create_embed(self):
-        start_idx = self.current_page * self.items_per_page
-        end_idx = min(start_idx + self.items_per_page, len(self.items))
-        
-        # "all"の場合は適切なステータステキストを設定
-        if self.check_status == "all":
-            status_text = "全て"
-        else:
-            status_text = "完了済み" if self.check_status == "finished" else "未完了"
-        
-        embed = discord.Embed(
-            title=f"{self.list_title} - {status_text}アイテム一覧",
-            description=f"**{len(self.items)}個**のアイテムが表示されています。(ページ {self.current_page + 1}/{self.total_pages})",
-            color=0x00FF00 if self.check_status == "finished" else (0x0000FF if self.check_status == "unfinished" else 0x9932CC)  # allは紫色
-        )
-        
-        counter = start_idx
-        page_total = 0
-        
-        for name, count, checked in self.items[start_idx:end_idx]:
-            if count.isdigit():
-                page_total += int(count)
-                formatted_count = f"{int(count):,}"
-            else:
-                formatted_count = count
-            
-            counter += 1
-            check_mark = "✅" if checked else "❌"
-            embed.add_field(
-                name=f"{counter}. {name}",
-                value=f"{check_mark} {formatted_count}個",
-                inline=True
-            )
-        
-        # このページの合計
-        embed.add_field(
-            name=f"このページの合計",
-            value=f"**{page_total:,}個**のアイテム",
-            inline=False
-        )
-        
-        # 全体の合計
-        total_sum = sum(int(count) for _, count, _ in self.items if count.isdigit())
-        embed.add_field(
-            name="総合計",
-            value=f"**{total_sum:,}個**のアイテム",
-            inline=False
-        )
-        
-        embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
-        embed.set_author(name=self.user.name, icon_url=self.user.display_avatar.url)
-        
-        return embed
+        await interaction.response.edit_message(embed=self.create_embed(), view=self)
 
 
 # 設計図削除確認用のViewクラス
 class DeleteConfirmView(discord.ui.View):
-    def __init__(self, list_title, csv_file_path, user):
+    def __init__(self, namespace, list_title, user):
         super().__init__(timeout=60)  # 60秒のタイムアウト
+        self.namespace = namespace
         self.list_title = list_title
-        self.csv_file_path = csv_file_path
         self.user = user
     
     @discord.ui.button(label="削除する", style=discord.ButtonStyle.danger, emoji="🗑️")
@@ -134,13 +361,16 @@ class DeleteConfirmView(discord.ui.View):
             return
         
         try:
-            # ファイルを直接削除（バックアップなし）
-            os.remove(self.csv_file_path)
+            # 削除した版もスナップショットに記録されるので /litematica-undo で戻せる
+            async with blueprint_lock(self.namespace, self.list_title):
+                await run_io(blueprint_cache.delete, self.namespace, self.list_title)
             
             # 成功時のembedを作成
             embed = discord.Embed(
                 title="✅ 設計図削除完了",
-                description=f"設計図 `{self.list_title}` を削除しました。",
+                description=f"設計図 `{self.list_title}` を削除しました。" + (
+                    "\n`/litematica-undo` で削除前の状態に戻せます。" if blueprint_cache.snapshots is not None else ""
+                ),
                 color=0x00FF00  # 成功は緑色
             )
             embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
@@ -152,6 +382,7 @@ class DeleteConfirmView(discord.ui.View):
             await interaction.response.edit_message(embed=embed, view=self)
             
         except Exception as e:
+            log_failure(logger, "delete_confirm", e)
             embed = discord.Embed(
                 title="❌ 設計図削除失敗",
                 description=f"削除処理中にエラーが発生しました: `{str(e)}`",
@@ -185,30 +416,23 @@ class DeleteConfirmView(discord.ui.View):
 
 
 def setup(bot: commands.Bot):
-    @bot.tree.command(name="litematica-add", description="litematicaの材料ファイルを追加します")
-    async def litematica_add(interaction: discord.Interaction, matica_title: str, file: discord.Attachment):
-        await interaction.response.defer()
-        
-        # 処理開始を示すembedを作成
-        embed = discord.Embed(
-            title="litematicaファイル処理中",
-            description="ファイルをアップロード中です...",
-            color=0xFFFF00  # 処理中は黄色
-        )
-        embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
-        processing_msg = await interaction.followup.send(embed=embed)
+    # 一覧のページ送りボタン（再起動前に送ったメッセージのボタンも受け付ける）
+    bot.add_dynamic_items(ListPageButton)
+    
+    @bot.tree.command(name="litematica-add", description="litematicaの材料ファイル（または.litematicファイル）を追加します")
+    @app_commands.describe(update="同じ名前の設計図があれば差分だけを反映し、チェック状態を引き継ぐ")
+    @instrument("command")
+    async def litematica_add(
+        interaction: discord.Interaction,
+        matica_title: str,
+        file: discord.Attachment,
+        update: bool = False
+    ):
+        # 処理がすぐ終われば defer せずに1回の呼び出しで応答する
+        reply = Reply(interaction)
         
         try:
-            # ディレクトリが存在しない場合は作成
-            blueprint_dir = os.path.join(os.path.dirname(__file__), "blueprint")
-            os.makedirs(blueprint_dir, exist_ok=True)
-            
-            # 元のファイルを保存（一時ファイルとして）
-            temp_file_path = os.path.join(blueprint_dir, file.filename)
-            await file.save(temp_file_path)
-            
             csv_file_name = f"{matica_title}.csv"
-            csv_file_path = os.path.join(blueprint_dir, csv_file_name)
             
             # 成功時のembedを更新
             embed = discord.Embed(
@@ -216,84 +440,68 @@ def setup(bot: commands.Bot):
                 description=f"`{file.filename}`を追加しました\nCSV形式に変換しています...",
                 color=0x00FF00  # 成功は緑色
             )
-
-            # 複数のエンコーディングを試す
-            encodings_to_try = ['utf-8', 'shift_jis', 'cp932', 'latin1']
-            lines = None
             
             embed.add_field(name="タイトル", value=f"{matica_title}", inline=False)
-
-            for encoding in encodings_to_try:
-                try:
-                    with open(temp_file_path, encoding=encoding) as f:
-                        lines = f.readlines()
-                        embed.add_field(name="エンコーディング", value=f"`{encoding}`で正常に読み込みました", inline=False)
-                        break
-                except UnicodeDecodeError:
-                    continue
-            
-            # 読み込みに失敗した場合
-            if lines is None:
-                raise UnicodeDecodeError("すべてのエンコーディングで読み込みに失敗しました")
-            
-            litematica_data = []
-            header_pattern = re.compile(r'\|\s*(.*?)\s*\|\s*(.*?)\s*\|\s*(.*?)\s*\|\s*(.*?)\s*\|')
-            row_pattern = re.compile(r'\|\s*(.*?)\s*\|\s*(\d+)\s*\|\s*(\d+)\s*\|\s*(\d+)\s*\|')
-
-            # 最初にヘッダー行を追加
-            litematica_data.append(["Item", "Total", "check"])
-            
-            # データ行を処理
-            header_found = False
-            
-            for line in lines:
-                # ヘッダー行を検出（一度検出したら重複して追加しない）
-                if not header_found and ('Item' in line and 'Total' in line):
-                    header_found = True
-                    continue
+            
+            # 読み込む前にサイズの上限を確認する
+            parse_pool.check_size(file.size)
+            
+            namespace = blueprint_namespace(interaction)
+            async with parse_pool.slot(namespace):
+                # 添付ファイルはディスクに保存せずメモリ上で処理する
+                data = await file.read()
                 
-                # データ行の処理
-                match = row_pattern.match(line)
-                if match:
-                    # データ行にデフォルト値 "0" のcheck列を追加（アイテム名と数量のみ抽出）
-                    item_name = match.group(1).strip()
-                    item_count = match.group(2).strip()
-                    
-                    # 空でないアイテム名と数量のある行のみ追加
-                    if item_name and item_count:
-                        row = [item_name, item_count, "0"]
-                        litematica_data.append(row)
-            
-            # CSVとして保存（UTF-8で）
-            with open(csv_file_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerows(litematica_data)
-            
-            # Total列の合計値を計算
-            total_sum = 0
-            for row in litematica_data[1:]:  # ヘッダー行をスキップ
+                # 大きなファイルはプロセスプールで解析し、「処理中」のEmbedで進み具合を表示する
+                progress = ParseProgress(len(data))
+                updater = None
+                if parse_pool.uses_processes(len(data)):
+                    await reply.send(embed=_parse_progress_embed(file.filename, progress))
+                    updater = asyncio.create_task(_update_parse_progress(reply, file.filename, progress))
                 try:
-                    # 2番目の要素がTotal値
-                    if len(row) > 1 and row[1].isdigit():
-                        total_sum += int(row[1])
-                except (ValueError, IndexError):
-                    # 数値変換できない場合や配列のインデックスが存在しない場合はスキップ
-                    continue
+                    rows, encoding = await parse_pool.parse(file.filename, data, progress)
+                finally:
+                    if updater is not None:
+                        updater.cancel()
+                del data
+            
+            # 解析した行を保存（キャッシュも更新）
+            async with blueprint_lock(namespace, matica_title):
+                blueprint, diff = await run_io(_store_material_list, namespace, matica_title, rows, update)
+            if encoding == "litematic":
+                embed.add_field(name="形式", value="`.litematic`の設計図からブロック数を集計しました", inline=False)
+            else:
+                embed.add_field(name="エンコーディング", value=f"`{encoding}`で正常に読み込みました", inline=False)
             
-            os.remove(temp_file_path)  # コメントアウトすると元のファイルも保持します
+            # Total列の合計値（読み込み時に集計済み）
+            total_sum = blueprint.progress.count_total
+            
+            if diff is not None:
+                embed.title = "✅ 設計図更新成功"
+                embed.description = f"`{file.filename}`の内容で設計図を更新しました"
+                embed.add_field(
+                    name="差分",
+                    value=f"追加 {len(diff.added)} 件 / 削除 {len(diff.removed)} 件 / "
+                          f"個数変更 {len(diff.changed)} 件 / 変更なし {diff.unchanged} 件",
+                    inline=False
+                )
+                if diff.unchecked:
+                    embed.add_field(name="チェック解除", value=f"個数が増えた {diff.unchecked} 件のチェックを外しました",
+                                    inline=False)
+                embed.add_field(name="変更内容", value=_diff_text(diff), inline=False)
             
             embed.add_field(name="処理結果", value="ファイルの解析とCSV変換が完了しました", inline=False)
             embed.add_field(name="元ファイル", value=f"`{file.filename}`", inline=False)
             embed.add_field(name="保存名", value=f"`{csv_file_name}`", inline=True)
-            embed.add_field(name="総アイテム数", value=f"{len(litematica_data) - 1} 種類", inline=True)
+            embed.add_field(name="総アイテム数", value=f"{len(blueprint.rows)} 種類", inline=True)
             embed.add_field(name="総アイテム個数", value=f"{total_sum:,} 個", inline=True)
             embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
             embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
             embed.set_thumbnail(url=interaction.user.display_avatar.url)
             
-            await processing_msg.edit(embed=embed)
+            await reply.send(embed=embed)
             
         except Exception as e:
+            log_failure(logger, "litematica_add", e)
             # エラー時のembedを更新
             embed = discord.Embed(
                 title="❌ litematicaファイル追加失敗",
@@ -303,58 +511,34 @@ def setup(bot: commands.Bot):
             embed.set_footer(text="ShirafukasBOT")
             embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
             
-            await processing_msg.edit(embed=embed)
+            await reply.send(embed=embed)
     
     @bot.tree.command(name="litematica-list", description="litematicaの材料ファイルを一覧表示します")
     @app_commands.autocomplete(list_title=autocomplete_litematica_list)
     @app_commands.autocomplete(check=autocomplete_list_check)
+    @instrument("command")
     async def litematica_list(interaction: discord.Interaction, list_title: str, check: str):
-        await interaction.response.defer()
-        
-        # 処理開始を示すembedを作成
-        embed = discord.Embed(
-            title=f"設計図の取得中: {list_title}",
-            description="CSVファイルを読み込んでいます...",
-            color=0xFFFF00  # 処理中は黄色
-        )
-        embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
-        processing_msg = await interaction.followup.send(embed=embed)
+        # 処理がすぐ終われば defer せずに1回の呼び出しで応答する
+        reply = Reply(interaction)
         
         try:
-            # CSVファイルのパス
-            blueprint_dir = os.path.join(os.path.dirname(__file__), "blueprint")
-            csv_file_path = os.path.join(blueprint_dir, f"{list_title}.csv")
-            
-            if not os.path.exists(csv_file_path):
-                raise FileNotFoundError(f"ファイル {list_title}.csv が見つかりません。")
-            
-            # CSVファイルを読み込む
-            items = []
-            with open(csv_file_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                header = next(reader)  # ヘッダー行をスキップ
-                
-                for row in reader:
-                    if len(row) >= 3:  # Item, Total, check の3つの列があるか確認
-                        item_name = row[0]
-                        total = row[1] if len(row[1]) > 0 else "0"
-                        
-                        # check列の値を確認 (0=未完了、1=完了)
-                        check_value = row[2].strip() if len(row) > 2 else "0"
-                        checked = check_value == "1"  # "1"の場合のみ完了とみなす
-                        
-                        # checkパラメータに応じたフィルタリング
-                        if check == "all" or (check == "finished" and checked) or (check == "unfinished" and not checked):
-                            items.append((item_name, total, checked))
-            
-            if len(items) > 0:
-                # アイテム数でソート（多い順）
-                items.sort(key=lambda x: int(x[1]) if x[1].isdigit() else 0, reverse=True)
-                
-                # ページネーションViewを作成
-                view = ItemPaginationView(items, check, list_title, interaction.user)
-                embed = view.create_embed()
-                await processing_msg.edit(embed=embed, view=view)
+            # 設計図を読み込む（キャッシュ経由）
+            blueprint = await run_io(blueprint_cache.get, blueprint_namespace(interaction), list_title)
+            
+            if check not in _CHECK_CODES:
+                raise ValueError("check には all・finished・unfinished のいずれかを指定してください。")
+            
+            # チェック状態ごとの件数は集計済みなので、行を走査せずに判定できる
+            progress = blueprint.progress
+            if check == "all":
+                matched = progress.kinds_total
+            else:
+                matched = progress.kinds_done if check == "finished" else progress.kinds_total - progress.kinds_done
+            
+            if matched > 0:
+                # 最初のページを作成（アイテム数の多い順。以降のページはボタンが押されたときに作る）
+                embed, view = build_list_page(blueprint, check, 0, interaction.user)
+                await reply.send(embed=embed, view=view)
             else:
                 # アイテムがない場合
                 status_text = "完了済み" if check == "finished" else ("未完了" if check == "unfinished" else "該当する")
@@ -371,9 +555,10 @@ def setup(bot: commands.Bot):
                 embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
                 embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
                 
-                await processing_msg.edit(embed=embed)
+                await reply.send(embed=embed)
             
         except Exception as e:
+            log_failure(logger, "litematica_list", e)
             # エラー時のembedを更新
             embed = discord.Embed(
                 title="❌ リスト表示失敗",
@@ -383,90 +568,29 @@ def setup(bot: commands.Bot):
             embed.set_footer(text="ShirafukasBOT")
             embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
             
-            await processing_msg.edit(embed=embed)
+            await reply.send(embed=embed)
     
     @bot.tree.command(name="litematica-check", description="litematicaの素材のチェック状態を変更します")
     @app_commands.autocomplete(list_title=autocomplete_litematica_list)
     @app_commands.autocomplete(item_name=autocomplete_item_name)
     @app_commands.autocomplete(check_status=autocomplete_check_status)
+    @instrument("command")
     async def litematica_check(
         interaction: discord.Interaction, 
         list_title: str, 
         item_name: str, 
         check_status: str
     ):
-        await interaction.response.defer()
-        
-        # 処理開始を示すembedを作成
-        embed = discord.Embed(
-            title=f"チェック状態更新中: {list_title}",
-            description="CSVファイルを編集しています...",
-            color=0xFFFF00  # 処理中は黄色
-        )
-        embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
-        processing_msg = await interaction.followup.send(embed=embed)
+        # 処理がすぐ終われば defer せずに1回の呼び出しで応答する
+        reply = Reply(interaction)
         
         try:
-            # CSVファイルのパス
-            blueprint_dir = os.path.join(os.path.dirname(__file__), "blueprint")
-            csv_file_path = os.path.join(blueprint_dir, f"{list_title}.csv")
-            
-            if not os.path.exists(csv_file_path):
-                raise FileNotFoundError(f"ファイル {list_title}.csv が見つかりません。")
-            
-            # CSVファイルを読み込み、編集する
-            rows = []
-            item_found = False
-            item_index = -1
-            original_check_value = ""
-            
-            with open(csv_file_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                rows = list(reader)  # すべての行を一度にリストに読み込む
-                
-                # ヘッダー行を確認（0行目）
-                if len(rows) > 0 and len(rows[0]) >= 3:
-                    if rows[0][0] != "Item" or rows[0][2] != "check":
-                        # 必要に応じてヘッダーを修正
-                        rows[0] = ["Item", "Total", "check"]
-                
-                # アイテムを検索して状態を更新
-                for i, row in enumerate(rows):
-                    if i == 0:  # ヘッダー行はスキップ
-                        continue
-                        
-                    if len(row) >= 1 and row[0] == item_name:
-                        item_found = True
-                        item_index = i
-                        
-                        # check列があるか確認
-                        if len(row) >= 3:
-                            original_check_value = row[2]
-                            # 状態を更新
-                            if check_status == "done":
-                                row[2] = "1"
-                            else:  # undone
-                                row[2] = "0"
-                        else:
-                            # check列がない場合は追加
-                            while len(row) < 3:
-                                row.append("")
-                            original_check_value = row[2]
-                            if check_status == "done":
-                                row[2] = "1"
-                            else:  # undone
-                                row[2] = "0"
-                                
-                        rows[i] = row
-                        break
-            
-            if not item_found:
-                raise ValueError(f"アイテム '{item_name}' が {list_title}.csv 内に見つかりませんでした。")
-            
-            # 更新したCSVを保存
-            with open(csv_file_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerows(rows)
+            # チェック状態を更新して保存（キャッシュも更新）
+            namespace = blueprint_namespace(interaction)
+            async with blueprint_lock(namespace, list_title):
+                row, original_check_value = await run_io(
+                    blueprint_cache.update_check, namespace, list_title, item_name, check_status == "done"
+                )
             
             # 成功時のembedを作成
             status_text = "完了" if check_status == "done" else "未完了"
@@ -480,19 +604,20 @@ def setup(bot: commands.Bot):
             
             embed.add_field(name="アイテム名", value=f"`{item_name}`", inline=True)
             embed.add_field(name="変更前", value=f"{previous_status} ({original_check_value})", inline=True)
-            embed.add_field(name="変更後", value=f"{status_text} ({rows[item_index][2]})", inline=True)
+            embed.add_field(name="変更後", value=f"{status_text} ({row[2]})", inline=True)
             
             # アイテムの個数も表示
-            if len(rows[item_index]) >= 2 and rows[item_index][1].isdigit():
-                total = int(rows[item_index][1])
+            if row[1].isdigit():
+                total = int(row[1])
                 embed.add_field(name="必要個数", value=f"{total:,} 個", inline=False)
             
             embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
             embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
             
-            await processing_msg.edit(embed=embed)
+            await reply.send(embed=embed)
             
         except Exception as e:
+            log_failure(logger, "litematica_check", e)
             # エラー時のembedを更新
             embed = discord.Embed(
                 title="❌ チェック状態更新失敗",
@@ -502,52 +627,409 @@ def setup(bot: commands.Bot):
             embed.set_footer(text="ShirafukasBOT")
             embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
             
-            await processing_msg.edit(embed=embed)
+            await reply.send(embed=embed)
     
-    @bot.tree.command(name="litematica-delete", description="litematicaの設計図を削除します")
+    @bot.tree.command(name="litematica-check-bulk", description="litematicaの素材のチェック状態をまとめて変更します")
+    @app_commands.describe(
+        items="アイテム名（カンマ区切りで複数指定）",
+        pattern="アイテム名に含まれる文字列（* ? を使うとワイルドカードで名前全体と照合）",
+        max_count="未完了のうち必要個数がこの値以下のアイテムをすべて対象にする"
+    )
     @app_commands.autocomplete(list_title=autocomplete_litematica_list)
-    async def litematica_delete(interaction: discord.Interaction, list_title: str):
-        await interaction.response.defer()
+    @app_commands.autocomplete(check_status=autocomplete_check_status)
+    @instrument("command")
+    async def litematica_check_bulk(
+        interaction: discord.Interaction,
+        list_title: str,
+        check_status: str,
+        items: Optional[str] = None,
+        pattern: Optional[str] = None,
+        max_count: Optional[int] = None
+    ):
+        # 処理がすぐ終われば defer せずに1回の呼び出しで応答する
+        reply = Reply(interaction)
+        
+        try:
+            if items is None and pattern is None and max_count is None:
+                raise ValueError("items・pattern・max_count のいずれかを指定してください。")
+            
+            names = [name.strip() for name in items.split(",") if name.strip()] if items else []
+            
+            # 対象の選択と更新を1回の書き込みで行う
+            namespace = blueprint_namespace(interaction)
+            async with blueprint_lock(namespace, list_title):
+                matched, changed, not_found = await run_io(
+                    _bulk_check, namespace, list_title, names, pattern, max_count, check_status == "done"
+                )
+            
+            status_text = "完了" if check_status == "done" else "未完了"
+            embed = discord.Embed(
+                title="✅ チェック状態一括更新成功" if matched else "ℹ️ 対象のアイテムがありません",
+                description=f"`{list_title}` の **{len(matched)}件** のアイテムを{status_text}にしました",
+                color=0x00FF00 if matched else 0x808080
+            )
+            embed.add_field(name="対象", value=f"{len(matched)} 件", inline=True)
+            embed.add_field(name="変更", value=f"{len(changed)} 件", inline=True)
+            embed.add_field(name="変更なし", value=f"{len(matched) - len(changed)} 件", inline=True)
+            
+            if changed:
+                # 変更したアイテムは最大20件まで表示
+                shown = "\n".join(f"`{row[0]}` ({int(row[1]):,}個)" if row[1].isdigit() else f"`{row[0]}`"
+                                  for row in changed[:20])
+                if len(changed) > 20:
+                    shown += f"\n…ほか {len(changed) - 20} 件"
+                embed.add_field(name="変更したアイテム", value=shown, inline=False)
+            if not_found:
+                embed.add_field(
+                    name="見つからなかったアイテム",
+                    value=", ".join(f"`{name}`" for name in not_found[:20]),
+                    inline=False
+                )
+            
+            embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+            embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+            
+            await reply.send(embed=embed)
+            
+        except Exception as e:
+            log_failure(logger, "litematica_check_bulk", e)
+            embed = discord.Embed(
+                title="❌ チェック状態一括更新失敗",
+                description=f"処理中にエラーが発生しました: `{str(e)}`",
+                color=0xFF0000  # エラーは赤色
+            )
+            embed.set_footer(text="ShirafukasBOT")
+            embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+            
+            await reply.send(embed=embed)
+    
+    @bot.tree.command(name="litematica-merge", description="複数の設計図の材料を合算して表示します")
+    @app_commands.describe(
+        list_titles="合算する設計図（カンマ区切りで複数指定）",
+        check="表示するアイテム（unfinished は残り数、finished と all は必要数を表示）",
+        save_as="合算した結果を新しい設計図として保存する名前"
+    )
+    @app_commands.autocomplete(list_titles=autocomplete_litematica_lists)
+    @app_commands.autocomplete(check=autocomplete_list_check)
+    @instrument("command")
+    async def litematica_merge(
+        interaction: discord.Interaction,
+        list_titles: str,
+        check: str = "unfinished",
+        save_as: Optional[str] = None
+    ):
+        # 処理がすぐ終われば defer せずに1回の呼び出しで応答する
+        reply = Reply(interaction)
+        
+        try:
+            # 重複を除き、指定した順に並べる
+            titles = list(dict.fromkeys(title.strip() for title in list_titles.split(",") if title.strip()))
+            if not titles:
+                raise ValueError("合算する設計図を指定してください。")
+            if save_as and save_as in titles:
+                raise ValueError("合算する設計図と同じ名前では保存できません。")
+            
+            namespace = blueprint_namespace(interaction)
+            if save_as:
+                async with blueprint_lock(namespace, save_as):
+                    merged = await run_io(_merge_lists, namespace, titles, check, save_as)
+            else:
+                merged = await run_io(_merge_lists, namespace, titles, check, save_as)
+            
+            label = " + ".join(titles)
+            if len(label) > 100:
+                label = f"{len(titles)}件の設計図の合算"
+            content = f"💾 合算した結果を `{save_as}` として保存しました" if save_as else None
+            
+            if len(merged.names) > 0:
+                if save_as:
+                    # 保存した設計図は /litematica-list と同じ状態を持たないボタンでページを送る
+                    embed, view = build_list_page(merged, check, 0, interaction.user)
+                else:
+                    # ページネーションViewを作成（アイテム数の多い順に並べ替えられる）
+                    view = MergePaginationView(merged, check, label, interaction.user)
+                    embed = view.create_embed()
+                await reply.send(content=content, embed=embed, view=view)
+            else:
+                status_text = "完了済み" if check == "finished" else ("未完了" if check == "unfinished" else "該当する")
+                embed = discord.Embed(
+                    title=f"{label} - {status_text}アイテム一覧",
+                    description=f"**0個**のアイテムが{status_text}状態です。",
+                    color=0x00FF00 if check == "finished" else (0x0000FF if check == "unfinished" else 0x9932CC)
+                )
+                embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+                embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+                
+                await reply.send(content=content, embed=embed)
+            
+        except Exception as e:
+            log_failure(logger, "litematica_merge", e)
+            embed = discord.Embed(
+                title="❌ 設計図の合算失敗",
+                description=f"処理中にエラーが発生しました: `{str(e)}`",
+                color=0xFF0000  # エラーは赤色
+            )
+            embed.set_footer(text="ShirafukasBOT")
+            embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+            
+            await reply.send(embed=embed)
+    
+    @bot.tree.command(name="litematica-export", description="設計図をCSV・JSON・材料リストのファイルとして書き出します")
+    @app_commands.describe(
+        format="書き出す形式（csv / json / txt）",
+        check="書き出すアイテム（all / finished / unfinished）",
+        compress="gzipで圧縮する（大きな設計図向け）"
+    )
+    @app_commands.autocomplete(list_title=autocomplete_litematica_list)
+    @app_commands.autocomplete(format=autocomplete_export_format)
+    @app_commands.autocomplete(check=autocomplete_list_check)
+    @instrument("command")
+    async def litematica_export(
+        interaction: discord.Interaction,
+        list_title: str,
+        format: str = "csv",
+        check: str = "all",
+        compress: bool = False
+    ):
+        # 処理がすぐ終われば defer せずに1回の呼び出しで応答する
+        reply = Reply(interaction)
+        
+        try:
+            if check not in ("all", "finished", "unfinished"):
+                raise ValueError("check には all・finished・unfinished のいずれかを指定してください。")
+            
+            # ファイルはディスクに書かずメモリ上で作る
+            blueprint = await run_io(blueprint_cache.get, blueprint_namespace(interaction), list_title)
+            buffer, filename = await run_io(export_blueprint, blueprint, format, check, compress)
+            size = buffer.getbuffer().nbytes
+            
+            embed = discord.Embed(
+                title="✅ 設計図書き出し成功",
+                description=f"`{list_title}` を `{filename}` として書き出しました",
+                color=0x00FF00  # 成功は緑色
+            )
+            embed.add_field(name="形式", value=f"`{format}`" + (" (gzip)" if compress else ""), inline=True)
+            embed.add_field(name="対象", value=f"`{check}`", inline=True)
+            embed.add_field(name="ファイルサイズ", value=f"{size / 1024:,.2f} KB", inline=True)
+            embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+            embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+            
+            await reply.send(embed=embed, file=discord.File(buffer, filename=filename))
+            
+        except Exception as e:
+            log_failure(logger, "litematica_export", e)
+            embed = discord.Embed(
+                title="❌ 設計図書き出し失敗",
+                description=f"処理中にエラーが発生しました: `{str(e)}`",
+                color=0xFF0000  # エラーは赤色
+            )
+            embed.set_footer(text="ShirafukasBOT")
+            embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+            
+            await reply.send(embed=embed)
+    
+    @bot.tree.command(name="litematica-progress", description="設計図ごとの進捗とサーバー全体の進捗を表示します")
+    @app_commands.describe(list_title="詳しく表示する設計図（省略時はすべての設計図の一覧）")
+    @app_commands.autocomplete(list_title=autocomplete_litematica_list)
+    @instrument("command")
+    async def litematica_progress(interaction: discord.Interaction, list_title: Optional[str] = None):
+        # 処理がすぐ終われば defer せずに1回の呼び出しで応答する
+        reply = Reply(interaction)
+        
+        try:
+            # 集計済みの値を使うので、アイテムを数え直さない
+            namespace = blueprint_namespace(interaction)
+            if list_title:
+                # 1つの設計図だけなら名前空間全体は集計しない
+                progress = await run_io(blueprint_cache.progress, namespace, list_title)
+                embed = discord.Embed(
+                    title=f"📈 進捗: {list_title}",
+                    description=_progress_text(progress),
+                    color=0x00FF00 if progress.kinds_done == progress.kinds_total else 0x3498DB
+                )
+            else:
+                progresses = await run_io(blueprint_cache.namespace_progress, namespace)
+                total = Progress()
+                for _, progress in progresses:
+                    total.add(progress)
+                
+                embed = discord.Embed(
+                    title="📈 設計図の進捗",
+                    description=f"**{len(progresses)}件** の設計図があります",
+                    color=0x3498DB
+                )
+                # 完了率の高い順に最大20件まで表示
+                lines = [
+                    f"`{_progress_bar(progress.ratio)}` {progress.ratio * 100:5.1f}% {title}"
+                    for title, progress in sorted(progresses, key=lambda p: (-p[1].ratio, p[0]))[:20]
+                ]
+                if len(progresses) > 20:
+                    lines.append(f"...他 {len(progresses) - 20} 件")
+                embed.add_field(name="設計図ごと（個数）", value="\n".join(lines) or "設計図がありません", inline=False)
+                embed.add_field(name="サーバー全体", value=_progress_text(total), inline=False)
+            
+            embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+            embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+            
+            await reply.send(embed=embed)
+            
+        except Exception as e:
+            log_failure(logger, "litematica_progress", e)
+            embed = discord.Embed(
+                title="❌ 進捗の取得失敗",
+                description=f"処理中にエラーが発生しました: `{str(e)}`",
+                color=0xFF0000  # エラーは赤色
+            )
+            embed.set_footer(text="ShirafukasBOT")
+            embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+            
+            await reply.send(embed=embed)
+    
+    @bot.tree.command(name="litematica-stats", description="BOTの処理時間やキャッシュの統計を表示します（管理者のみ）")
+    @app_commands.default_permissions(administrator=True)
+    @instrument("command")
+    async def litematica_stats(interaction: discord.Interaction):
+        # 権限チェック
+        permissions = getattr(interaction.user, "guild_permissions", None)
+        if permissions is None or not permissions.administrator:
+            await interaction.response.send_message("このコマンドは管理者のみ使用できます。", ephemeral=True)
+            return
         
-        # 処理開始を示すembedを作成
         embed = discord.Embed(
-            title=f"設計図削除の確認: {list_title}",
-            description="削除の確認を行います...",
-            color=0xFFFF00  # 処理中は黄色
+            title="📊 BOT統計",
+            description="起動してからの処理時間（p50 / p99）と回数です",
+            color=0x9932CC
+        )
+        
+        for title, histogram in (("コマンド", COMMAND_DURATION), ("自動補完", AUTOCOMPLETE_DURATION)):
+            lines = []
+            for labels, series in sorted(histogram.series().items()):
+                name = dict(labels).get("name", "")
+                p50 = histogram.quantile(0.50, series) * 1000
+                p99 = histogram.quantile(0.99, series) * 1000
+                lines.append(f"`{name}` {p50:.1f} / {p99:.1f} ms ({series[-1]:,}回)")
+            embed.add_field(name=title, value="\n".join(lines) or "記録なし", inline=False)
+        
+        lookups = blueprint_cache.hits + blueprint_cache.misses
+        hit_ratio = blueprint_cache.hits / lookups * 100 if lookups else 0.0
+        embed.add_field(
+            name="キャッシュ",
+            value=f"ヒット率 {hit_ratio:.1f}% ({blueprint_cache.hits:,}/{lookups:,})\n"
+                  f"{blueprint_cache.current_bytes / 1024 / 1024:.1f} MB",
+            inline=True
+        )
+        
+        bytes_read = sum(value for labels, value in BLUEPRINT_BYTES.samples() if ("direction", "read") in labels)
+        bytes_written = sum(value for labels, value in BLUEPRINT_BYTES.samples() if ("direction", "write") in labels)
+        embed.add_field(
+            name="設計図の読み書き",
+            value=f"読み込み {bytes_read / 1024:,.1f} KB\n書き込み {bytes_written / 1024:,.1f} KB",
+            inline=True
+        )
+        
+        io_metrics = io_executor.metrics()
+        embed.add_field(
+            name="I/Oスレッド",
+            value=f"待ち {io_metrics['queue_depth']} 件（最大 {io_metrics['max_queue_depth']} 件）\n"
+                  f"待ち時間 合計 {io_metrics['wait_seconds'] * 1000:,.1f} ms",
+            inline=True
         )
+        
+        embed.add_field(
+            name="応答",
+            value=f"直接 {RESPONSES.value(mode='direct'):,} 回\ndefer {RESPONSES.value(mode='deferred'):,} 回",
+            inline=True
+        )
+        
+        lag_series = EVENT_LOOP_LAG.series().get((), None)
+        if lag_series:
+            lag_text = (f"p50 {EVENT_LOOP_LAG.quantile(0.50, lag_series) * 1000:.1f} ms / "
+                        f"p99 {EVENT_LOOP_LAG.quantile(0.99, lag_series) * 1000:.1f} ms")
+        else:
+            lag_text = "記録なし"
+        if watchdog is not None:
+            lag_text += f"\n{watchdog.threshold * 1000:.0f} ms 以上の停止 {watchdog.stalls:,} 回"
+        embed.add_field(name="イベントループの遅延", value=lag_text, inline=False)
+        
+        embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
         embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
-        processing_msg = await interaction.followup.send(embed=embed)
+        
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+    
+    @bot.tree.command(name="litematica-profile", description="イベントループのプロファイルを採取します（BOTの所有者のみ）")
+    @app_commands.describe(seconds="採取する秒数（1〜300）")
+    @app_commands.default_permissions(administrator=True)
+    @instrument("command")
+    async def litematica_profile(interaction: discord.Interaction, seconds: app_commands.Range[int, 1, 300] = 30):
+        # プロセス全体を対象にするので、サーバーの管理者ではなくBOTの所有者に限る
+        if not await interaction.client.is_owner(interaction.user):
+            await interaction.response.send_message("このコマンドはBOTの所有者のみ使用できます。", ephemeral=True)
+            return
+        
+        # 採取が終わるまで時間がかかるので、期限までに defer される
+        reply = Reply(interaction, ephemeral=True)
         
         try:
-            # CSVファイルのパス
-            blueprint_dir = os.path.join(os.path.dirname(__file__), "blueprint")
-            csv_file_path = os.path.join(blueprint_dir, f"{list_title}.csv")
+            if watchdog is None:
+                raise ValueError("イベントループの監視が無効になっています（WATCHDOG=0）。")
+            path = await watchdog.profile(seconds)
+            
+            embed = discord.Embed(
+                title="✅ プロファイル採取完了",
+                description=f"{seconds} 秒間のイベントループのスタックを採取しました\n"
+                            "flamegraph.pl や speedscope で読み込めます",
+                color=0x00FF00  # 成功は緑色
+            )
+            embed.add_field(name="保存先", value=f"`{path}`", inline=False)
+            embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+            embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+            
+            await reply.send(embed=embed, file=discord.File(path))
+            
+        except Exception as e:
+            log_failure(logger, "litematica_profile", e)
+            embed = discord.Embed(
+                title="❌ プロファイル採取失敗",
+                description=f"処理中にエラーが発生しました: `{str(e)}`",
+                color=0xFF0000  # エラーは赤色
+            )
+            embed.set_footer(text="ShirafukasBOT")
+            embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
             
-            if not os.path.exists(csv_file_path):
-                raise FileNotFoundError(f"ファイル {list_title}.csv が見つかりません。")
+            await reply.send(embed=embed)
+    
+    @bot.tree.command(name="litematica-delete", description="litematicaの設計図を削除します")
+    @app_commands.autocomplete(list_title=autocomplete_litematica_list)
+    @instrument("command")
+    async def litematica_delete(interaction: discord.Interaction, list_title: str):
+        # 処理がすぐ終われば defer せずに1回の呼び出しで応答する
+        reply = Reply(interaction)
+        
+        try:
+            # 設計図を読み込む（キャッシュ経由）
+            blueprint = await run_io(blueprint_cache.get, blueprint_namespace(interaction), list_title)
             
             # ファイル情報を取得
-            file_size = os.path.getsize(csv_file_path)
-            creation_time = os.path.getctime(csv_file_path)
-            modified_time = os.path.getmtime(csv_file_path)
+            info = await run_io(blueprint_cache.info, blueprint_namespace(interaction), list_title)
+            file_size = info["size"]
+            creation_time = info["created"]
+            modified_time = info["modified"]
             
             # アイテム数を取得
-            item_count = 0
-            with open(csv_file_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                next(reader)  # ヘッダーをスキップ
-                for _ in reader:
-                    item_count += 1
+            item_count = len(blueprint.rows)
             
             # 確認用のembedを作成
             embed = discord.Embed(
                 title=f"⚠️ 設計図削除の確認: {list_title}",
-                description=f"設計図 `{list_title}` を削除しますか？\n**この操作は取り消せません**（バックアップは自動作成されます）",
+                description=f"設計図 `{list_title}` を削除しますか？\n" + (
+                    "削除前の版は保存されるので、`/litematica-undo` で元に戻せます"
+                    if blueprint_cache.snapshots is not None else "**この操作は取り消せません**"
+                ),
                 color=0xFF9900  # 警告は橙色
             )
             
             # ファイル情報を表示
-            embed.add_field(name="ファイル名", value=f"`{os.path.basename(csv_file_path)}`", inline=True)
+            embed.add_field(name="ファイル名", value=f"`{info['name']}`", inline=True)
             embed.add_field(name="ファイルサイズ", value=f"{file_size / 1024:.2f} KB", inline=True)
             embed.add_field(name="アイテム数", value=f"{item_count} 種類", inline=True)
             
@@ -566,10 +1048,11 @@ def setup(bot: commands.Bot):
             embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
             
             # 削除確認用ボタン付きで送信
-            view = DeleteConfirmView(list_title, csv_file_path, interaction.user)
-            await processing_msg.edit(embed=embed, view=view)
+            view = DeleteConfirmView(blueprint_namespace(interaction), list_title, interaction.user)
+            await reply.send(embed=embed, view=view)
             
         except Exception as e:
+            log_failure(logger, "litematica_delete", e)
             # エラー時のembedを更新
             embed = discord.Embed(
                 title="❌ 設計図削除失敗",
@@ -579,4 +1062,98 @@ def setup(bot: commands.Bot):
             embed.set_footer(text="ShirafukasBOT")
             embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
             
-            await processing_msg.edit(embed=embed)
\ No newline at end of file
+            await reply.send(embed=embed)
+
+    async def _restore(interaction: discord.Interaction, reply: Reply, list_title: str, version: Optional[int]):
+        # version を省略した場合は1つ前の版（削除した設計図は削除前の版）に戻す
+        namespace = blueprint_namespace(interaction)
+        async with blueprint_lock(namespace, list_title):
+            blueprint, snapshot = await run_io(blueprint_cache.restore, namespace, list_title, version)
+        
+        embed = discord.Embed(
+            title="✅ 設計図復元成功",
+            description=f"`{list_title}` を版 {snapshot.id} の状態に戻しました",
+            color=0x00FF00  # 成功は緑色
+        )
+        embed.add_field(name="アイテム数", value=f"{len(blueprint.rows)} 種類", inline=True)
+        embed.add_field(name="進捗", value=_progress_text(blueprint.progress), inline=True)
+        embed.add_field(
+            name="版の記録日時",
+            value=datetime.datetime.fromtimestamp(snapshot.created).strftime('%Y-%m-%d %H:%M:%S'),
+            inline=True
+        )
+        embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+        embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+        
+        await reply.send(embed=embed)
+    
+    @bot.tree.command(name="litematica-undo", description="設計図を1つ前の版に戻します（削除した設計図は削除前に戻します）")
+    @app_commands.autocomplete(list_title=autocomplete_litematica_list)
+    @instrument("command")
+    async def litematica_undo(interaction: discord.Interaction, list_title: str):
+        # 処理がすぐ終われば defer せずに1回の呼び出しで応答する
+        reply = Reply(interaction)
+        
+        try:
+            await _restore(interaction, reply, list_title, None)
+            
+        except Exception as e:
+            log_failure(logger, "litematica_undo", e)
+            embed = discord.Embed(
+                title="❌ 設計図復元失敗",
+                description=f"処理中にエラーが発生しました: `{str(e)}`",
+                color=0xFF0000  # エラーは赤色
+            )
+            embed.set_footer(text="ShirafukasBOT")
+            embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+            
+            await reply.send(embed=embed)
+    
+    @bot.tree.command(name="litematica-restore", description="設計図を指定した版に戻します（版を省略すると履歴を表示します）")
+    @app_commands.describe(version="戻す版の番号（省略時は最近の版の一覧を表示）")
+    @app_commands.autocomplete(list_title=autocomplete_litematica_list)
+    @app_commands.autocomplete(version=autocomplete_snapshot_version)
+    @instrument("command")
+    async def litematica_restore(interaction: discord.Interaction, list_title: str, version: Optional[int] = None):
+        # 処理がすぐ終われば defer せずに1回の呼び出しで応答する
+        reply = Reply(interaction)
+        
+        try:
+            if version is not None:
+                await _restore(interaction, reply, list_title, version)
+                return
+            
+            if blueprint_cache.snapshots is None:
+                raise ValueError("スナップショットが無効になっています。")
+            history = await run_io(blueprint_cache.snapshots.history, blueprint_namespace(interaction), list_title, 10)
+            if not history:
+                raise FileNotFoundError(f"{list_title} の履歴がありません。")
+            
+            lines = []
+            for snapshot in history:
+                created = datetime.datetime.fromtimestamp(snapshot.created).strftime('%Y-%m-%d %H:%M:%S')
+                state = "削除" if snapshot.deleted else f"{snapshot.kinds_done}/{snapshot.rows} 種類完了"
+                lines.append(f"`{snapshot.id:>4}` {created}・{snapshot.reason}・{state}")
+            
+            embed = discord.Embed(
+                title=f"🕘 設計図の履歴: {list_title}",
+                description="\n".join(lines),
+                color=0x3498DB
+            )
+            embed.add_field(name="復元方法", value="`/litematica-restore` の `version` に版の番号を指定してください", inline=False)
+            embed.set_footer(text=f"ShirafukasBOT • {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+            embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+            
+            await reply.send(embed=embed)
+            
+        except Exception as e:
+            log_failure(logger, "litematica_restore", e)
+            embed = discord.Embed(
+                title="❌ 設計図復元失敗",
+                description=f"処理中にエラーが発生しました: `{str(e)}`",
+                color=0xFF0000  # エラーは赤色
+            )
+            embed.set_footer(text="ShirafukasBOT")
+            embed.set_author(name=interaction.user.name, icon_url=interaction.user.display_avatar.url)
+            
+            await reply.send(embed=embed)
@@ -0,0 +1,98 @@
+import csv
+import gzip
+import io
+import json
+from typing import BinaryIO, Callable, Dict, Iterator, Tuple
+
+from blueprint_store import Blueprint
+from storage import HEADER
+
+# 形式 → (拡張子, 書き出す関数)
+FORMATS: Dict[str, Tuple[str, Callable[[Blueprint, Iterator[int], io.TextIOBase], None]]] = {}
+
+
+def _register(name: str, extension: str):
+    def decorator(writer):
+        FORMATS[name] = (extension, writer)
+        return writer
+    return decorator
+
+
+def iter_indices(blueprint: Blueprint, check: str = "all") -> Iterator[int]:
+    """
+    check（all / finished / unfinished）に一致する行番号を順に返す
+    """
+    if check == "all":
+        return iter(range(len(blueprint.names)))
+    wanted = check == "finished"
+    return (i for i, flag in enumerate(blueprint.checked) if bool(flag) == wanted)
+
+
+@_register("csv", "csv")
+def write_csv(blueprint: Blueprint, indices: Iterator[int], stream: io.TextIOBase) -> None:
+    # 保存先のCSVと同じ形式
+    writer = csv.writer(stream)
+    writer.writerow(HEADER)
+    for i in indices:
+        writer.writerow((blueprint.names[i], blueprint.count_text(i), "1" if blueprint.checked[i] else "0"))
+
+
+@_register("json", "json")
+def write_json(blueprint: Blueprint, indices: Iterator[int], stream: io.TextIOBase) -> None:
+    # 全体を文字列にせず、1行ずつ配列の要素として書き出す
+    stream.write("[")
+    separator = "\n"
+    for i in indices:
+        total = blueprint.counts[i] if blueprint.has_numeric_count(i) else blueprint.count_text(i)
+        stream.write(separator)
+        stream.write(json.dumps({"item": blueprint.names[i], "total": total, "checked": bool(blueprint.checked[i])},
+                                ensure_ascii=False))
+        separator = ",\n"
+    stream.write("\n]\n")
+
+
+@_register("txt", "txt")
+def write_material_table(blueprint: Blueprint, indices: Iterator[int], stream: io.TextIOBase) -> None:
+    # litematicaの材料リストと同じ表形式（/litematica-add でそのまま読み込める）
+    # 完了したアイテムは Available、未完了のアイテムは Missing に個数を入れる
+    indices = list(indices)
+    name_width = max([len("Item")] + [len(blueprint.names[i]) for i in indices])
+    count_width = max([len("Available")] + [len(str(blueprint.counts[i])) for i in indices])
+    border = f"+{'-' * (name_width + 2)}+" + f"{'-' * (count_width + 2)}+" * 3 + "\n"
+
+    stream.write(border)
+    stream.write(f"| {'Item':<{name_width}} | {'Total':<{count_width}} | {'Missing':<{count_width}} | "
+                 f"{'Available':<{count_width}} |\n")
+    stream.write(border)
+    for i in indices:
+        total = str(blueprint.counts[i])
+        missing, available = ("0", total) if blueprint.checked[i] else (total, "0")
+        stream.write(f"| {blueprint.names[i]:<{name_width}} | {total:<{count_width}} | "
+                     f"{missing:<{count_width}} | {available:<{count_width}} |\n")
+    stream.write(border)
+
+
+def export_blueprint(blueprint: Blueprint, fmt: str, check: str = "all", compress: bool = False) -> Tuple[BinaryIO, str]:
+    """
+    設計図をメモリ上のファイルに書き出し、(ファイル, ファイル名) を返す
+
+    行ごとに書き込むので、一覧全体の文字列は作らない。compress の場合は gzip で圧縮する。
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"形式 '{fmt}' には対応していません（{', '.join(FORMATS)} のいずれか）")
+    extension, writer = FORMATS[fmt]
+    filename = f"{blueprint.title}.{extension}"
+
+    buffer = io.BytesIO()
+    raw = gzip.GzipFile(filename=filename, mode="wb", fileobj=buffer) if compress else buffer
+    stream = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    writer(blueprint, iter_indices(blueprint, check), stream)
+    stream.flush()
+    # TextIOWrapper を閉じると buffer まで閉じられるので切り離す
+    stream.detach()
+    if compress:
+        raw.close()
+        filename += ".gz"
+
+    buffer.seek(0)
+    return buffer, filename
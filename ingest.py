@@ -0,0 +1,178 @@
+import codecs
+import re
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# 試すエンコーディング（順番に判定する）
+ENCODINGS = ('utf-8', 'shift_jis', 'cp932', 'latin1')
+
+# 一度にデコードするバイト数
+CHUNK_SIZE = 64 * 1024
+
+# エンコーディングの候補を絞り込むために先にデコードする先頭のバイト数
+PROBE_SIZE = 64 * 1024
+
+# litematicaの材料リストのデータ行（| アイテム名 | Total | Missing | Available |）
+ROW_PATTERN = re.compile(r'\|\s*(.*?)\s*\|\s*(\d+)\s*\|\s*(\d+)\s*\|\s*(\d+)\s*\|')
+
+
+def iter_chunks(data: bytes, chunk_size: int = CHUNK_SIZE) -> Iterator[memoryview]:
+    """
+    バイト列をコピーせずに chunk_size ごとに区切って返す
+    """
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+
+def split_lines(data: bytes, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    data を改行の位置で約 chunk_size バイトずつに区切り、(開始, 終了) の一覧を返す
+
+    対応するエンコーディングではマルチバイト文字に改行のバイトが含まれないので、
+    区切った範囲はそれぞれ独立してデコードできる。
+    """
+    ranges = []
+    start = 0
+    while start < len(data):
+        end = data.find(b"\n", start + chunk_size - 1)
+        end = len(data) if end < 0 else end + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def decodable_encodings(data: bytes, encodings: Sequence[str] = ENCODINGS) -> List[str]:
+    """
+    data を最後までデコードできるエンコーディングをすべて返す（分割した範囲ごとの判定用）
+    """
+    decodable = []
+    for encoding in encodings:
+        try:
+            codecs.decode(data, encoding)
+        except UnicodeDecodeError:
+            continue
+        decodable.append(encoding)
+    return decodable
+
+
+def probe_encodings(data: bytes, encodings: Sequence[str] = ENCODINGS, size: int = PROBE_SIZE) -> List[str]:
+    """
+    data の先頭 size バイトをデコードできるエンコーディングを返す
+
+    先頭の末尾で切れたマルチバイト文字はエラーにしない。ここで残った候補でも、
+    先頭より後ろでデコードできない場合がある。
+    """
+    probe = data[:size]
+    candidates = []
+    for encoding in encodings:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(probe)
+        except UnicodeDecodeError:
+            continue
+        candidates.append(encoding)
+    return candidates
+
+
+def decode_material_list(data: bytes, encodings: Sequence[str] = ENCODINGS) -> Tuple[List[List[str]], str]:
+    """
+    材料リストを解析し、(行の一覧, エンコーディング) を返す
+
+    先頭をデコードできない候補を除いてから、残りの最初の候補でデコードしながら解析するので、
+    通常はファイル全体を1回デコードするだけで済む。途中でデコードできなかった場合だけ次の候補で解析し直す。
+    """
+    for encoding in probe_encodings(data, encodings):
+        try:
+            return list(parse_material_list(data, encoding)), encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("すべてのエンコーディングで読み込みに失敗しました")
+
+
+def iter_lines(chunks: Iterable[bytes], encoding: str) -> Iterator[str]:
+    """
+    バイト列のチャンクを順にデコードし、1行ずつ返す
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    for chunk in chunks:
+        text = pending + decoder.decode(chunk)
+        lines = text.splitlines(keepends=True)
+        # 改行で終わっていない最後の行は次のチャンクと結合する
+        pending = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        yield from lines
+    text = pending + decoder.decode(b"", final=True)
+    if text:
+        yield from text.splitlines(keepends=True)
+
+
+def _material_row(line: str) -> Optional[List[str]]:
+    # データ行にデフォルト値 "0" のcheck列を追加（アイテム名と数量のみ抽出）
+    match = ROW_PATTERN.match(line)
+    if match:
+        item_name = match.group(1).strip()
+        item_count = match.group(2).strip()
+
+        # 空でないアイテム名と数量のある行のみ追加
+        if item_name and item_count:
+            return [item_name, item_count, "0"]
+    return None
+
+
+def iter_material_rows(lines: Iterable[str]) -> Iterator[List[str]]:
+    """
+    材料リストの各行を解析し、[アイテム名, 個数, "0"] の行を返す
+    """
+    header_found = False
+
+    for line in lines:
+        # ヘッダー行を検出（一度検出したら重複して追加しない）
+        if not header_found and ('Item' in line and 'Total' in line):
+            header_found = True
+            continue
+
+        # データ行の処理
+        row = _material_row(line)
+        if row is not None:
+            yield row
+
+
+def parse_material_chunk(data: bytes, encoding: str) -> Tuple[List[List[str]], Optional[Tuple[int, Optional[List[str]]]]]:
+    """
+    分割した範囲の行を解析し、(行の一覧, ヘッダー) を返す
+
+    ヘッダーはこの範囲で最初にヘッダーとして読み飛ばした行の (行の一覧での位置, その行を解析した結果)。
+    前の範囲ですでにヘッダーが見つかっていた場合は、結合するときにデータ行として戻す。
+    """
+    rows = []
+    header = None
+    for line in data.decode(encoding).splitlines(keepends=True):
+        if header is None and ('Item' in line and 'Total' in line):
+            header = (len(rows), _material_row(line))
+            continue
+
+        row = _material_row(line)
+        if row is not None:
+            rows.append(row)
+    return rows, header
+
+
+def parse_material_chunk_any(
+    data: bytes, encodings: Sequence[str]
+) -> Tuple[str, List[List[str]], Optional[Tuple[int, Optional[List[str]]]]]:
+    """
+    分割した範囲を encodings のうち最初にデコードできたもので解析し、(エンコーディング, 行の一覧, ヘッダー) を返す
+    """
+    for encoding in encodings:
+        try:
+            rows, header = parse_material_chunk(data, encoding)
+        except UnicodeDecodeError:
+            continue
+        return encoding, rows, header
+    raise ValueError("すべてのエンコーディングで読み込みに失敗しました")
+
+
+def parse_material_list(data: bytes, encoding: str) -> Iterator[List[str]]:
+    """
+    アップロードされた材料リストのバイト列から行を順に生成する
+    """
+    return iter_material_rows(iter_lines(iter_chunks(data), encoding))
@@ -0,0 +1,134 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from metrics import register_collector
+
+T = TypeVar("T")
+
+
+class IOExecutor:
+    """
+    設計図の読み書きなどのブロッキングI/Oを実行する専用のスレッドプール
+
+    同時に投入できる処理数に上限を設け、遅いディスクでイベントループが止まらないようにする。
+    待ち行列の長さや待ち時間は metrics() で取得できる。
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 64):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+        # 計測値
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="blueprint-io")
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        func をI/Oスレッドで実行し、結果を返す
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        started_flag = []
+
+        def job() -> T:
+            started = time.perf_counter()
+            with self._lock:
+                started_flag.append(True)
+                self.queue_depth -= 1
+                self.running += 1
+                self.wait_seconds += started - submitted
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.run_seconds += time.perf_counter() - started
+
+        try:
+            # 待ち行列が上限に達している場合はここで待つ
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                # 呼び出し元のコンテキスト（ログの相関IDなど）をスレッドに引き継ぐ
+                context = contextvars.copy_context()
+                result = await loop.run_in_executor(self._get_executor(), context.run, job)
+        except BaseException:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.completed += 1
+                if not started_flag:
+                    # 実行前にキャンセルされた場合
+                    self.queue_depth -= 1
+        return result
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "wait_seconds": self.wait_seconds,
+                "run_seconds": self.run_seconds,
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+io_executor = IOExecutor(
+    max_workers=int(os.getenv("IO_WORKERS", "4")),
+    max_pending=int(os.getenv("IO_MAX_PENDING", "64"))
+)
+
+
+def _collect_io_metrics():
+    values = io_executor.metrics()
+    yield ("litematica_io_queue_depth", "gauge", "I/O jobs waiting for a worker thread.",
+           [({}, values["queue_depth"])])
+    yield ("litematica_io_running", "gauge", "I/O jobs currently running.", [({}, values["running"])])
+    yield ("litematica_io_jobs_total", "counter", "I/O jobs finished.",
+           [({"result": "ok"}, values["completed"] - values["failed"]), ({"result": "error"}, values["failed"])])
+    yield ("litematica_io_wait_seconds_total", "counter", "Time I/O jobs spent waiting for a worker.",
+           [({}, values["wait_seconds"])])
+    yield ("litematica_io_run_seconds_total", "counter", "Time I/O jobs spent running.",
+           [({}, values["run_seconds"])])
+
+
+register_collector(_collect_io_metrics)
+
+
+async def run_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    ブロッキングI/Oを共有のI/Oスレッドプールで実行する
+    """
+    return await io_executor.run(func, *args, **kwargs)
@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+from typing import Dict, Hashable, Iterator, List, Tuple
+
+from storage import BlueprintStorage
+
+
+class CheckJournal:
+    """
+    まだ保存先に書き込んでいないチェック状態の変更を追記していくジャーナル
+
+    1行が1件の変更（JSON）で、保存先への書き込みが終わったら空にする。
+    プロセスが途中で落ちた場合は、次の起動時に replay() で保存先に反映する。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, namespace: str, list_title: str, index: int, item_name: str, value: str,
+               version: Hashable) -> None:
+        """
+        変更を1件追記する（version は変更を適用した時点の保存先のバージョン）
+        """
+        line = json.dumps({
+            "namespace": namespace,
+            "title": list_title,
+            "index": index,
+            "item": item_name,
+            "value": value,
+            "version": version,
+        }, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            # OSに渡しておけばプロセスが落ちても失われない
+            self._file.flush()
+
+    def entries(self) -> Iterator[Dict[str, object]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で落ちた最後の行は読み飛ばす
+                        continue
+        except FileNotFoundError:
+            return
+
+    def truncate(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            with open(self.path, "w", encoding="utf-8"):
+                pass
+
+    def replay(self, storage: BlueprintStorage) -> List[Tuple[str, str]]:
+        """
+        ジャーナルの変更を保存先に反映し、反映した (名前空間, 設計図名) を返す
+
+        バージョンは変更ごとに比べ、記録した時点から保存先のバージョンが変わっている変更
+        （すでに書き込み済み、または再アップロード・削除された設計図への変更）だけを読み飛ばす。
+        一部の設計図だけ書き込めた後に落ちた場合、書き込み済みの設計図にはその後の変更が
+        新しいバージョンで記録されているので、それらは反映される。
+        """
+        pending: Dict[Tuple[str, str], List[Dict[str, object]]] = {}
+        for entry in self.entries():
+            pending.setdefault((entry["namespace"], entry["title"]), []).append(entry)
+
+        replayed = []
+        for (namespace, list_title), changes in pending.items():
+            version = storage.version(namespace, list_title)
+            if version is None:
+                continue
+            # JSONではタプルがリストになるので、同じ形に揃えて比べる
+            version = json.loads(json.dumps(version))
+            changes = [change for change in changes if change["version"] == version]
+            if not changes:
+                continue
+
+            rows, _ = storage.load(namespace, list_title)
+            positions = {}
+            for i, row in enumerate(rows):
+                positions.setdefault(row[0], i)
+
+            changed = set()
+            for change in changes:
+                index = change["index"]
+                if not (0 <= index < len(rows) and rows[index][0] == change["item"]):
+                    index = positions.get(change["item"], -1)
+                    if index < 0:
+                        continue
+                rows[index][2] = change["value"]
+                changed.add(index)
+
+            if changed:
+                storage.update_checks(namespace, list_title, rows, sorted(changed))
+                replayed.append((namespace, list_title))
+
+        self.truncate()
+        return replayed
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,319 @@
+import gzip
+import io
+import logging
+import struct
+from collections import Counter
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpyがない環境では純Pythonで数える（遅い。requirements.txt に含まれている）
+    np = None
+
+logger = logging.getLogger("litematica.litematic")
+
+# numpyがないことを警告したかどうか（プロセスごとに1回だけ出す）
+_fallback_warned = False
+
+# NBTタグの種類
+TAG_END = 0
+TAG_BYTE = 1
+TAG_SHORT = 2
+TAG_INT = 3
+TAG_LONG = 4
+TAG_FLOAT = 5
+TAG_DOUBLE = 6
+TAG_BYTE_ARRAY = 7
+TAG_STRING = 8
+TAG_LIST = 9
+TAG_COMPOUND = 10
+TAG_INT_ARRAY = 11
+TAG_LONG_ARRAY = 12
+
+# 固定長タグのバイト数
+_FIXED_SIZES = {TAG_BYTE: 1, TAG_SHORT: 2, TAG_INT: 4, TAG_LONG: 8, TAG_FLOAT: 4, TAG_DOUBLE: 8}
+_FIXED_FORMATS = {TAG_BYTE: ">b", TAG_SHORT: ">h", TAG_INT: ">i", TAG_LONG: ">q", TAG_FLOAT: ">f", TAG_DOUBLE: ">d"}
+
+# 一度に展開するブロック数（numpy使用時のメモリ使用量の上限を決める）
+DECODE_CHUNK = 1 << 20
+
+# 材料に数えないブロック
+IGNORED_BLOCKS = {
+    "minecraft:air", "minecraft:cave_air", "minecraft:void_air",
+    "minecraft:piston_head", "minecraft:moving_piston", "minecraft:nether_portal",
+    "minecraft:end_portal", "minecraft:end_gateway", "minecraft:fire", "minecraft:soul_fire",
+    "minecraft:bubble_column",
+}
+
+# ブロックIDとアイテムIDが異なるもの
+BLOCK_TO_ITEM = {
+    "minecraft:wall_torch": "minecraft:torch",
+    "minecraft:soul_wall_torch": "minecraft:soul_torch",
+    "minecraft:redstone_wall_torch": "minecraft:redstone_torch",
+    "minecraft:redstone_wire": "minecraft:redstone",
+    "minecraft:tripwire": "minecraft:string",
+    "minecraft:water": "minecraft:water_bucket",
+    "minecraft:lava": "minecraft:lava_bucket",
+    "minecraft:cocoa": "minecraft:cocoa_beans",
+    "minecraft:carrots": "minecraft:carrot",
+    "minecraft:potatoes": "minecraft:potato",
+    "minecraft:beetroots": "minecraft:beetroot_seeds",
+    "minecraft:wheat": "minecraft:wheat_seeds",
+    "minecraft:melon_stem": "minecraft:melon_seeds",
+    "minecraft:attached_melon_stem": "minecraft:melon_seeds",
+    "minecraft:pumpkin_stem": "minecraft:pumpkin_seeds",
+    "minecraft:attached_pumpkin_stem": "minecraft:pumpkin_seeds",
+    "minecraft:sweet_berry_bush": "minecraft:sweet_berries",
+    "minecraft:bamboo_sapling": "minecraft:bamboo",
+    "minecraft:kelp_plant": "minecraft:kelp",
+    "minecraft:tall_seagrass": "minecraft:seagrass",
+    "minecraft:big_dripleaf_stem": "minecraft:big_dripleaf",
+    "minecraft:cave_vines_plant": "minecraft:glow_berries",
+    "minecraft:cave_vines": "minecraft:glow_berries",
+    "minecraft:twisting_vines_plant": "minecraft:twisting_vines",
+    "minecraft:weeping_vines_plant": "minecraft:weeping_vines",
+    "minecraft:powder_snow": "minecraft:powder_snow_bucket",
+    "minecraft:frosted_ice": "minecraft:ice",
+    "minecraft:farmland": "minecraft:dirt",
+    "minecraft:dirt_path": "minecraft:dirt",
+}
+
+
+class NBTReader:
+    """
+    ストリームから順にNBTを読み込む（不要なタグは読み飛ばす）
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+
+    def read_exact(self, size: int) -> bytes:
+        data = self.stream.read(size)
+        if len(data) != size:
+            raise ValueError("NBTデータが途中で終わっています")
+        return data
+
+    def read_fixed(self, tag_type: int):
+        return struct.unpack(_FIXED_FORMATS[tag_type], self.read_exact(_FIXED_SIZES[tag_type]))[0]
+
+    def read_string(self) -> str:
+        (length,) = struct.unpack(">H", self.read_exact(2))
+        return self.read_exact(length).decode("utf-8", errors="replace")
+
+    def read_compound(self, skip: Tuple[str, ...] = ()) -> dict:
+        result = {}
+        while True:
+            tag_type = self.read_exact(1)[0]
+            if tag_type == TAG_END:
+                return result
+            name = self.read_string()
+            if name in skip:
+                self.skip_payload(tag_type)
+            else:
+                result[name] = self.read_payload(tag_type)
+
+    def read_payload(self, tag_type: int):
+        if tag_type in _FIXED_SIZES:
+            return self.read_fixed(tag_type)
+        if tag_type == TAG_STRING:
+            return self.read_string()
+        if tag_type == TAG_COMPOUND:
+            return self.read_compound()
+        if tag_type == TAG_LIST:
+            item_type = self.read_exact(1)[0]
+            (length,) = struct.unpack(">i", self.read_exact(4))
+            return [self.read_payload(item_type) for _ in range(max(length, 0))]
+        if tag_type in (TAG_BYTE_ARRAY, TAG_INT_ARRAY, TAG_LONG_ARRAY):
+            (length,) = struct.unpack(">i", self.read_exact(4))
+            item_size = {TAG_BYTE_ARRAY: 1, TAG_INT_ARRAY: 4, TAG_LONG_ARRAY: 8}[tag_type]
+            # 配列は生のバイト列のまま返す（展開は呼び出し側で行う）
+            return self.read_exact(length * item_size)
+        raise ValueError(f"不明なNBTタグです: {tag_type}")
+
+    def skip_payload(self, tag_type: int) -> None:
+        if tag_type in _FIXED_SIZES:
+            self.read_exact(_FIXED_SIZES[tag_type])
+        elif tag_type == TAG_STRING:
+            (length,) = struct.unpack(">H", self.read_exact(2))
+            self.read_exact(length)
+        elif tag_type == TAG_COMPOUND:
+            while True:
+                child_type = self.read_exact(1)[0]
+                if child_type == TAG_END:
+                    return
+                self.read_string()
+                self.skip_payload(child_type)
+        elif tag_type == TAG_LIST:
+            item_type = self.read_exact(1)[0]
+            (length,) = struct.unpack(">i", self.read_exact(4))
+            if item_type in _FIXED_SIZES:
+                self.read_exact(_FIXED_SIZES[item_type] * max(length, 0))
+            else:
+                for _ in range(max(length, 0)):
+                    self.skip_payload(item_type)
+        elif tag_type in (TAG_BYTE_ARRAY, TAG_INT_ARRAY, TAG_LONG_ARRAY):
+            (length,) = struct.unpack(">i", self.read_exact(4))
+            item_size = {TAG_BYTE_ARRAY: 1, TAG_INT_ARRAY: 4, TAG_LONG_ARRAY: 8}[tag_type]
+            self.read_exact(length * item_size)
+        else:
+            raise ValueError(f"不明なNBTタグです: {tag_type}")
+
+
+def _read_regions(stream: BinaryIO) -> Dict[str, dict]:
+    # ルート直下の Regions だけを読み、各リージョンのブロック以外の情報は読み飛ばす
+    reader = NBTReader(stream)
+    tag_type = reader.read_exact(1)[0]
+    if tag_type != TAG_COMPOUND:
+        raise ValueError("litematicファイルの形式が正しくありません")
+    reader.read_string()
+
+    regions = None
+    while True:
+        tag_type = reader.read_exact(1)[0]
+        if tag_type == TAG_END:
+            break
+        name = reader.read_string()
+        if name == "Regions" and tag_type == TAG_COMPOUND:
+            regions = {}
+            while True:
+                region_type = reader.read_exact(1)[0]
+                if region_type == TAG_END:
+                    break
+                region_name = reader.read_string()
+                regions[region_name] = reader.read_compound(
+                    skip=("TileEntities", "Entities", "PendingBlockTicks", "PendingFluidTicks")
+                )
+        else:
+            reader.skip_payload(tag_type)
+
+    if regions is None:
+        raise ValueError("litematicファイルにRegionsがありません")
+    return regions
+
+
+def _bits_per_entry(palette_size: int) -> int:
+    # Litematicaは最低2ビット、パレットの大きさに応じて増やす
+    return max(2, (palette_size - 1).bit_length())
+
+
+def count_block_states(block_states: bytes, bits: int, volume: int, palette_size: int) -> List[int]:
+    """
+    パックされた BlockStates（ビッグエンディアンのlong配列）からパレット番号ごとのブロック数を数える
+
+    Litematicaの形式では値がlongの境界をまたいで詰められている。
+    """
+    mask = (1 << bits) - 1
+
+    if np is not None:
+        words = np.frombuffer(block_states, dtype=">u8").astype(np.uint64)
+        if len(words) == 0:
+            return [0] * palette_size
+        counts = np.zeros(palette_size, dtype=np.int64)
+        last = len(words) - 1
+        np_bits = np.uint64(bits)
+        np_mask = np.uint64(mask)
+        for start in range(0, volume, DECODE_CHUNK):
+            index = np.arange(start, min(start + DECODE_CHUNK, volume), dtype=np.uint64)
+            bit_index = index * np_bits
+            word = (bit_index >> np.uint64(6)).astype(np.int64)
+            offset = bit_index & np.uint64(63)
+            low = words[word] >> offset
+            # longの境界をまたぐ値は次のlongの下位ビットを結合する
+            spans = offset + np_bits > np.uint64(64)
+            high_shift = (np.uint64(64) - offset) & np.uint64(63)
+            high = np.where(spans, words[np.minimum(word + 1, last)] << high_shift, np.uint64(0))
+            values = ((low | high) & np_mask).astype(np.int64)
+            counts += np.bincount(values, minlength=palette_size)[:palette_size]
+        return counts.tolist()
+
+    # numpyがない場合は1ブロックずつ展開する
+    global _fallback_warned
+    if not _fallback_warned:
+        _fallback_warned = True
+        logger.warning("numpy is not installed; counting .litematic block states in pure Python (slow)")
+    words = [value for (value,) in struct.iter_unpack(">Q", block_states)]
+    counts = [0] * palette_size
+    for i in range(volume):
+        bit_index = i * bits
+        word, offset = divmod(bit_index, 64)
+        value = words[word] >> offset
+        if offset + bits > 64:
+            value |= words[word + 1] << (64 - offset)
+        value &= mask
+        if value < palette_size:
+            counts[value] += 1
+    return counts
+
+
+def block_to_item(name: str, properties: Optional[dict]) -> Tuple[Optional[str], int]:
+    """
+    パレットのブロックを (アイテムID, 1ブロックあたりの個数) に変換する（数えない場合は None）
+    """
+    if name in IGNORED_BLOCKS:
+        return None, 0
+    properties = properties or {}
+
+    # 2ブロックで1個のもの（ドア・背の高い植物・ベッド）は片方だけ数える
+    if properties.get("half") == "upper":
+        return None, 0
+    if properties.get("part") == "head" and name.endswith("_bed"):
+        return None, 0
+    # 流れている水・溶岩は数えない
+    if name in ("minecraft:water", "minecraft:lava") and properties.get("level", "0") != "0":
+        return None, 0
+
+    multiplier = 1
+    if properties.get("type") == "double" and name.endswith("_slab"):
+        multiplier = 2
+    for key in ("pickles", "eggs", "candles"):
+        if key in properties:
+            multiplier = int(properties[key])
+    if name == "minecraft:snow" and "layers" in properties:
+        multiplier = int(properties["layers"])
+
+    return BLOCK_TO_ITEM.get(name, name), multiplier
+
+
+def item_display_name(item_id: str) -> str:
+    """
+    アイテムID（minecraft:oak_planks）を材料リストの表示名（Oak Planks）に変換する
+    """
+    name = item_id.split(":", 1)[-1]
+    return " ".join(word.capitalize() for word in name.split("_"))
+
+
+def count_materials(data: bytes) -> Counter:
+    """
+    .litematic ファイルのバイト列からアイテムIDごとの必要数を数える
+    """
+    with gzip.GzipFile(fileobj=io.BytesIO(data)) as stream:
+        regions = _read_regions(io.BufferedReader(stream, buffer_size=256 * 1024))
+
+    materials: Counter = Counter()
+    for region in regions.values():
+        size = region.get("Size", {})
+        volume = abs(size.get("x", 0) * size.get("y", 0) * size.get("z", 0))
+        palette = region.get("BlockStatePalette", [])
+        block_states = region.get("BlockStates", b"")
+        if volume == 0 or not palette:
+            continue
+
+        counts = count_block_states(block_states, _bits_per_entry(len(palette)), volume, len(palette))
+        for entry, count in zip(palette, counts):
+            if count == 0:
+                continue
+            item_id, multiplier = block_to_item(entry.get("Name", ""), entry.get("Properties"))
+            if item_id is not None:
+                materials[item_id] += count * multiplier
+    return materials
+
+
+def parse_litematic(data: bytes) -> List[List[str]]:
+    """
+    .litematic ファイルから [アイテム名, 個数, "0"] の行を個数の多い順に返す
+    """
+    materials = count_materials(data)
+    totals: Counter = Counter()
+    for item_id, count in materials.items():
+        totals[item_display_name(item_id)] += count
+    return [[name, str(count), "0"] for name, count in totals.most_common()]
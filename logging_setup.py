@@ -0,0 +1,165 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Any, Dict, Optional
+
+# ログの出力レベルと出力先（LOG_FILE を指定するとローテーションするファイルにも書き出す）
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE")
+LOG_FILE_BYTES = int(os.getenv("LOG_FILE_BYTES", str(10 * 1024 * 1024)))
+LOG_FILE_BACKUPS = int(os.getenv("LOG_FILE_BACKUPS", "5"))
+# 自動補完は入力のたびに呼ばれるので、正常終了のログはこの割合だけ残す（警告・エラーはすべて残す）
+LOG_AUTOCOMPLETE_SAMPLE = float(os.getenv("LOG_AUTOCOMPLETE_SAMPLE", "0.01"))
+
+# 処理中のコマンド・自動補完の情報（ログのすべての行に付ける）
+interaction_context: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "interaction_context", default=None
+)
+
+# JSONに含めない LogRecord の標準の属性
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class ContextFilter(logging.Filter):
+    """
+    ログを出した時点の interaction_context をレコードに付ける
+
+    エラー以上のログが出た場合は、その処理の結果（outcome）を error にする。
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = interaction_context.get()
+        if context is not None:
+            if record.levelno >= logging.ERROR:
+                context["outcome"] = "error"
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    自動補完の正常終了のログを rate の割合だけ残す（残したログには sample_rate を付ける）
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "kind", None) != "autocomplete" or record.levelno >= logging.WARNING:
+            return True
+        if random.random() >= self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    1行1件のJSONにする（extra やコンテキストで付けた属性もそのままキーにする）
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["traceback"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["traceback"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # 標準の QueueHandler は文字列に整形してから渡すので、属性を残したまま渡す
+    # （トレースバックだけはここで文字列にしておく）
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging() -> None:
+    """
+    ルートロガーにキューを挟んだJSONのログ出力を設定する
+
+    ログを出したスレッド（イベントループなど）はキューに入れるだけで、
+    書き込みは QueueListener のスレッドが行うので、遅いディスクや端末で処理が止まらない。
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter()
+    handlers = []
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+    handlers.append(stream_handler)
+    if LOG_FILE:
+        directory = os.path.dirname(LOG_FILE)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_FILE_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"
+        )
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    # コンテキストはログを出したスレッドで付ける必要があるので、キューに入れる前に処理する
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(LOG_AUTOCOMPLETE_SAMPLE))
+
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """
+    キューに残っているログを書き出してから出力スレッドを止める
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_failure(logger: logging.Logger, action: str, error: BaseException) -> None:
+    """
+    ハンドラーで捕まえた例外をログに残す
+
+    入力の誤りなど利用者に返すだけのエラー（ValueError・FileNotFoundError）は警告として1行で、
+    それ以外はトレースバックごとエラーとして残す。
+    """
+    if isinstance(error, (ValueError, FileNotFoundError)):
+        logger.warning("%s rejected: %s", action, error, extra={"error": type(error).__name__})
+    else:
+        logger.error("%s failed: %s", action, error, exc_info=error, extra={"error": type(error).__name__})
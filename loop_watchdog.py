@@ -0,0 +1,185 @@
+import asyncio
+import collections
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+
+from metrics import Counter, active_handler, register_metric
+
+# ブロックしたとみなすイベントループの遅延（秒）
+WATCHDOG_THRESHOLD = float(os.getenv("WATCHDOG_THRESHOLD", "0.25"))
+# イベントループが止まったときの報告の出力先（ローテーションする）
+WATCHDOG_LOG = os.getenv("WATCHDOG_LOG", "./logs/watchdog.log")
+WATCHDOG_LOG_BYTES = int(os.getenv("WATCHDOG_LOG_BYTES", str(5 * 1024 * 1024)))
+WATCHDOG_LOG_BACKUPS = int(os.getenv("WATCHDOG_LOG_BACKUPS", "5"))
+# サンプリングプロファイラの出力先
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./logs/profiles")
+
+STALLS = Counter(
+    "litematica_event_loop_stalls_total", "Times the event loop was blocked longer than the watchdog threshold."
+)
+register_metric(STALLS)
+
+logger = logging.getLogger("litematica.watchdog")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def folded_stack(frame) -> str:
+    """
+    フレームから呼び出し元までを、flamegraph.pl や speedscope が読める1行（外側から ; 区切り）にする
+    """
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Watchdog:
+    """
+    イベントループの遅延を監視し、止まっている間にブロックしている処理のスタックを記録する
+
+    イベントループ側のタスクが interval 秒ごとに時刻を更新し、別スレッドがその時刻を監視する。
+    threshold 秒以上更新されない場合は、イベントループのスレッドのスタックと、実行中のタスクが処理している
+    コマンド・自動補完の名前と設計図名をローテーションするログに書き出す。
+    """
+
+    def __init__(self, threshold: float = WATCHDOG_THRESHOLD, interval: float = 0.05,
+                 log_path: str = WATCHDOG_LOG):
+        self.threshold = threshold
+        self.interval = interval
+        self.log_path = log_path
+        self.stalls = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._profiling = threading.Lock()
+
+    def start(self) -> None:
+        """
+        イベントループのスレッドから呼び出して監視を始める
+        """
+        if not logger.handlers and self.log_path:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                self.log_path, maxBytes=WATCHDOG_LOG_BYTES, backupCount=WATCHDOG_LOG_BACKUPS, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat_task = self._loop.create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    async def _beat(self) -> None:
+        while True:
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stopped.wait(self.interval):
+            heartbeat = self._heartbeat
+            lag = time.monotonic() - heartbeat - self.interval
+            if lag < self.threshold:
+                if reported is not None:
+                    logger.info("Event loop resumed after %.3fs", time.monotonic() - reported)
+                    reported = None
+                continue
+            # 1回の停止につき1回だけ報告する
+            if reported is None:
+                reported = heartbeat
+                self._report(lag)
+
+    def _report(self, lag: float) -> None:
+        self.stalls += 1
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "(スタックを取得できません)\n"
+
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        handler = active_handler(task)
+        if handler is not None:
+            kind, name, list_title = handler
+        else:
+            kind, name, list_title = "task" if task is not None else "callback", None, None
+        if name is None and task is not None:
+            name = getattr(task.get_coro(), "__qualname__", repr(task))
+
+        STALLS.inc(kind=kind, name=name or "unknown")
+        logger.warning("Event loop blocked for %.3fs in %s %s (list_title=%r)\n%s",
+                       lag, kind, name or "unknown", list_title, stack.rstrip("\n"),
+                       extra={"lag_ms": round(lag * 1000, 3), "kind": kind, "handler": name,
+                              "list_title": list_title})
+
+    async def profile(self, seconds: float, sample_interval: float = 0.005) -> str:
+        """
+        seconds 秒間イベントループのスレッドのスタックを定期的に採取し、折りたたみ形式（1行が
+        "外側;…;内側 回数"）のファイルに書き出してそのパスを返す
+
+        出力は flamegraph.pl や speedscope でそのまま読み込める。同時に実行できるのは1つまで。
+        """
+        if not self._profiling.acquire(blocking=False):
+            raise ValueError("プロファイラはすでに実行中です。")
+        try:
+            thread_id = threading.get_ident()
+            samples: Dict[str, int] = collections.Counter()
+            done = threading.Event()
+
+            def sample() -> None:
+                while not done.wait(sample_interval):
+                    frame = sys._current_frames().get(thread_id)
+                    if frame is not None:
+                        samples[folded_stack(frame)] += 1
+
+            sampler = threading.Thread(target=sample, name="event-loop-profiler", daemon=True)
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                done.set()
+                await asyncio.to_thread(sampler.join)
+
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+            lines = [f"{stack} {count}\n" for stack, count in sorted(samples.items())]
+            await asyncio.to_thread(self._write_profile, path, lines)
+            return path
+        finally:
+            self._profiling.release()
+
+    @staticmethod
+    def _write_profile(path: str, lines) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+
+
+# WATCHDOG=0 で監視しない
+watchdog = Watchdog() if os.getenv("WATCHDOG", "1") == "1" else None
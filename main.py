@@ -1,24 +1,147 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 import os
 
+from blueprint_store import blueprint_cache, flush_periodically, warm_up
+from io_executor import run_io
+from logging_setup import setup_logging
+from loop_watchdog import watchdog
+from metrics import monitor_event_loop_lag, start_metrics_server
+from parse_pool import parse_pool
+
+# 起動から準備完了までの時間を計測する
+STARTED = time.perf_counter()
+
 load_dotenv()
 
+# ログはキューを通してJSONで書き出す（discord.py のログも同じ出力先にまとめる）
+setup_logging()
+logger = logging.getLogger("litematica.bot")
+
+# 最後に同期したコマンドツリーのハッシュを保存するファイル
+COMMAND_HASH_FILE = os.getenv("COMMAND_HASH_FILE", "./.command_tree_hash")
+
+
+def parse_shard_ids(text):
+    # "0-3" や "0,1,4-5" のような指定をシャードIDのリストにする
+    shard_ids = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            shard_ids.extend(range(int(start), int(end) + 1))
+        else:
+            shard_ids.append(int(part))
+    return shard_ids
 
-class Mybot(commands.Bot):
-    def __init__(self, command_prefix, intents, config):
-        super().__init__(command_prefix=command_prefix, intents=intents)
+
+class Mybot(commands.AutoShardedBot):
+    def __init__(self, command_prefix, intents, config, shard_count=None, shard_ids=None):
+        # shard_count を省略した場合はDiscordの推奨シャード数を使う
+        super().__init__(command_prefix=command_prefix, intents=intents,
+                         shard_count=shard_count, shard_ids=shard_ids)
         self.config = config
+        self.metrics_server = None
+        self.lag_monitor = None
+        self.flush_task = None
+        self.warm_up_task = None
+        self.ready_logged = False
 
-    async def on_ready(self):
-        print(f'Logged in as {self.user.name} - {self.user.id}')
-        print('------')
+    async def setup_hook(self):
+        # イベントループの遅延を計測
+        self.lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+        # 遅延がしきい値を超えたら、ブロックしている処理のスタックをログに残す
+        if watchdog is not None:
+            watchdog.start()
+        
+        # write-behind モードでは前回書き込めなかった変更を反映してから定期的な書き込みを始める
+        if blueprint_cache.journal is not None:
+            recovered = await run_io(blueprint_cache.recover)
+            if recovered:
+                logger.info("Recovered unflushed checks: %d blueprints", len(recovered),
+                            extra={"blueprints": len(recovered)})
+            self.flush_task = asyncio.create_task(flush_periodically())
+        
+        # METRICS_PORT が設定されている場合はPrometheus形式で計測値を公開
+        metrics_port = os.getenv("METRICS_PORT")
+        if metrics_port:
+            self.metrics_server = await start_metrics_server(os.getenv("METRICS_HOST", "127.0.0.1"), int(metrics_port))
+            logger.info("Metrics: http://%s:%s/metrics", os.getenv("METRICS_HOST", "127.0.0.1"), metrics_port)
+        
+        # 索引の準備はバックグラウンドで行い、接続を待たせない
+        self.warm_up_task = asyncio.create_task(self.warm_up_cache())
         
+        # コマンドが変わっていない場合は同期しない（再接続のたびに同期しない）
+        await self.sync_commands()
+
+    def command_tree_hash(self):
+        payload = sorted((command.to_dict(self.tree) for command in self.tree.get_commands()),
+                         key=lambda command: command["name"])
+        text = json.dumps({"application_id": self.application_id, "commands": payload},
+                          sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    async def sync_commands(self):
+        tree_hash = self.command_tree_hash()
+        try:
+            with open(COMMAND_HASH_FILE, encoding="utf-8") as f:
+                synced_hash = f.read().strip()
+        except FileNotFoundError:
+            synced_hash = None
+        
+        if tree_hash == synced_hash:
+            logger.info("Command tree unchanged (%s), skipping sync", tree_hash[:12], extra={"tree_hash": tree_hash})
+            return
+        
+        started = time.perf_counter()
         await self.tree.sync()
-        for command in self.tree.get_commands():
-            print(f'Command: {command.name}')
-        print('------')
+        with open(COMMAND_HASH_FILE, "w", encoding="utf-8") as f:
+            f.write(tree_hash)
+        duration = time.perf_counter() - started
+        logger.info("Synced command tree (%s) in %.2fs", tree_hash[:12], duration,
+                    extra={"tree_hash": tree_hash, "duration_ms": round(duration * 1000, 3)})
+
+    async def warm_up_cache(self):
+        started = time.perf_counter()
+        try:
+            namespaces, loaded = await warm_up(blueprint_cache)
+        except Exception:
+            logger.exception("Cache warm-up failed")
+            return
+        duration = time.perf_counter() - started
+        logger.info("Cache warm-up: %d namespaces, %d blueprints in %.2fs", namespaces, loaded, duration,
+                    extra={"namespaces": namespaces, "blueprints": loaded, "duration_ms": round(duration * 1000, 3)})
+
+    async def close(self):
+        # 終了前に未書き込みのチェック状態を書き込む
+        # 書き込めなくても変更はジャーナルに残り次回の起動時に反映されるので、接続の終了は必ず行う
+        try:
+            if self.flush_task is not None:
+                self.flush_task.cancel()
+                await run_io(blueprint_cache.flush)
+        finally:
+            parse_pool.shutdown()
+            if watchdog is not None:
+                watchdog.stop()
+            await super().close()
+
+    async def on_ready(self):
+        logger.info("Logged in as %s - %s", self.user.name, self.user.id,
+                    extra={"shards": sorted(self.shards), "shard_count": self.shard_count,
+                           "commands": [command.name for command in self.tree.get_commands()]})
+        if not self.ready_logged:
+            self.ready_logged = True
+            duration = time.perf_counter() - STARTED
+            logger.info("Ready in %.2fs", duration, extra={"duration_ms": round(duration * 1000, 3)})
         
         activity = discord.Streaming(name="ShirafukasBOT", url="https://www.twitch.tv/shirafukayayoi")
         await self.change_presence(status=discord.Status.online, activity=activity)
@@ -26,9 +149,23 @@ class Mybot(commands.Bot):
 intents = discord.Intents.default()
 intents.message_content = True
 
-bot = Mybot(command_prefix='!', intents=intents, config={})
+# 複数のプロセスでシャードを分担する場合は SHARD_COUNT と SHARD_IDS（例: "0-3"）を指定する
+shard_count = os.getenv('SHARD_COUNT')
+shard_ids = os.getenv('SHARD_IDS')
+
+bot = Mybot(
+    command_prefix='!',
+    intents=intents,
+    config={},
+    shard_count=int(shard_count) if shard_count else None,
+    shard_ids=parse_shard_ids(shard_ids) if shard_ids else None
+)
 
 from command import setup
 
 setup(bot)
-bot.run(os.getenv('DISCORD_TOKEN'))
\ No newline at end of file
+
+# 解析用のプロセスがこのファイルを読み込んだ場合（spawn で起動する環境）にBOTを起動しない
+if __name__ == "__main__":
+    # discord.py 独自のログ設定は使わず、ルートロガーの設定に任せる
+    bot.run(os.getenv('DISCORD_TOKEN'), log_handler=None)
\ No newline at end of file
@@ -0,0 +1,293 @@
+import asyncio
+import bisect
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from logging_setup import interaction_context
+
+logger = logging.getLogger("litematica.handler")
+
+# レイテンシ用のバケット（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    単調増加するカウンター（ラベルごと）
+    """
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self) -> List[Tuple[Tuple[Tuple[str, str], ...], float]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self.samples():
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    バケット方式のヒストグラム（ラベルごと）
+    """
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # ラベル → [バケットごとの件数..., 合計値, 件数]
+        self._series: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def series(self) -> Dict[Tuple[Tuple[str, str], ...], List[float]]:
+        with self._lock:
+            return {key: list(values) for key, values in self._series.items()}
+
+    def quantile(self, fraction: float, series: List[float]) -> float:
+        """
+        バケットの件数から分位点を推定する（バケット内は線形補間）
+        """
+        count = series[-1]
+        if count == 0:
+            return 0.0
+        target = fraction * count
+        cumulative = 0
+        lower = 0.0
+        for upper, bucket_count in zip(self.buckets + (float("inf"),), series):
+            if cumulative + bucket_count >= target and bucket_count > 0:
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (target - cumulative) / bucket_count
+            cumulative += bucket_count
+            lower = upper
+        return lower
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in self.series().items():
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets + (float("inf"),), series):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(labels, ('le', _format_value(upper)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+
+COMMAND_DURATION = Histogram(
+    "litematica_command_duration_seconds", "Time spent handling an app command."
+)
+AUTOCOMPLETE_DURATION = Histogram(
+    "litematica_autocomplete_duration_seconds", "Time spent handling an autocomplete callback."
+)
+BLUEPRINT_BYTES = Counter(
+    "litematica_blueprint_bytes_total", "Bytes read from or written to blueprint storage."
+)
+EVENT_LOOP_LAG = Histogram(
+    "litematica_event_loop_lag_seconds", "How late the event loop woke up a periodic timer.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+_histograms = {"command": COMMAND_DURATION, "autocomplete": AUTOCOMPLETE_DURATION}
+_metrics: List[object] = [COMMAND_DURATION, AUTOCOMPLETE_DURATION, BLUEPRINT_BYTES, EVENT_LOOP_LAG]
+
+# 実行中のコマンド・自動補完（タスク → (種類, 名前, 設計図名)）。イベントループの監視で参照する
+_active_handlers: Dict[asyncio.Task, Tuple[str, str, Optional[str]]] = {}
+
+# スクレイプ時に (名前, 種類, 説明, [(ラベル, 値)]) を返す関数
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+
+def register_metric(metric) -> None:
+    """
+    他のモジュールで定義した Counter や Histogram を /metrics に含める
+    """
+    _metrics.append(metric)
+
+
+def register_collector(collector) -> None:
+    _collectors.append(collector)
+
+
+def record_bytes(direction: str, operation: str, amount: int) -> None:
+    """
+    設計図の読み書きのバイト数を記録する（direction は read / write）
+    """
+    BLUEPRINT_BYTES.inc(amount, direction=direction, operation=operation)
+
+
+def _list_title(args, kwargs) -> Optional[str]:
+    # コマンドは引数、自動補完は入力中のオプション（interaction.namespace）から設計図名を取り出す
+    for key in ("list_title", "matica_title", "list_titles"):
+        if kwargs.get(key):
+            return str(kwargs[key])
+    namespace = getattr(args[0], "namespace", None) if args else None
+    for key in ("list_title", "matica_title"):
+        value = getattr(namespace, key, None)
+        if value:
+            return str(value)
+    return None
+
+
+def active_handler(task: Optional[asyncio.Task]) -> Optional[Tuple[str, str, Optional[str]]]:
+    """
+    タスクが実行中のコマンド・自動補完の (種類, 名前, 設計図名) を返す（他のスレッドからも呼べる）
+    """
+    return _active_handlers.get(task) if task is not None else None
+
+
+def instrument(kind: str):
+    """
+    コマンド（kind="command"）や自動補完（kind="autocomplete"）のコールバックの処理時間を計測する
+
+    実行中はタスクとコールバックの対応を記録し、イベントループが止まったときにどの処理かを特定できるようにする。
+    また interaction の ID などをログのコンテキストに設定し、終了時に処理時間と結果をログに残す。
+    """
+    histogram = _histograms[kind]
+
+    def decorator(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            list_title = _list_title(args, kwargs)
+            task = asyncio.current_task()
+            if task is not None:
+                _active_handlers[task] = (kind, name, list_title)
+
+            interaction = args[0] if args else None
+            context = {
+                # interaction のIDを相関IDにして、同じ操作のログをまとめて追えるようにする
+                "interaction_id": getattr(interaction, "id", None),
+                "kind": kind,
+                "handler": name,
+                "list_title": list_title,
+                "guild_id": getattr(interaction, "guild_id", None),
+                "user_id": getattr(getattr(interaction, "user", None), "id", None),
+                "outcome": "ok",
+            }
+            token = interaction_context.set(context)
+            try:
+                return await func(*args, **kwargs)
+            except BaseException:
+                context["outcome"] = "error"
+                logger.exception("%s %s raised", kind, name)
+                raise
+            finally:
+                duration = time.perf_counter() - started
+                if task is not None:
+                    _active_handlers.pop(task, None)
+                histogram.observe(duration, name=name)
+                logger.info("%s %s finished", kind, name, extra={"duration_ms": round(duration * 1000, 3)})
+                interaction_context.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+def render() -> str:
+    """
+    すべての計測値をPrometheusのテキスト形式で返す
+    """
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, metric_type, documentation, samples in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """
+    一定間隔で眠り、予定より遅れて起きた時間をイベントループの遅延として記録する
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - started - interval))
+
+
+async def _handle_metrics_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # ヘッダーは読み捨てる
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+            body = render().encode("utf-8")
+            status = "200 OK"
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = b"not found\n"
+            status = "404 Not Found"
+            content_type = "text/plain; charset=utf-8"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin1") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str = "127.0.0.1", port: int = 9464) -> asyncio.AbstractServer:
+    """
+    /metrics でPrometheus形式の計測値を返すHTTPサーバーを起動する
+    """
+    return await asyncio.start_server(_handle_metrics_request, host, port)
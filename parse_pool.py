@@ -0,0 +1,214 @@
+import asyncio
+import contextlib
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from ingest import (ENCODINGS, decodable_encodings, decode_material_list, parse_material_chunk,
+                    parse_material_chunk_any, probe_encodings, split_lines)
+from io_executor import run_io
+from litematic import parse_litematic
+from metrics import Counter, Histogram, register_collector, register_metric
+
+# 大きなファイルの解析中に「処理中」のEmbedを更新する間隔（秒）
+PARSE_PROGRESS_INTERVAL = float(os.getenv("PARSE_PROGRESS_INTERVAL", "2.0"))
+
+PARSE_JOBS = Counter("litematica_parse_jobs_total", "Uploads parsed, by where they ran (thread or process).")
+PARSE_BYTES = Counter("litematica_parse_bytes_total", "Bytes of uploads parsed, by where they ran.")
+PARSE_DURATION = Histogram("litematica_parse_duration_seconds", "Time spent parsing an upload, by where it ran.")
+register_metric(PARSE_JOBS)
+register_metric(PARSE_BYTES)
+register_metric(PARSE_DURATION)
+
+
+def parse_upload(filename: str, data: bytes) -> Tuple[List[List[str]], str]:
+    """
+    アップロードされたファイルを解析し、(行の一覧, エンコーディング) を返す
+
+    .litematic はNBTを直接解析し（エンコーディングは "litematic"）、それ以外は材料リストのテキストとして解析する。
+    """
+    if filename.lower().endswith(".litematic"):
+        return parse_litematic(data), "litematic"
+    return decode_material_list(data)
+
+
+class ParseProgress:
+    """
+    解析の進み具合（コマンドの「処理中」のEmbedの更新に使う）
+    """
+    __slots__ = ("bytes_total", "bytes_done", "rows", "stage")
+
+    def __init__(self, bytes_total: int):
+        self.bytes_total = bytes_total
+        self.bytes_done = 0
+        self.rows = 0
+        # "encoding"（エンコーディングの判定）→ "parsing"（行の解析）
+        self.stage = "encoding"
+
+    @property
+    def ratio(self) -> float:
+        return self.bytes_done / self.bytes_total if self.bytes_total else 1.0
+
+
+class ParsePool:
+    """
+    大きなアップロードをイベントループとI/Oスレッドの外で解析するプロセスプール
+
+    threshold バイト未満のファイルはこれまでどおりI/Oスレッドで解析する。
+    それ以上の材料リストは改行の位置で chunk_size バイトずつに分け、エンコーディングの判定と
+    行の解析をそれぞれチャンクごとにプロセスへ分配する。.litematic は分割できないので1プロセスで解析する。
+    同じ名前空間（サーバー）で同時に解析できるファイルは per_namespace 件まで。
+    """
+
+    def __init__(self, max_workers: int = 2, threshold: int = 1024 * 1024, chunk_size: int = 4 * 1024 * 1024,
+                 max_upload: int = 50 * 1024 * 1024, per_namespace: int = 2):
+        self.max_workers = max_workers
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+        self.max_upload = max_upload
+        self.per_namespace = per_namespace
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._active: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def check_size(self, size: int) -> None:
+        if size > self.max_upload:
+            raise ValueError(f"ファイルが大きすぎます（{size / 1024 / 1024:,.1f} MB、"
+                             f"上限は {self.max_upload / 1024 / 1024:,.0f} MB）")
+
+    @contextlib.asynccontextmanager
+    async def slot(self, namespace: str) -> AsyncIterator[None]:
+        """
+        名前空間ごとの同時解析数の枠を確保する（空きがなければ待たずに ValueError）
+
+        待たせるとアップロードされたファイルをメモリ上に抱えたままになるので、すぐに断る。
+        """
+        with self._lock:
+            if self._active.get(namespace, 0) >= self.per_namespace:
+                raise ValueError(f"このサーバーでは同時に {self.per_namespace} 件までしか解析できません。"
+                                 "しばらくしてからもう一度お試しください。")
+            self._active[namespace] = self._active.get(namespace, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active[namespace] -= 1
+                if not self._active[namespace]:
+                    del self._active[namespace]
+
+    def uses_processes(self, size: int) -> bool:
+        return self.max_workers > 0 and size >= self.threshold
+
+    async def parse(self, filename: str, data: bytes,
+                    progress: Optional[ParseProgress] = None) -> Tuple[List[List[str]], str]:
+        """
+        アップロードされたファイルを解析し、(行の一覧, エンコーディング) を返す
+        """
+        self.check_size(len(data))
+        if progress is None:
+            progress = ParseProgress(len(data))
+        mode = "process" if self.uses_processes(len(data)) else "thread"
+        started = time.perf_counter()
+
+        if mode == "thread":
+            rows, encoding = await run_io(parse_upload, filename, data)
+        elif filename.lower().endswith(".litematic"):
+            progress.stage = "parsing"
+            loop = asyncio.get_running_loop()
+            rows = await loop.run_in_executor(self._get_executor(), parse_litematic, data)
+            encoding = "litematic"
+        else:
+            rows, encoding = await self._parse_material_list(data, progress)
+
+        progress.bytes_done = len(data)
+        progress.rows = len(rows)
+        PARSE_JOBS.inc(mode=mode)
+        PARSE_BYTES.inc(len(data), mode=mode)
+        PARSE_DURATION.observe(time.perf_counter() - started, mode=mode)
+        return rows, encoding
+
+    async def _parse_material_list(self, data: bytes,
+                                   progress: ParseProgress) -> Tuple[List[List[str]], str]:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        view = memoryview(data)
+        ranges = split_lines(data, self.chunk_size)
+
+        # 1. 先頭をデコードできる候補のうち、チャンクごとに最初にデコードできたもので解析する
+        #    （通常はすべてのチャンクが同じエンコーディングになり、各チャンクのデコードは1回で済む）
+        progress.stage = "parsing"
+        candidates = probe_encodings(data)
+
+        async def parse_chunk(start: int, end: int):
+            result = await loop.run_in_executor(executor, parse_material_chunk_any, bytes(view[start:end]), candidates)
+            progress.bytes_done += end - start
+            progress.rows += len(result[1])
+            return result
+
+        parsed = await asyncio.gather(*(parse_chunk(start, end) for start, end in ranges))
+        results = [(chunk_rows, header) for _, chunk_rows, header in parsed]
+        encodings = {chunk_encoding for chunk_encoding, _, _ in parsed}
+        encoding = parsed[0][0] if parsed else candidates[0]
+        if len(encodings) > 1:
+            # 2. チャンクによって違う場合は、すべてのチャンクをデコードできる最初のエンコーディングを選び、
+            #    そのエンコーディングで解析していないチャンクだけを解析し直す
+            progress.stage = "encoding"
+            futures = [loop.run_in_executor(executor, decodable_encodings, bytes(view[start:end]), candidates)
+                       for start, end in ranges]
+            for decodable in await asyncio.gather(*futures):
+                candidates = [candidate for candidate in candidates if candidate in decodable]
+            if not candidates:
+                raise ValueError("すべてのエンコーディングで読み込みに失敗しました")
+            encoding = candidates[0]
+            progress.stage = "parsing"
+            stale = [i for i, (chunk_encoding, _, _) in enumerate(parsed) if chunk_encoding != encoding]
+            reparsed = await asyncio.gather(*(
+                loop.run_in_executor(executor, parse_material_chunk, bytes(view[ranges[i][0]:ranges[i][1]]), encoding)
+                for i in stale
+            ))
+            for i, result in zip(stale, reparsed):
+                results[i] = result
+
+        # 元の順に結合する（最初のヘッダーより後にヘッダーに見える行があれば、データ行として戻す）
+        rows: List[List[str]] = []
+        header_found = False
+        for chunk_rows, header in results:
+            if header is not None and header_found and header[1] is not None:
+                chunk_rows.insert(header[0], header[1])
+            header_found = header_found or header is not None
+            rows.extend(chunk_rows)
+        return rows, encoding
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            return {"active": sum(self._active.values())}
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+parse_pool = ParsePool(
+    # PARSE_WORKERS=0 でプロセスプールを使わない
+    max_workers=int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    threshold=int(os.getenv("PARSE_PROCESS_THRESHOLD", str(1024 * 1024))),
+    chunk_size=int(os.getenv("PARSE_CHUNK_BYTES", str(4 * 1024 * 1024))),
+    max_upload=int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024))),
+    per_namespace=int(os.getenv("PARSE_PER_GUILD", "2"))
+)
+
+
+def _collect_parse_metrics():
+    yield ("litematica_parse_active", "gauge", "Uploads currently being parsed.",
+           [({}, parse_pool.metrics()["active"])])
+
+
+register_collector(_collect_parse_metrics)
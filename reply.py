@@ -0,0 +1,80 @@
+import asyncio
+import os
+import time
+
+import discord
+
+from metrics import Counter, Histogram, register_metric
+
+# この秒数以内に処理が終われば defer せずに直接応答する（Discordの応答期限は3秒）
+RESPONSE_DEADLINE = float(os.getenv("RESPONSE_DEADLINE", "2.0"))
+
+RESPONSES = Counter(
+    "litematica_responses_total", "Command replies by mode (direct: one call, deferred: defer + followup)."
+)
+RESPONSE_DELAY = Histogram(
+    "litematica_response_delay_seconds", "Time from the start of a command until its reply was sent."
+)
+register_metric(RESPONSES)
+register_metric(RESPONSE_DELAY)
+
+
+class Reply:
+    """
+    コマンドの応答を1回のAPI呼び出しで済ませるためのヘルパー
+
+    作成した時点から deadline 秒以内に send() が呼ばれれば response.send_message で直接応答する。
+    間に合わない場合は期限の前に defer しておき、send() では followup.send で結果を送る。
+    """
+
+    def __init__(self, interaction: discord.Interaction, deadline: float = RESPONSE_DEADLINE,
+                 ephemeral: bool = False):
+        self.interaction = interaction
+        self.ephemeral = ephemeral
+        self.deferred = False
+        self.sent = False
+        # defer した場合に followup で送ったメッセージ
+        self.message = None
+        self.started = time.perf_counter()
+        self._lock = asyncio.Lock()
+        self._timer = asyncio.get_running_loop().create_task(self._defer_later(deadline))
+
+    async def _defer_later(self, deadline: float) -> None:
+        await asyncio.sleep(deadline)
+        async with self._lock:
+            if not self.sent and not self.interaction.response.is_done():
+                await self.interaction.response.defer(thinking=True, ephemeral=self.ephemeral)
+                self.deferred = True
+
+    async def send(self, **kwargs) -> None:
+        """
+        処理結果を送る（embed や view などは response.send_message と同じ引数）
+
+        2回目以降は最初に送った応答を書き換える。
+        """
+        async with self._lock:
+            # ロックを取れた時点で期限の defer は終わっているか始まっていないので、途中の defer を止めることはない
+            self._timer.cancel()
+            if self.sent:
+                await self.edit(**kwargs)
+                return
+            deferred = self.deferred or self.interaction.response.is_done()
+            if deferred:
+                # defer の「考え中」のメッセージが結果に置き換わる
+                self.message = await self.interaction.followup.send(ephemeral=self.ephemeral, wait=True, **kwargs)
+            else:
+                await self.interaction.response.send_message(ephemeral=self.ephemeral, **kwargs)
+            # 送れてから送信済みにする（失敗した場合、次の send() はエラーの応答を最初の応答として送る）
+            self.sent = True
+        mode = "deferred" if deferred else "direct"
+        RESPONSES.inc(mode=mode)
+        RESPONSE_DELAY.observe(time.perf_counter() - self.started, mode=mode)
+
+    async def edit(self, **kwargs) -> None:
+        """
+        send() で送った応答を書き換える（処理中の進み具合の表示など）
+        """
+        if self.message is not None:
+            await self.message.edit(**kwargs)
+        else:
+            await self.interaction.edit_original_response(**kwargs)
@@ -0,0 +1,107 @@
+import bisect
+import unicodedata
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Discord APIの自動補完の選択肢の上限
+MAX_CHOICES = 25
+
+# ひらがな → カタカナ の変換表
+_HIRAGANA_TO_KATAKANA = {code: code + 0x60 for code in range(0x3041, 0x3097)}
+
+
+def normalize(text: str) -> str:
+    """
+    検索用に文字列を正規化する（全角/半角・ひらがな/カタカナ・大文字/小文字を同一視）
+    """
+    return unicodedata.normalize("NFKC", text).translate(_HIRAGANA_TO_KATAKANA).casefold()
+
+
+class SearchIndex:
+    """
+    名前一覧に対する自動補完用の索引
+
+    接頭辞検索用に正規化した名前を並べ替えた配列（二分探索で一致する範囲を求める）と、
+    部分一致検索用の2-gram索引を持つ。
+    結果は「接頭辞一致 → 部分一致」、それぞれの中で「未完了 → 完了」の順に並べる。
+    """
+
+    def __init__(self, names: Sequence[str]):
+        self.names = names
+        self.normalized = [normalize(name) for name in self.names]
+        # 正規化した名前の順に並べた番号と、その順の名前（接頭辞が同じ名前は連続した範囲になる）
+        self._sorted_ids = sorted(range(len(self.normalized)), key=self.normalized.__getitem__)
+        self._sorted_keys = [self.normalized[i] for i in self._sorted_ids]
+        self._bigrams: Dict[str, List[int]] = {}
+
+        for i, key in enumerate(self.normalized):
+            for gram in {key[j:j + 2] for j in range(len(key) - 1)}:
+                self._bigrams.setdefault(gram, []).append(i)
+
+    def search(
+        self,
+        query: str,
+        is_checked: Optional[Callable[[int], bool]] = None,
+        limit: int = MAX_CHOICES
+    ) -> List[int]:
+        """
+        クエリに一致する名前の番号を順位順に最大 limit 件返す
+        """
+        key = normalize(query)
+        if is_checked is None:
+            is_checked = lambda i: False
+
+        ranked: List[int] = []
+        seen = set()
+
+        # 接頭辞一致（未完了を優先）
+        prefix_ids = self._prefix_ids(key)
+        self._collect(prefix_ids, is_checked, limit, ranked, seen)
+        if len(ranked) >= limit or not key:
+            return ranked
+
+        # 部分一致（未完了を優先）
+        substring_ids = (
+            i for i in self._candidate_ids(key)
+            if i not in seen and key in self.normalized[i]
+        )
+        self._collect(substring_ids, is_checked, limit, ranked, seen)
+        return ranked
+
+    def _prefix_ids(self, key: str) -> Sequence[int]:
+        if not key:
+            return range(len(self.normalized))
+        start = bisect.bisect_left(self._sorted_keys, key)
+        # 接頭辞の後ろに最大のコードポイントを付けた文字列より前までが、接頭辞で始まる名前
+        end = bisect.bisect_left(self._sorted_keys, key + "\U0010ffff", start)
+        # 元の並び順に戻す
+        return sorted(self._sorted_ids[start:end])
+
+    def _candidate_ids(self, key: str):
+        if len(key) < 2:
+            # 1文字の場合は索引が使えないので順に走査する（25件で打ち切られる）
+            return range(len(self.normalized))
+
+        # クエリの2-gramのうち最も出現数の少ないものから候補を絞り込む
+        postings = []
+        for j in range(len(key) - 1):
+            ids = self._bigrams.get(key[j:j + 2])
+            if ids is None:
+                return []
+            postings.append(ids)
+        return min(postings, key=len)
+
+    @staticmethod
+    def _collect(ids, is_checked, limit, ranked, seen) -> None:
+        finished = []
+        for i in ids:
+            if is_checked(i):
+                if len(ranked) + len(finished) < limit:
+                    finished.append(i)
+                continue
+            ranked.append(i)
+            seen.add(i)
+            if len(ranked) >= limit:
+                return
+        for i in finished[:limit - len(ranked)]:
+            ranked.append(i)
+            seen.add(i)
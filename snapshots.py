@@ -0,0 +1,238 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from metrics import record_bytes
+
+# 1つのチャンクにまとめる行数（チェック状態の変更ではこの単位で保存し直す）
+CHUNK_ROWS = 256
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+    try:
+        with open(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _as_json(value):
+    # JSONではタプルがリストになるので、マニフェストに書いた値と比べられる形に揃える
+    return json.loads(json.dumps(value))
+
+
+class Snapshot:
+    """
+    設計図のある時点の版（行の中身はチャンクのハッシュで参照する）
+    """
+    __slots__ = ("id", "base", "reason", "created", "rows", "kinds_done", "deleted", "chunks", "storage_version")
+
+    def __init__(self, id: int, base: int, reason: str, created: float, rows: int, kinds_done: int,
+                 deleted: bool, chunks: List[str], storage_version=None):
+        self.id = id
+        # 内容が同じ版の番号（復元した版では復元元の版、削除では削除前の版）
+        self.base = base
+        self.reason = reason
+        self.created = created
+        self.rows = rows
+        self.kinds_done = kinds_done
+        self.deleted = deleted
+        self.chunks = chunks
+        # 記録した時点の保存先のバージョン（JSONの形。これより前に作ったマニフェストにはない）
+        self.storage_version = storage_version
+
+    def to_json(self) -> bytes:
+        return json.dumps({slot: getattr(self, slot) for slot in self.__slots__}).encode("utf-8")
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "Snapshot":
+        return cls(**json.loads(data))
+
+
+class SnapshotStore:
+    """
+    設計図のすべての版を記録するスナップショット置き場
+
+    行は CHUNK_ROWS 行ごとのチャンクに分け、内容のハッシュをファイル名にして圧縮して保存する。
+    版はチャンクのハッシュの一覧（マニフェスト）なので、変更のないチャンクは版の間で共有され、
+    チェック状態を1つ変えても増えるのは1チャンクとマニフェストだけで済む。
+    どの版も、履歴の長さに関係なくその版のマニフェストとチャンクを読むだけで復元できる。
+
+        <directory>/objects/<ハッシュの先頭2桁>/<ハッシュ>
+        <directory>/manifests/<シャード>/<名前空間>/<設計図名>/<版の番号>.json
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # (名前空間, 設計図名) → 最新の版（チャンクの再計算を減らすため）
+        self._heads: Dict[Tuple[str, str], Optional[Snapshot]] = {}
+
+    def _manifest_dir(self, namespace: str, list_title: str) -> str:
+        shard = hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:2]
+        return os.path.join(self.directory, "manifests", shard, *(namespace.split("/") if namespace else ["_"]),
+                            list_title)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def _put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            compressed = zlib.compress(data)
+            _write_atomic(path, compressed)
+            record_bytes("write", "snapshot", len(compressed))
+        return digest
+
+    def _get(self, digest: str) -> bytes:
+        with open(self._object_path(digest), "rb") as f:
+            compressed = f.read()
+        record_bytes("read", "snapshot", len(compressed))
+        return zlib.decompress(compressed)
+
+    def versions(self, namespace: str, list_title: str) -> List[int]:
+        try:
+            names = os.listdir(self._manifest_dir(namespace, list_title))
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-5]) for name in names if name.endswith(".json") and name[:-5].isdigit())
+
+    def get(self, namespace: str, list_title: str, version: int) -> Snapshot:
+        path = os.path.join(self._manifest_dir(namespace, list_title), f"{version:08d}.json")
+        try:
+            with open(path, "rb") as f:
+                return Snapshot.from_json(f.read())
+        except FileNotFoundError:
+            raise FileNotFoundError(f"{list_title} の版 {version} が見つかりません。") from None
+
+    def history(self, namespace: str, list_title: str, limit: Optional[int] = None) -> List[Snapshot]:
+        """
+        新しい順に版を返す
+        """
+        versions = self.versions(namespace, list_title)[::-1]
+        if limit is not None:
+            versions = versions[:limit]
+        return [self.get(namespace, list_title, version) for version in versions]
+
+    def head(self, namespace: str, list_title: str) -> Optional[Snapshot]:
+        key = (namespace, list_title)
+        if key not in self._heads:
+            versions = self.versions(namespace, list_title)
+            self._heads[key] = self.get(namespace, list_title, versions[-1]) if versions else None
+        return self._heads[key]
+
+    def load(self, namespace: str, list_title: str, version: int) -> Tuple[Snapshot, List[List[str]]]:
+        """
+        版の行を復元する
+        """
+        snapshot = self.get(namespace, list_title, version)
+        rows = []
+        for digest in snapshot.chunks:
+            rows.extend(csv.reader(io.StringIO(self._get(digest).decode("utf-8"))))
+        return snapshot, rows
+
+    def record(self, blueprint, reason: str, changed: Optional[Iterable[int]] = None,
+               base: Optional[int] = None, previous_version: Optional[Hashable] = None) -> Snapshot:
+        """
+        設計図の現在の内容を新しい版として記録する
+
+        changed にチェック状態を変えた行番号、previous_version に変更前の保存先のバージョンを渡すと、
+        その行を含むチャンクだけを保存し直す。最新の版が previous_version の内容でない場合
+        （前回の記録に失敗した、ジャーナルの再生で保存先が変わったなど）は、すべてのチャンクを記録する。
+        """
+        with self._lock:
+            head = self.head(blueprint.namespace, blueprint.title)
+            count = len(blueprint.names)
+            chunk_count = (count + CHUNK_ROWS - 1) // CHUNK_ROWS
+            if (changed is not None and head is not None and not head.deleted and head.rows == count
+                    and head.storage_version is not None and head.storage_version == _as_json(previous_version)):
+                chunks = list(head.chunks)
+                for chunk in {i // CHUNK_ROWS for i in changed}:
+                    chunks[chunk] = self._put(self._chunk_bytes(blueprint, chunk))
+            else:
+                chunks = [self._put(self._chunk_bytes(blueprint, chunk)) for chunk in range(chunk_count)]
+
+            version = head.id + 1 if head is not None else 1
+            snapshot = Snapshot(version, version if base is None else base, reason, time.time(), count,
+                                blueprint.progress.kinds_done, False, chunks, _as_json(blueprint.version))
+            self._write(blueprint.namespace, blueprint.title, snapshot)
+            return snapshot
+
+    def backup(self, blueprint) -> Snapshot:
+        """
+        最新の版が設計図の今の内容と同じならその版を、違う（または版がない）場合は今の内容を新しい版として記録して返す
+        """
+        with self._lock:
+            head = self.head(blueprint.namespace, blueprint.title)
+            count = len(blueprint.names)
+            chunk_count = (count + CHUNK_ROWS - 1) // CHUNK_ROWS
+            # 同じ内容のチャンクはすでに保存されているので、ハッシュを計算するだけで済む
+            chunks = [self._put(self._chunk_bytes(blueprint, chunk)) for chunk in range(chunk_count)]
+            if head is not None and not head.deleted and head.chunks == chunks:
+                return head
+
+            version = head.id + 1 if head is not None else 1
+            snapshot = Snapshot(version, version, "backup", time.time(), count, blueprint.progress.kinds_done,
+                                False, chunks, _as_json(blueprint.version))
+            self._write(blueprint.namespace, blueprint.title, snapshot)
+            return snapshot
+
+    def record_delete(self, namespace: str, list_title: str) -> Optional[Snapshot]:
+        """
+        削除したことを版として記録する（内容は削除前の版のまま。先に backup() で削除前の内容を記録しておく）
+        """
+        with self._lock:
+            head = self.head(namespace, list_title)
+            if head is None or head.deleted:
+                return None
+            snapshot = Snapshot(head.id + 1, head.base, "delete", time.time(), head.rows, head.kinds_done, True,
+                                head.chunks)
+            self._write(namespace, list_title, snapshot)
+            return snapshot
+
+    def undo_target(self, namespace: str, list_title: str) -> Snapshot:
+        """
+        /litematica-undo で戻す版を返す（削除した設計図は削除前の版、それ以外は1つ前の版）
+
+        1つ前の版が削除の版の場合は、その削除の前の版に戻す。
+        """
+        head = self.head(namespace, list_title)
+        if head is None:
+            raise FileNotFoundError(f"{list_title} の履歴がありません。")
+        target = head.base if head.deleted else head.base - 1
+        while target >= 1:
+            snapshot = self.get(namespace, list_title, target)
+            if not snapshot.deleted:
+                return snapshot
+            # 削除の版には戻せないので、削除前の版（削除の版より必ず前）まで遡る
+            target = snapshot.base
+        raise ValueError(f"{list_title} はこれ以上前の版に戻せません。")
+
+    def _write(self, namespace: str, list_title: str, snapshot: Snapshot) -> None:
+        path = os.path.join(self._manifest_dir(namespace, list_title), f"{snapshot.id:08d}.json")
+        _write_atomic(path, snapshot.to_json())
+        self._heads[(namespace, list_title)] = snapshot
+
+    @staticmethod
+    def _chunk_bytes(blueprint, chunk: int) -> bytes:
+        start = chunk * CHUNK_ROWS
+        end = min(start + CHUNK_ROWS, len(blueprint.names))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        names, checked = blueprint.names, blueprint.checked
+        writer.writerows((names[i], blueprint.count_text(i), "1" if checked[i] else "0") for i in range(start, end))
+        return buffer.getvalue().encode("utf-8")
@@ -0,0 +1,640 @@
+import contextlib
+import csv
+import hashlib
+import itertools
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from metrics import record_bytes
+
+# blueprintディレクトリのパス
+BLUEPRINT_DIR = os.path.join(os.path.dirname(__file__), "blueprint")
+
+# SQLiteデータベースのパス
+BLUEPRINT_DB = os.path.join(os.path.dirname(__file__), "blueprints.db")
+
+# CSVのヘッダー行
+HEADER = ["Item", "Total", "check"]
+
+# 名前空間を持たない（従来の、全サーバー共通の）設計図の名前空間
+LEGACY_NAMESPACE = ""
+
+# 進み具合の集計（完了した種類数, 種類数, 完了した個数, 個数）
+ProgressValues = Tuple[int, int, int, int]
+
+
+def rows_size(rows: Iterable[Sequence[str]]) -> int:
+    # CSVにしたときのおおよそのバイト数（SQLiteの読み書き量の計測に使う）
+    return sum(len(row[0].encode("utf-8")) + len(row[1]) + len(row[2]) + 3 for row in rows)
+
+
+def normalize_row(row: Sequence[str]) -> List[str]:
+    # Item, Total, check の3列に揃える
+    row = list(row[:3])
+    while len(row) < 3:
+        row.append("")
+    return row
+
+
+class BlueprintStorage:
+    """
+    設計図の保存先の基底クラス
+
+    設計図は名前空間（サーバーやチャンネルごと）と設計図名の組で識別する。
+    version() は設計図が変更されるたびに変わる値を返し、キャッシュの無効化に使う。
+    """
+
+    def namespaces(self) -> List[str]:
+        raise NotImplementedError
+
+    def titles(self, namespace: str) -> List[str]:
+        raise NotImplementedError
+
+    def titles_version(self, namespace: str) -> Hashable:
+        raise NotImplementedError
+
+    def version(self, namespace: str, list_title: str) -> Optional[Hashable]:
+        """
+        設計図のバージョンを返す（存在しない場合は None）
+        """
+        raise NotImplementedError
+
+    def load(self, namespace: str, list_title: str) -> Tuple[List[List[str]], Hashable]:
+        raise NotImplementedError
+
+    def save(self, namespace: str, list_title: str, rows: List[List[str]]) -> Hashable:
+        raise NotImplementedError
+
+    def update_checks(self, namespace: str, list_title: str, rows: List[List[str]], indices: Iterable[int]) -> Hashable:
+        """
+        rows のうち indices の行の check 列だけが変わったことを保存する
+        """
+        raise NotImplementedError
+
+    def apply_diff(self, namespace: str, list_title: str, rows: List[List[str]],
+                   updated: List[Tuple[int, List[str]]], removed: List[int],
+                   added: List[List[str]]) -> Hashable:
+        """
+        設計図の差分を保存する
+
+        updated と removed の行番号は変更前の並び順、rows は変更後のすべての行
+        （変更前の行のうち残ったものの後に added が続く）。
+        行単位で書き換えられない保存先は rows をそのまま保存する。
+        """
+        return self.save(namespace, list_title, rows)
+
+    def delete(self, namespace: str, list_title: str) -> None:
+        raise NotImplementedError
+
+    def info(self, namespace: str, list_title: str) -> Dict[str, object]:
+        """
+        設計図の保存情報（name, size, created, modified）を返す
+        """
+        raise NotImplementedError
+
+    def load_progress(self, namespace: str) -> Dict[str, Tuple[Hashable, ProgressValues]]:
+        """
+        save_progress() で保存した進み具合の集計を返す（設計図名 → (集計した時点のバージョン, 集計)）
+
+        バージョンが version() と異なる集計は古いので使わない。集計を保存しない保存先は空の辞書を返す。
+        """
+        return {}
+
+    def save_progress(self, namespace: str, progresses: Dict[str, Tuple[Hashable, ProgressValues]]) -> None:
+        """
+        設計図の進み具合の集計を、集計した時点のバージョンとともに保存する
+        """
+
+
+class CsvStorage(BlueprintStorage):
+    """
+    CSVファイルに保存する
+
+    名前空間ごとに blueprint/<シャード>/<名前空間>/<list_title>.csv に分けて保存する。
+    シャードは名前空間のハッシュの先頭2桁で、1つのディレクトリにファイルが集中しないようにする。
+    従来の名前空間（LEGACY_NAMESPACE）は blueprint/<list_title>.csv のまま。
+    進み具合の集計は名前空間のディレクトリの .progress（CSV形式）に、変わった設計図の行だけを追記していく
+    （同じ設計図の行は後のものが優先）。前回詰めたときの2倍を超えて大きくなったら書き直して詰める。
+    """
+
+    # 進み具合の集計のファイル名（拡張子が .csv ではないので設計図としては数えない）
+    PROGRESS_FILE = ".progress"
+    # 集計のファイルが前回詰めたときの2倍とこのバイト数を超えたら書き直す
+    PROGRESS_COMPACT_BYTES = 64 * 1024
+
+    def __init__(self, directory: str = BLUEPRINT_DIR):
+        self.directory = directory
+        # 集計のファイルへの書き込みを直列化する
+        self._progress_lock = threading.Lock()
+        # 名前空間 → 前回詰めたとき（または最初に追記したとき）の集計のファイルの大きさ
+        self._progress_sizes: Dict[str, int] = {}
+
+    def namespace_dir(self, namespace: str) -> str:
+        if namespace == LEGACY_NAMESPACE:
+            return self.directory
+        shard = hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:2]
+        return os.path.join(self.directory, shard, *namespace.split("/"))
+
+    def path(self, namespace: str, list_title: str) -> str:
+        return os.path.join(self.namespace_dir(namespace), f"{list_title}.csv")
+
+    def progress_path(self, namespace: str) -> str:
+        return os.path.join(self.namespace_dir(namespace), self.PROGRESS_FILE)
+
+    def namespaces(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        namespaces = []
+        if any(f.endswith('.csv') for f in os.listdir(self.directory)):
+            namespaces.append(LEGACY_NAMESPACE)
+        for shard in sorted(os.listdir(self.directory)):
+            shard_dir = os.path.join(self.directory, shard)
+            if len(shard) != 2 or not os.path.isdir(shard_dir):
+                continue
+            for current, _, files in os.walk(shard_dir):
+                if any(f.endswith('.csv') for f in files):
+                    namespaces.append(os.path.relpath(current, shard_dir).replace(os.sep, "/"))
+        return namespaces
+
+    def titles(self, namespace: str) -> List[str]:
+        namespace_dir = self.namespace_dir(namespace)
+        if not os.path.isdir(namespace_dir):
+            return []
+        # 名前空間内のCSVファイル名を拡張子なしで取得
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(namespace_dir)
+                      if f.endswith('.csv'))
+
+    def titles_version(self, namespace: str) -> Hashable:
+        try:
+            return os.stat(self.namespace_dir(namespace)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def version(self, namespace: str, list_title: str) -> Optional[Hashable]:
+        try:
+            stat = os.stat(self.path(namespace, list_title))
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self, namespace: str, list_title: str) -> Tuple[List[List[str]], Hashable]:
+        csv_file_path = self.path(namespace, list_title)
+        try:
+            f = open(csv_file_path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            raise FileNotFoundError(f"ファイル {list_title}.csv が見つかりません。")
+
+        with f:
+            stat = os.fstat(f.fileno())
+            reader = csv.reader(f)
+            next(reader, None)  # ヘッダー行をスキップ
+            rows = [normalize_row(row) for row in reader if len(row) >= 1]
+        record_bytes("read", "load", stat.st_size)
+        return rows, (stat.st_mtime_ns, stat.st_size)
+
+    def save(self, namespace: str, list_title: str, rows: List[List[str]]) -> Hashable:
+        namespace_dir = self.namespace_dir(namespace)
+        os.makedirs(namespace_dir, exist_ok=True)
+        csv_file_path = self.path(namespace, list_title)
+
+        # 一時ファイルに書き込んでから置き換える（途中で落ちても元のファイルは壊れない）
+        fd, temp_file_path = tempfile.mkstemp(prefix=f".{list_title}.", suffix=".tmp", dir=namespace_dir)
+        try:
+            with open(fd, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(HEADER)
+                writer.writerows(rows)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file_path, csv_file_path)
+        except BaseException:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            raise
+
+        stat = os.stat(csv_file_path)
+        record_bytes("write", "save", stat.st_size)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def update_checks(self, namespace: str, list_title: str, rows: List[List[str]], indices: Iterable[int]) -> Hashable:
+        # CSVは行単位で書き換えられないので全体を書き直す
+        return self.save(namespace, list_title, rows)
+
+    def delete(self, namespace: str, list_title: str) -> None:
+        os.remove(self.path(namespace, list_title))
+        # 集計はバージョンが合わなければ使われないので、消せなくても設計図の削除は失敗させない
+        with self._progress_lock, contextlib.suppress(OSError):
+            progresses = self.load_progress(namespace)
+            if progresses.pop(list_title, None) is not None:
+                self._write_progress(namespace, progresses)
+
+    def info(self, namespace: str, list_title: str) -> Dict[str, object]:
+        csv_file_path = self.path(namespace, list_title)
+        stat = os.stat(csv_file_path)
+        return {
+            "name": os.path.basename(csv_file_path),
+            "size": stat.st_size,
+            "created": stat.st_ctime,
+            "modified": stat.st_mtime,
+        }
+
+    def load_progress(self, namespace: str) -> Dict[str, Tuple[Hashable, ProgressValues]]:
+        try:
+            f = open(self.progress_path(namespace), 'r', newline='', encoding='utf-8')
+        except FileNotFoundError:
+            return {}
+
+        # 1行に 設計図名, 集計の4つの値, mtime_ns, サイズ を並べる
+        # （バージョンを最後に置くので、書き込み途中で切れた行はバージョンが合わずに使われない）
+        progresses = {}
+        with f:
+            for row in csv.reader(f):
+                try:
+                    *values, mtime_ns, size = map(int, row[1:])
+                except ValueError:
+                    # 壊れた行は無視する（その設計図は読み込んで集計し直す）
+                    continue
+                if len(values) == 4:
+                    progresses[row[0]] = ((mtime_ns, size), tuple(values))
+        return progresses
+
+    def save_progress(self, namespace: str, progresses: Dict[str, Tuple[Hashable, ProgressValues]]) -> None:
+        # チェックのたびに呼ばれるので、ファイル全体ではなく変わった設計図の行だけを追記する
+        with self._progress_lock:
+            os.makedirs(self.namespace_dir(namespace), exist_ok=True)
+            with open(self.progress_path(namespace), 'a', newline='', encoding='utf-8') as f:
+                base = self._progress_sizes.setdefault(namespace, os.fstat(f.fileno()).st_size)
+                csv.writer(f).writerows(self._progress_rows(progresses))
+                f.flush()
+                size = os.fstat(f.fileno()).st_size
+            if size > 2 * base + self.PROGRESS_COMPACT_BYTES:
+                self._write_progress(namespace, self.load_progress(namespace))
+
+    @staticmethod
+    def _progress_rows(progresses: Dict[str, Tuple[Hashable, ProgressValues]]) -> Iterable[List[object]]:
+        return ([list_title, *values, *version] for list_title, (version, values) in progresses.items())
+
+    def _write_progress(self, namespace: str, progresses: Dict[str, Tuple[Hashable, ProgressValues]]) -> None:
+        namespace_dir = self.namespace_dir(namespace)
+        os.makedirs(namespace_dir, exist_ok=True)
+
+        # 集計は作り直せるので fsync はせず、置き換えだけを原子的に行う
+        fd, temp_file_path = tempfile.mkstemp(prefix=f"{self.PROGRESS_FILE}.", suffix=".tmp", dir=namespace_dir)
+        try:
+            with open(fd, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(self._progress_rows(dict(sorted(progresses.items()))))
+                size = f.tell()
+            os.replace(temp_file_path, self.progress_path(namespace))
+            self._progress_sizes[namespace] = size
+        except BaseException:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            raise
+
+
+class SqliteStorage(BlueprintStorage):
+    """
+    SQLite（WALモード）に保存する
+
+    アイテムは (namespace, title, item) で索引付けされ、チェック状態の変更は1行のUPDATEで済む。
+    進み具合の集計は progress テーブルに、集計した時点のバージョンとともに保存する。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS blueprints (
+            namespace TEXT NOT NULL,
+            title TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            created REAL NOT NULL,
+            modified REAL NOT NULL,
+            PRIMARY KEY (namespace, title)
+        );
+        CREATE TABLE IF NOT EXISTS items (
+            namespace TEXT NOT NULL,
+            title TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            item TEXT NOT NULL,
+            total TEXT NOT NULL,
+            checked TEXT NOT NULL,
+            PRIMARY KEY (namespace, title, position)
+        );
+        CREATE INDEX IF NOT EXISTS items_by_name ON items (namespace, title, item);
+        CREATE TABLE IF NOT EXISTS progress (
+            namespace TEXT NOT NULL,
+            title TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            kinds_done INTEGER NOT NULL,
+            kinds_total INTEGER NOT NULL,
+            count_done INTEGER NOT NULL,
+            count_total INTEGER NOT NULL,
+            PRIMARY KEY (namespace, title)
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+    """
+
+    def __init__(self, path: str = BLUEPRINT_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._conn.executescript(self.SCHEMA)
+
+    def _migrate(self) -> None:
+        # 名前空間の列がない古いデータベースは従来の名前空間として移行する
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(blueprints)")]
+        if not columns or "namespace" in columns:
+            return
+        self._conn.executescript("""
+            BEGIN IMMEDIATE;
+            DROP INDEX IF EXISTS items_by_name;
+            ALTER TABLE blueprints RENAME TO blueprints_old;
+            ALTER TABLE items RENAME TO items_old;
+        """ + self.SCHEMA + """
+            INSERT INTO blueprints (namespace, title, version, created, modified)
+                SELECT '', title, version, created, modified FROM blueprints_old;
+            INSERT INTO items (namespace, title, position, item, total, checked)
+                SELECT '', title, position, item, total, checked FROM items_old;
+            DROP TABLE blueprints_old;
+            DROP TABLE items_old;
+            COMMIT;
+        """)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def namespaces(self) -> List[str]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT DISTINCT namespace FROM blueprints ORDER BY namespace")
+            return [namespace for (namespace,) in cursor]
+
+    def titles(self, namespace: str) -> List[str]:
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT title FROM blueprints WHERE namespace = ? ORDER BY title", (namespace,)
+            )
+            return [title for (title,) in cursor]
+
+    def titles_version(self, namespace: str) -> Hashable:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (f"titles_version:{namespace}",)
+            ).fetchone()
+            return row[0] if row else 0
+
+    def version(self, namespace: str, list_title: str) -> Optional[Hashable]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM blueprints WHERE namespace = ? AND title = ?", (namespace, list_title)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load(self, namespace: str, list_title: str) -> Tuple[List[List[str]], Hashable]:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                row = self._conn.execute(
+                    "SELECT version FROM blueprints WHERE namespace = ? AND title = ?", (namespace, list_title)
+                ).fetchone()
+                if row is None:
+                    raise FileNotFoundError(f"設計図 {list_title} が見つかりません。")
+                cursor = self._conn.execute(
+                    "SELECT item, total, checked FROM items WHERE namespace = ? AND title = ? ORDER BY position",
+                    (namespace, list_title)
+                )
+                rows = [list(item) for item in cursor]
+            finally:
+                self._conn.execute("COMMIT")
+        record_bytes("read", "load", rows_size(rows))
+        return rows, row[0]
+
+    def save(self, namespace: str, list_title: str, rows: List[List[str]]) -> Hashable:
+        now = time.time()
+        with self._lock, self._transaction():
+            version = self._next_version()
+            existing = self._conn.execute(
+                "SELECT version FROM blueprints WHERE namespace = ? AND title = ?", (namespace, list_title)
+            ).fetchone()
+            if existing is None:
+                self._conn.execute(
+                    "INSERT INTO blueprints (namespace, title, version, created, modified) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, list_title, version, now, now)
+                )
+                self._bump_titles_version(namespace)
+            else:
+                self._conn.execute(
+                    "UPDATE blueprints SET version = ?, modified = ? WHERE namespace = ? AND title = ?",
+                    (version, now, namespace, list_title)
+                )
+                self._conn.execute("DELETE FROM items WHERE namespace = ? AND title = ?", (namespace, list_title))
+
+            self._conn.executemany(
+                "INSERT INTO items (namespace, title, position, item, total, checked) VALUES (?, ?, ?, ?, ?, ?)",
+                ((namespace, list_title, i, row[0], row[1], row[2]) for i, row in enumerate(rows))
+            )
+        record_bytes("write", "save", rows_size(rows))
+        return version
+
+    def update_checks(self, namespace: str, list_title: str, rows: List[List[str]], indices: Iterable[int]) -> Hashable:
+        indices = list(indices)
+        with self._lock, self._transaction():
+            row = self._conn.execute(
+                "SELECT version FROM blueprints WHERE namespace = ? AND title = ?", (namespace, list_title)
+            ).fetchone()
+            if row is None:
+                raise FileNotFoundError(f"設計図 {list_title} が見つかりません。")
+            version = self._next_version()
+
+            # (namespace, title, item) の索引を使って1行ずつ更新する
+            self._conn.executemany(
+                "UPDATE items SET checked = ? WHERE rowid = ("
+                "SELECT rowid FROM items WHERE namespace = ? AND title = ? AND item = ? ORDER BY position LIMIT 1)",
+                ((rows[i][2], namespace, list_title, rows[i][0]) for i in indices)
+            )
+            self._conn.execute(
+                "UPDATE blueprints SET version = ?, modified = ? WHERE namespace = ? AND title = ?",
+                (version, time.time(), namespace, list_title)
+            )
+        record_bytes("write", "update_checks", rows_size(rows[i] for i in indices))
+        return version
+
+    def apply_diff(self, namespace: str, list_title: str, rows: List[List[str]],
+                   updated: List[Tuple[int, List[str]]], removed: List[int],
+                   added: List[List[str]]) -> Hashable:
+        with self._lock, self._transaction():
+            row = self._conn.execute(
+                "SELECT version FROM blueprints WHERE namespace = ? AND title = ?", (namespace, list_title)
+            ).fetchone()
+            if row is None:
+                raise FileNotFoundError(f"設計図 {list_title} が見つかりません。")
+            version = self._next_version()
+
+            # 変更前の並び順の行番号 → rowid（変更した行だけを書き換えるため）
+            rowids = [rowid for (rowid,) in self._conn.execute(
+                "SELECT rowid FROM items WHERE namespace = ? AND title = ? ORDER BY position", (namespace, list_title)
+            )]
+            self._conn.executemany(
+                "UPDATE items SET total = ?, checked = ? WHERE rowid = ?",
+                ((new_row[1], new_row[2], rowids[i]) for i, new_row in updated)
+            )
+            self._conn.executemany("DELETE FROM items WHERE rowid = ?", ((rowids[i],) for i in removed))
+
+            # 追加した行は末尾に並べる
+            (last_position,) = self._conn.execute(
+                "SELECT COALESCE(MAX(position), -1) FROM items WHERE namespace = ? AND title = ?",
+                (namespace, list_title)
+            ).fetchone()
+            self._conn.executemany(
+                "INSERT INTO items (namespace, title, position, item, total, checked) VALUES (?, ?, ?, ?, ?, ?)",
+                ((namespace, list_title, last_position + 1 + i, new_row[0], new_row[1], new_row[2])
+                 for i, new_row in enumerate(added))
+            )
+            self._conn.execute(
+                "UPDATE blueprints SET version = ?, modified = ? WHERE namespace = ? AND title = ?",
+                (version, time.time(), namespace, list_title)
+            )
+        record_bytes("write", "apply_diff", rows_size(itertools.chain((r for _, r in updated), added)))
+        return version
+
+    def delete(self, namespace: str, list_title: str) -> None:
+        with self._lock, self._transaction():
+            cursor = self._conn.execute(
+                "DELETE FROM blueprints WHERE namespace = ? AND title = ?", (namespace, list_title)
+            )
+            if cursor.rowcount == 0:
+                raise FileNotFoundError(f"設計図 {list_title} が見つかりません。")
+            self._conn.execute("DELETE FROM items WHERE namespace = ? AND title = ?", (namespace, list_title))
+            self._conn.execute("DELETE FROM progress WHERE namespace = ? AND title = ?", (namespace, list_title))
+            self._bump_titles_version(namespace)
+
+    def info(self, namespace: str, list_title: str) -> Dict[str, object]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created, modified FROM blueprints WHERE namespace = ? AND title = ?", (namespace, list_title)
+            ).fetchone()
+            if row is None:
+                raise FileNotFoundError(f"設計図 {list_title} が見つかりません。")
+            (size,) = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(item) + LENGTH(total) + LENGTH(checked) + 3), 0) "
+                "FROM items WHERE namespace = ? AND title = ?",
+                (namespace, list_title)
+            ).fetchone()
+        return {
+            "name": f"{list_title} ({os.path.basename(self.path)})",
+            "size": size,
+            "created": row[0],
+            "modified": row[1],
+        }
+
+    def load_progress(self, namespace: str) -> Dict[str, Tuple[Hashable, ProgressValues]]:
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT title, version, kinds_done, kinds_total, count_done, count_total "
+                "FROM progress WHERE namespace = ?", (namespace,)
+            )
+            return {title: (version, tuple(values)) for title, version, *values in cursor}
+
+    def save_progress(self, namespace: str, progresses: Dict[str, Tuple[Hashable, ProgressValues]]) -> None:
+        with self._lock, self._transaction():
+            self._conn.executemany(
+                "INSERT INTO progress (namespace, title, version, kinds_done, kinds_total, count_done, count_total) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (namespace, title) DO UPDATE SET "
+                "version = excluded.version, kinds_done = excluded.kinds_done, kinds_total = excluded.kinds_total, "
+                "count_done = excluded.count_done, count_total = excluded.count_total",
+                ((namespace, list_title, version, *values) for list_title, (version, values) in progresses.items())
+            )
+
+    def _bump_titles_version(self, namespace: str) -> None:
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, 1) ON CONFLICT (key) DO UPDATE SET value = value + 1",
+            (f"titles_version:{namespace}",)
+        )
+
+    def _next_version(self) -> int:
+        # 削除後に同名で作り直しても値が重ならないよう、全体で単調増加させる
+        self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        (value,) = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return value
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+
+def create_storage() -> BlueprintStorage:
+    """
+    環境変数 BLUEPRINT_STORAGE（csv / sqlite）に応じた保存先を作成する
+    """
+    backend = os.getenv("BLUEPRINT_STORAGE", "csv").lower()
+    if backend == "sqlite":
+        return SqliteStorage(os.getenv("BLUEPRINT_DB", BLUEPRINT_DB))
+    if backend == "csv":
+        return CsvStorage(os.getenv("BLUEPRINT_DIR", BLUEPRINT_DIR))
+    raise ValueError(f"不明な保存先です: {backend}")
+
+
+def copy_blueprints(source: BlueprintStorage, destination: BlueprintStorage,
+                    namespaces: Optional[List[str]] = None,
+                    destination_namespace: Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    source の設計図を destination に複製し、複製した (名前空間, 設計図名) を返す
+
+    destination_namespace を指定した場合はすべてその名前空間に複製する。
+    """
+    copied = []
+    for namespace in (source.namespaces() if namespaces is None else namespaces):
+        target = namespace if destination_namespace is None else destination_namespace
+        for list_title in source.titles(namespace):
+            rows, _ = source.load(namespace, list_title)
+            destination.save(target, list_title, rows)
+            copied.append((target, list_title))
+    return copied
+
+
+if __name__ == "__main__":
+    # 使い方:
+    #   python storage.py import [CSVディレクトリ]   … CSVをSQLiteに取り込む
+    #   python storage.py export [CSVディレクトリ]   … SQLiteの内容をCSVに書き出す
+    #   python storage.py migrate <名前空間>         … 名前空間のない従来の設計図を指定した名前空間（サーバーID）に移す
+    if len(sys.argv) < 2 or sys.argv[1] not in ("import", "export", "migrate"):
+        print("usage: python storage.py import|export [directory] | migrate <namespace>")
+        sys.exit(1)
+
+    if sys.argv[1] == "migrate":
+        if len(sys.argv) < 3:
+            print("usage: python storage.py migrate <namespace>")
+            sys.exit(1)
+        storage = create_storage()
+        copied = copy_blueprints(storage, storage, [LEGACY_NAMESPACE], sys.argv[2])
+        for _, list_title in copied:
+            storage.delete(LEGACY_NAMESPACE, list_title)
+    else:
+        directory = sys.argv[2] if len(sys.argv) > 2 else BLUEPRINT_DIR
+        csv_storage = CsvStorage(directory)
+        sqlite_storage = SqliteStorage(os.getenv("BLUEPRINT_DB", BLUEPRINT_DB))
+
+        if sys.argv[1] == "import":
+            copied = copy_blueprints(csv_storage, sqlite_storage)
+        else:
+            copied = copy_blueprints(sqlite_storage, csv_storage)
+
+    for namespace, list_title in copied:
+        print(f"{sys.argv[1]}: {namespace or '(共通)'}/{list_title}")
+    print(f"{len(copied)} 件の設計図を処理しました")
@@ -0,0 +1,44 @@
+"""
+テストの共通設定
+
+保存先はコマンドを読み込む前に環境変数で決まるので、ここで一時ディレクトリに向けておく。
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+_workdir = tempfile.mkdtemp(prefix="litematica-test-")
+os.environ["BLUEPRINT_STORAGE"] = "csv"
+os.environ["BLUEPRINT_DIR"] = os.path.join(_workdir, "blueprint")
+os.environ["BLUEPRINT_DB"] = os.path.join(_workdir, "blueprints.db")
+os.environ["WRITE_BEHIND"] = "0"
+os.environ["WRITE_BEHIND_JOURNAL"] = os.path.join(_workdir, "blueprint.journal")
+os.environ["SNAPSHOT_DIR"] = os.path.join(_workdir, "snapshots")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _cleanup_workdir():
+    yield
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def bot_commands():
+    """
+    コマンド名 → コールバック（偽の Interaction で直接呼び出す）
+    """
+    import discord
+    from discord.ext import commands
+
+    import command
+
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.default())
+    command.setup(bot)
+    return {cmd.name: cmd.callback for cmd in bot.tree.get_commands()}
@@ -0,0 +1,112 @@
+"""
+同時に実行されたチェック状態の変更が失われないことを確かめる
+"""
+import asyncio
+import threading
+
+import pytest
+
+from blueprint_store import BlueprintCache, blueprint_cache, blueprint_namespace
+from fakes import FakeInteraction
+from journal import CheckJournal
+from storage import CsvStorage
+
+ITEMS = 300
+
+
+def _failed(interaction) -> bool:
+    embed = interaction.last_embed()
+    return embed is None or (embed.title or "").startswith("❌")
+
+
+async def _check_all(bot_commands, list_title, statuses):
+    # すべてのアイテムのチェック状態の変更を同時に実行する
+    interactions = [FakeInteraction() for _ in statuses]
+    await asyncio.gather(*(
+        bot_commands["litematica-check"](interaction, list_title, name, status)
+        for interaction, (name, status) in zip(interactions, statuses.items())
+    ))
+    assert not any(_failed(interaction) for interaction in interactions)
+
+
+def _assert_checked(namespace, list_title, expected):
+    # キャッシュと保存先（キャッシュを通さずに読み直す）の両方で確かめる
+    for cache in (blueprint_cache, BlueprintCache(blueprint_cache.storage)):
+        rows = cache.get(namespace, list_title).rows
+        assert {row[0]: row[2] for row in rows} == expected
+
+
+@pytest.mark.parametrize("write_behind", [False, True], ids=["write-through", "write-behind"])
+def test_concurrent_checks_are_not_lost(bot_commands, monkeypatch, tmp_path, write_behind):
+    if write_behind:
+        monkeypatch.setattr(blueprint_cache, "journal", CheckJournal(str(tmp_path / "blueprint.journal")))
+    namespace = blueprint_namespace(FakeInteraction())
+    list_title = f"concurrency-{'write-behind' if write_behind else 'write-through'}"
+    names = [f"Item {i:03d}" for i in range(ITEMS)]
+    blueprint_cache.save(namespace, list_title, [[name, str(i + 1), "0"] for i, name in enumerate(names)])
+
+    async def scenario():
+        # 1回目: すべて完了にする
+        await _check_all(bot_commands, list_title, {name: "done" for name in names})
+        # 2回目: 偶数番目だけ未完了に戻し、奇数番目は同じ状態をもう一度送る
+        await _check_all(bot_commands, list_title,
+                         {name: "undone" if i % 2 == 0 else "done" for i, name in enumerate(names)})
+
+    asyncio.run(scenario())
+    if write_behind:
+        blueprint_cache.flush()
+
+    _assert_checked(namespace, list_title, {name: "0" if i % 2 == 0 else "1" for i, name in enumerate(names)})
+    blueprint_cache.delete(namespace, list_title)
+
+
+def _flush_during(cache, monkeypatch, method):
+    # 保存先の method の直後（キャッシュの後始末の前）に、別スレッドの flush() を割り込ませる
+    original = getattr(cache.storage, method)
+    flushers = []
+
+    def interleaved(*args, **kwargs):
+        result = original(*args, **kwargs)
+        flusher = threading.Thread(target=cache.flush)
+        flusher.start()
+        # 割り込めるなら flush() はこの間に終わる（ロックで待たされる場合は待ちきれずに進む）
+        flusher.join(0.2)
+        flushers.append(flusher)
+        return result
+
+    monkeypatch.setattr(cache.storage, method, interleaved)
+    return flushers
+
+
+def _write_behind_cache(tmp_path):
+    cache = BlueprintCache(CsvStorage(str(tmp_path / "blueprint")),
+                           journal=CheckJournal(str(tmp_path / "blueprint.journal")))
+    cache.save("ns", "list", [["Stone", "10", "0"], ["Glass", "5", "0"]])
+    # 未書き込みのチェック状態を作っておく
+    cache.update_check("ns", "list", "Stone", True)
+    assert cache.dirty_count == 1
+    return cache
+
+
+def test_flush_does_not_overwrite_a_save(monkeypatch, tmp_path):
+    cache = _write_behind_cache(tmp_path)
+    flushers = _flush_during(cache, monkeypatch, "save")
+
+    cache.save("ns", "list", [["Dirt", "99", "0"]])
+    for flusher in flushers:
+        flusher.join()
+
+    assert cache.get("ns", "list").rows[:] == [["Dirt", "99", "0"]]
+    assert BlueprintCache(cache.storage).get("ns", "list").rows[:] == [["Dirt", "99", "0"]]
+
+
+def test_flush_does_not_restore_a_deleted_list(monkeypatch, tmp_path):
+    cache = _write_behind_cache(tmp_path)
+    flushers = _flush_during(cache, monkeypatch, "delete")
+
+    cache.delete("ns", "list")
+    for flusher in flushers:
+        flusher.join()
+
+    assert cache.storage.version("ns", "list") is None
+    assert "list" not in cache.titles("ns")
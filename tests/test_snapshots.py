@@ -0,0 +1,68 @@
+"""
+スナップショット（版の記録と /litematica-undo の戻し先）のテスト
+"""
+import pytest
+
+from blueprint_store import BlueprintCache
+from snapshots import CHUNK_ROWS, SnapshotStore
+from storage import CsvStorage
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BlueprintCache(CsvStorage(str(tmp_path / "blueprint")), snapshots=SnapshotStore(str(tmp_path / "snapshots")))
+
+
+def _rows(cache, list_title):
+    return [list(row) for row in cache.get("ns", list_title).rows]
+
+
+def test_undo_after_delete_then_restore(cache):
+    cache.save("ns", "list", [["Stone", "10", "0"], ["Glass", "5", "0"]])
+    cache.update_check("ns", "list", "Stone", True)
+    checked = _rows(cache, "list")
+    cache.delete("ns", "list")
+
+    # 削除の直後は削除前の版に戻す
+    _, snapshot = cache.restore("ns", "list")
+    assert snapshot.id == 2
+    assert _rows(cache, "list") == checked
+
+    # 続けて戻すとその1つ前（最初にアップロードした版）になる
+    _, snapshot = cache.restore("ns", "list")
+    assert snapshot.id == 1
+    assert _rows(cache, "list") == [["Stone", "10", "0"], ["Glass", "5", "0"]]
+
+
+def test_undo_skips_delete_snapshots(cache):
+    cache.save("ns", "list", [["Stone", "10", "0"]])
+    cache.delete("ns", "list")
+    cache.save("ns", "list", [["Dirt", "99", "0"]])
+
+    # 1つ前は削除の版なので、その前の版に戻す
+    _, snapshot = cache.restore("ns", "list")
+    assert snapshot.id == 1
+    assert _rows(cache, "list") == [["Stone", "10", "0"]]
+
+
+def test_record_after_failed_record_is_complete(cache, monkeypatch):
+    rows = [[f"Item {i}", "1", "0"] for i in range(CHUNK_ROWS * 3)]
+    cache.save("ns", "list", rows)
+
+    # 1回目のチェックの記録だけ失敗させる（最新の版はチェック前のまま残る）
+    write = cache.snapshots._write
+    calls = []
+
+    def failing_write(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        write(*args)
+
+    monkeypatch.setattr(cache.snapshots, "_write", failing_write)
+    cache.update_check("ns", "list", "Item 0", True)
+    cache.update_check("ns", "list", f"Item {CHUNK_ROWS}", True)
+
+    head = cache.snapshots.head("ns", "list")
+    _, recorded = cache.snapshots.load("ns", "list", head.id)
+    assert recorded == _rows(cache, "list")